@@ -0,0 +1,218 @@
+import argparse
+import logging
+import os
+import time
+from collections import namedtuple
+
+import pandas as pd
+from sqlalchemy import text
+
+import banco
+from tarefas import em_thread
+
+# Agregados do painel de gestão (migração 008).
+#
+# Cada agregado é atualizado de forma incremental em duas partes, dentro de
+# uma única transação REPEATABLE READ (um só retrato do banco):
+#
+#   1. as linhas de origem com id acima da marca d'água e data anterior à
+#      janela recente são somadas ao agregado (inserções retroativas);
+#   2. os baldes da janela recente (JANELA_DIAS) são apagados e recalculados
+#      a partir da origem, pelo índice de data. É ali que caem as inserções
+#      do dia e as alterações e exclusões feitas pelas telas.
+#
+# Alterações em linhas mais antigas que a janela só aparecem depois de
+# `reconstruir()` (python agregados.py --reconstruir).
+
+JANELA_DIAS = int(os.getenv("PAINEL_JANELA_DIAS") or 2)
+# Intervalo da atualização agendada por servidor.py
+INTERVALO_ATUALIZACAO = os.getenv("PAINEL_INTERVALO") or "5m"
+
+logger = logging.getLogger(__name__)
+
+Agregado = namedtuple("Agregado", ["tabela", "chave", "balde", "origem", "origem_id", "origem_data", "select", "acumular"])
+
+AGREGADOS = {
+    "triagem_hora": Agregado(
+        tabela="painel_triagem_hora",
+        chave="hora, prioridade",
+        balde="hora",
+        origem="triagem",
+        origem_id="t.id_triagem",
+        origem_data="t.data",
+        select="""
+            SELECT date_trunc('hour', t.data), t.classificacao_de_prioridade, count(*)
+            FROM triagem t
+            WHERE {filtro}
+            GROUP BY 1, 2
+        """,
+        acumular="total = painel_triagem_hora.total + EXCLUDED.total",
+    ),
+    # A espera vai da entrada na fila (a última do paciente naquele dia antes
+    # do início da consulta) até o início da consulta
+    "espera_dia": Agregado(
+        tabela="painel_espera_dia",
+        chave="dia, prioridade",
+        balde="dia",
+        origem="consulta",
+        origem_id="c.id_consulta",
+        origem_data="c.data",
+        select="""
+            SELECT c.data, f.prioridade, count(*), sum(f.espera), max(f.espera)
+            FROM consulta c
+            CROSS JOIN LATERAL (
+                SELECT t.classificacao_de_prioridade AS prioridade,
+                       extract(epoch FROM (c.data + c.hora_inicio) - fi.hora_entrada) / 60 AS espera
+                FROM fila fi
+                JOIN triagem t ON t.id_triagem = fi.id_triagem
+                WHERE fi.id_paciente = c.id_paciente
+                  AND fi.hora_entrada >= c.data
+                  AND fi.hora_entrada <= c.data + c.hora_inicio
+                ORDER BY fi.hora_entrada DESC
+                LIMIT 1
+            ) f
+            WHERE {filtro}
+            GROUP BY 1, 2
+        """,
+        acumular="""
+            consultas = painel_espera_dia.consultas + EXCLUDED.consultas,
+            espera_total_min = painel_espera_dia.espera_total_min + EXCLUDED.espera_total_min,
+            espera_max_min = GREATEST(painel_espera_dia.espera_max_min, EXCLUDED.espera_max_min)
+        """,
+    ),
+    "consultas_medico_dia": Agregado(
+        tabela="painel_consultas_medico_dia",
+        chave="dia, id_medico",
+        balde="dia",
+        origem="consulta",
+        origem_id="c.id_consulta",
+        origem_data="c.data",
+        select="""
+            SELECT c.data, c.id_medico, count(*)
+            FROM consulta c
+            WHERE {filtro}
+            GROUP BY 1, 2
+        """,
+        acumular="total = painel_consultas_medico_dia.total + EXCLUDED.total",
+    ),
+}
+
+def _atualizar_um(cursor, nome, agregado, corte):
+    """Aplica as duas etapas a um agregado; retorna a nova marca d'água."""
+    cursor.execute("SELECT ultimo_id FROM painel_marca WHERE agregado = %s", (nome,))
+    marca = cursor.fetchone()[0]
+    id_coluna = agregado.origem_id.split(".")[1]
+    cursor.execute(f"SELECT COALESCE(max({id_coluna}), 0) FROM {agregado.origem}")
+    maximo = cursor.fetchone()[0]
+
+    if maximo > marca:
+        filtro = (f"{agregado.origem_id} > %(marca)s AND {agregado.origem_id} <= %(maximo)s "
+                  f"AND {agregado.origem_data} < %(corte)s")
+        cursor.execute(f"""
+            INSERT INTO {agregado.tabela} {agregado.select.format(filtro=filtro)}
+            ON CONFLICT ({agregado.chave}) DO UPDATE SET {agregado.acumular}
+        """, {"marca": marca, "maximo": maximo, "corte": corte})
+
+    cursor.execute(f"DELETE FROM {agregado.tabela} WHERE {agregado.balde} >= %(corte)s", {"corte": corte})
+    filtro = f"{agregado.origem_data} >= %(corte)s AND {agregado.origem_id} <= %(maximo)s"
+    cursor.execute(f"INSERT INTO {agregado.tabela} {agregado.select.format(filtro=filtro)}",
+                   {"corte": corte, "maximo": maximo})
+
+    cursor.execute("""
+        UPDATE painel_marca SET ultimo_id = %s, atualizado_em = CURRENT_TIMESTAMP WHERE agregado = %s
+    """, (maximo, nome))
+    return maximo
+
+def atualizar(janela_dias=JANELA_DIAS):
+    """Atualiza todos os agregados. Retorna {agregado: segundos}, ou None se
+    outro processo já está atualizando."""
+    tempos = {}
+    with banco.conexao_psycopg() as con, con.cursor() as cursor:
+        cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        cursor.execute("SELECT pg_try_advisory_xact_lock(hashtext('agregados.atualizar'))")
+        if not cursor.fetchone()[0]:
+            con.rollback()
+            return None
+        cursor.execute("SELECT CURRENT_DATE - %s", (janela_dias,))
+        corte = cursor.fetchone()[0]
+        for nome, agregado in AGREGADOS.items():
+            inicio = time.perf_counter()
+            _atualizar_um(cursor, nome, agregado, corte)
+            tempos[nome] = time.perf_counter() - inicio
+        con.commit()
+    return tempos
+
+def reconstruir():
+    """Apaga os agregados e zera as marcas; a próxima atualização refaz tudo."""
+    with banco.conexao_psycopg() as con, con.cursor() as cursor:
+        cursor.execute(f"TRUNCATE {', '.join(a.tabela for a in AGREGADOS.values())}")
+        cursor.execute("UPDATE painel_marca SET ultimo_id = 0, atualizado_em = NULL")
+        con.commit()
+    return atualizar()
+
+async def tarefa_atualizar():
+    """Tarefa agendada por servidor.py (pn.state.schedule_task)."""
+    try:
+        tempos = await em_thread(atualizar)
+        if tempos is not None:
+            logger.info("Agregados do painel atualizados em %.2fs", sum(tempos.values()))
+    except Exception:
+        logger.exception("Falha ao atualizar os agregados do painel")
+
+
+# --- Leitura (só dos agregados) ---
+
+def _ler(query, params):
+    with banco.conexao() as conn:
+        return pd.read_sql(text(query), conn, params=params)
+
+def ultima_atualizacao():
+    """Horário da última atualização e o último dia com triagens agregadas."""
+    with banco.conexao() as conn:
+        atualizado_em = conn.execute(text("SELECT min(atualizado_em) FROM painel_marca")).scalar()
+        ultima_hora = conn.execute(text("SELECT max(hora) FROM painel_triagem_hora")).scalar()
+    return atualizado_em, ultima_hora
+
+def triagens_por_hora(inicio, fim):
+    """DataFrame hora x prioridade com o total de triagens em [inicio, fim)."""
+    return _ler("""
+        SELECT hora, prioridade, total FROM painel_triagem_hora
+        WHERE hora >= :inicio AND hora < :fim ORDER BY hora
+    """, {"inicio": inicio, "fim": fim})
+
+def espera_por_dia(inicio, fim):
+    """Espera média e máxima (minutos) por dia e prioridade em [inicio, fim)."""
+    return _ler("""
+        SELECT dia, prioridade, consultas,
+               espera_total_min / NULLIF(consultas, 0) AS espera_media_min, espera_max_min
+        FROM painel_espera_dia
+        WHERE dia >= :inicio AND dia < :fim ORDER BY dia
+    """, {"inicio": inicio, "fim": fim})
+
+def consultas_por_medico(inicio, fim, limite=15):
+    """Médicos com mais consultas em [inicio, fim), com o total e a média por dia trabalhado."""
+    return _ler("""
+        SELECT a.id_medico, prof.nome, sum(a.total) AS consultas,
+               sum(a.total)::float / count(*) AS media_por_dia
+        FROM painel_consultas_medico_dia a
+        JOIN profissional prof ON prof.id_profissional = a.id_medico
+        WHERE a.dia >= :inicio AND a.dia < :fim
+        GROUP BY a.id_medico, prof.nome
+        ORDER BY consultas DESC, a.id_medico
+        LIMIT :limite
+    """, {"inicio": inicio, "fim": fim, "limite": limite})
+
+def main():
+    parser = argparse.ArgumentParser(description="Atualiza os agregados do painel de gestão.")
+    parser.add_argument("--reconstruir", action="store_true", help="refaz os agregados a partir do zero")
+    args = parser.parse_args()
+
+    tempos = reconstruir() if args.reconstruir else atualizar()
+    if tempos is None:
+        print("Outro processo já está atualizando os agregados.")
+        return
+    for nome, segundos in tempos.items():
+        print(f"{nome:<24} {segundos:8.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import sessionmaker
+
+import instrumentacao
+
+# Camada de acesso ao banco compartilhada pelos apps (triagem, pacientes,
+# consultas e estoque). O engine é criado uma única vez por processo, então
+# todas as sessões do servidor Panel usam o mesmo pool de conexões e cada
+# requisição pega (e devolve) a sua própria conexão.
+
+# Carrega as variáveis de ambiente do arquivo .env
+load_dotenv()
+
+DB_HOST = os.getenv("DB_HOST")
+DB_PORT = int(os.getenv("DB_PORT") or 5432)
+DB_NAME = os.getenv("DB_NAME")
+DB_USER = os.getenv("DB_USER")
+DB_PASS = os.getenv("DB_PASS")
+# Schema opcional (usado pelos benchmarks para não tocar nas tabelas reais)
+DB_SCHEMA = os.getenv("DB_SCHEMA")
+
+# Configuração do pool (todas opcionais no .env)
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE") or 5)
+POOL_MAX_OVERFLOW = int(os.getenv("DB_POOL_MAX_OVERFLOW") or 10)
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT") or 30)
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE") or 1800)
+
+DATABASE_URL = URL.create(
+    "postgresql+psycopg2",
+    username=DB_USER, password=DB_PASS,
+    host=DB_HOST, port=DB_PORT, database=DB_NAME,
+)
+
+CONNECT_ARGS = {"options": f"-csearch_path={DB_SCHEMA},public"} if DB_SCHEMA else {}
+
+engine = create_engine(
+    DATABASE_URL,
+    pool_size=POOL_SIZE,
+    max_overflow=POOL_MAX_OVERFLOW,
+    pool_timeout=POOL_TIMEOUT,
+    pool_recycle=POOL_RECYCLE,
+    pool_pre_ping=True,  # testa a conexão a cada checkout e reconecta se caiu
+    connect_args=CONNECT_ARGS,
+)
+Session = sessionmaker(bind=engine)
+instrumentacao.instalar(engine)
+
+# Um processo filho (servidor.py --processos N) não pode usar as conexões
+# abertas pelo pai: descarta o pool herdado sem fechar os sockets do pai.
+os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+
+
+# --- Métricas do pool ---
+
+_lock_metricas = threading.Lock()
+_metricas = {
+    "checkouts": 0,
+    "checkins": 0,
+    "conexoes_criadas": 0,
+    "conexoes_invalidadas": 0,
+    "timeouts": 0,
+    "espera_total_s": 0.0,
+    "espera_max_s": 0.0,
+    "overflow_max": 0,
+}
+
+def _somar(nome, valor=1):
+    with _lock_metricas:
+        _metricas[nome] += valor
+
+@event.listens_for(engine, "connect")
+def _on_connect(dbapi_connection, connection_record):
+    _somar("conexoes_criadas")
+
+@event.listens_for(engine, "checkout")
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    # overflow() é negativo enquanto o pool ainda não abriu todas as conexões
+    overflow = max(engine.pool.overflow(), 0)
+    with _lock_metricas:
+        _metricas["checkouts"] += 1
+        _metricas["overflow_max"] = max(_metricas["overflow_max"], overflow)
+
+@event.listens_for(engine, "checkin")
+def _on_checkin(dbapi_connection, connection_record):
+    _somar("checkins")
+
+@event.listens_for(engine, "invalidate")
+def _on_invalidate(dbapi_connection, connection_record, exception):
+    _somar("conexoes_invalidadas")
+
+def _obter(funcao):
+    """Pega uma conexão do pool medindo quanto tempo a requisição esperou."""
+    inicio = time.perf_counter()
+    try:
+        return funcao()
+    except PoolTimeoutError:
+        _somar("timeouts")
+        raise
+    finally:
+        espera = time.perf_counter() - inicio
+        with _lock_metricas:
+            _metricas["espera_total_s"] += espera
+            _metricas["espera_max_s"] = max(_metricas["espera_max_s"], espera)
+
+def metricas_pool():
+    """Retorna um retrato das métricas do pool (contadores e ocupação atual)."""
+    pool = engine.pool
+    with _lock_metricas:
+        dados = dict(_metricas)
+    checkouts = dados["checkouts"] or 1
+    dados.update({
+        "tamanho": pool.size(),
+        "em_uso": pool.checkedout(),
+        "ociosas": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "espera_media_ms": dados["espera_total_s"] / checkouts * 1000,
+        "espera_max_ms": dados["espera_max_s"] * 1000,
+    })
+    return dados
+
+
+# --- Conexões por requisição ---
+
+@contextmanager
+def conexao():
+    """Conexão SQLAlchemy dentro de uma transação (commit ao sair, rollback em erro)."""
+    conn = _obter(engine.connect)
+    try:
+        with conn.begin():
+            yield conn
+    finally:
+        conn.close()
+
+@contextmanager
+def sessao():
+    """Sessão ORM própria da requisição; o commit fica a cargo de quem chama."""
+    conn = _obter(engine.connect)
+    session = Session(bind=conn)
+    try:
+        yield session
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+        conn.close()
+
+@contextmanager
+def conexao_psycopg():
+    """Conexão psycopg2 do pool para código que usa cursores diretamente.
+
+    O commit fica a cargo de quem chama; ao sair a conexão volta para o pool
+    (que desfaz qualquer transação pendente). Os cursores abertos nela são
+    medidos pela instrumentação.
+    """
+    con = _obter(engine.raw_connection)
+    con.dbapi_connection.cursor_factory = instrumentacao.CursorInstrumentado
+    try:
+        yield con
+    except Exception:
+        con.rollback()
+        raise
+    finally:
+        if con.dbapi_connection is not None:
+            con.dbapi_connection.cursor_factory = None
+        con.close()
+
+def conexao_dedicada():
+    """Abre uma conexão psycopg2 fora do pool, para usos de longa duração (ex.: LISTEN).
+
+    Quem chama é responsável por fechá-la.
+    """
+    cargs, cparams = engine.dialect.create_connect_args(engine.url)
+    cparams.update(CONNECT_ARGS)
+    return engine.dialect.loaded_dbapi.connect(*cargs, **cparams)
+
+
+# --- Concorrência otimista ---
+
+class ConflitoDeVersao(Exception):
+    """O UPDATE ... WHERE versao = <lida> não encontrou a linha: outra mesa a alterou ou removeu.
+
+    `versao_atual` é a versão no banco, ou None se a linha não existe mais;
+    `linha` é a linha atual, quando quem detectou o conflito já a leu.
+    """
+
+    def __init__(self, descricao, versao_atual, linha=None):
+        self.versao_atual = versao_atual
+        self.linha = linha
+        if versao_atual is None:
+            mensagem = f"Outra mesa removeu {descricao}."
+        else:
+            mensagem = f"Outra mesa alterou {descricao} enquanto você editava (versão atual: {versao_atual})."
+        super().__init__(mensagem)
@@ -0,0 +1,644 @@
+import argparse
+import asyncio
+import datetime
+import importlib
+import inspect
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Benchmark das consultas e callbacks de CRUD dos quatro apps.
+#
+# Para cada escala pedida, gera os dados com gerador_dados.py num schema
+# separado (DB_SCHEMA) e mede cada operação várias vezes. O resultado vai para
+# um relatório JSON que pode ser comparado com um relatório anterior:
+#
+#   python benchmark.py --tamanhos 1000 10000 100000 --saida atual.json
+#   python benchmark.py --tamanhos 1000 10000 --comparar base.json
+#
+# A comparação falha (código de saída 1) se alguma mediana piorar mais que a
+# tolerância.
+
+SCHEMA = "benchmark"
+
+# Os apps usam banco.py, que lê DB_SCHEMA ao ser importado
+os.environ["DB_SCHEMA"] = SCHEMA
+
+import pandas as pd  # noqa: E402
+import panel as pn  # noqa: E402
+
+import banco  # noqa: E402
+import cache  # noqa: E402
+import filtros  # noqa: E402
+import gerador_dados  # noqa: E402
+import instrumentacao  # noqa: E402
+import tarefas  # noqa: E402
+
+class Cronometro:
+    """Acumula amostras de tempo (e erros) por operação."""
+
+    def __init__(self):
+        self.amostras = {}
+        self.erros = {}
+        self.anotacoes = {}
+
+    @contextmanager
+    def medir(self, nome):
+        inicio = time.perf_counter()
+        yield
+        self.amostras.setdefault(nome, []).append(time.perf_counter() - inicio)
+
+    def erro(self, nome):
+        self.erros[nome] = self.erros.get(nome, 0) + 1
+
+    def anotar(self, nome, **valores):
+        """Medidas que não são tempo (ex.: memória), guardadas à parte no relatório."""
+        self.anotacoes.setdefault(nome, {}).update(valores)
+
+    def resumo(self):
+        resultado = {}
+        for nome, amostras in self.amostras.items():
+            ordenadas = sorted(amostras)
+            resultado[nome] = {
+                "mediana_ms": statistics.median(ordenadas) * 1000,
+                "p95_ms": ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * 0.95))] * 1000,
+                "min_ms": ordenadas[0] * 1000,
+                "max_ms": ordenadas[-1] * 1000,
+                "amostras": len(ordenadas),
+                "erros": self.erros.get(nome, 0),
+            }
+        return resultado
+
+def ultima_notificacao():
+    notificacoes = pn.state.notifications
+    if notificacoes is None or not notificacoes.notifications:
+        return None
+    return notificacoes.notifications[-1]
+
+@contextmanager
+def medir_callback(cron, nome):
+    """Mede um callback que avisa erros por pn.state.notifications."""
+    antes = ultima_notificacao()
+    with cron.medir(nome):
+        yield
+    depois = ultima_notificacao()
+    if depois is not None and depois is not antes and depois.notification_type == "error":
+        cron.erro(nome)
+
+def executar(resultado):
+    """Os callbacks das telas são async: roda até o fim, fora de um servidor."""
+    if inspect.isawaitable(resultado):
+        return asyncio.run(resultado)
+    return resultado
+
+def importar(app, cron):
+    """Importa o app medindo à parte a montagem do módulo e a carga inicial.
+
+    Sem um documento Bokeh o Panel roda os pn.state.onload já no import; com
+    um documento ainda não carregado eles ficam pendentes, como na primeira
+    sessão do servidor, e são executados depois em "<app> (onload)".
+    """
+    from bokeh.document import Document
+    from panel.io.state import set_curdoc
+
+    documento = Document()
+    pn.state._loaded[documento] = False
+    with set_curdoc(documento):
+        with cron.medir(f"{app} (import)"):
+            modulo = importlib.import_module(app)
+        with cron.medir(f"{app} (onload)"):
+            for callback, _ in pn.state._onload.pop(documento, []):
+                executar(callback())
+    pn.state._loaded.pop(documento, None)
+    return modulo
+
+def consultar_um(sql):
+    with banco.conexao_psycopg() as con, con.cursor() as cursor:
+        cursor.execute(sql)
+        linha = cursor.fetchone()
+    return linha[0] if linha else None
+
+# --- Cenários por app ---
+
+SESSOES_CONCORRENTES = 8
+
+async def paginas_concorrentes(triagem, sessoes):
+    """Várias mesas pedindo a primeira página ao mesmo tempo, pelo executor das telas."""
+    await asyncio.gather(*(tarefas.em_thread(triagem.buscar_pagina_triagem) for _ in range(sessoes)))
+
+def cenario_triagem(triagem, cron, repeticoes):
+    paciente = next(iter(triagem.opcoes_pacientes))
+    profissional = next(iter(triagem.opcoes_profissionais))
+    for r in range(repeticoes):
+        cache.invalidar()
+        with cron.medir("triagem.carregar_pacientes (cache frio)"):
+            triagem.carregar_pacientes()
+        with cron.medir("triagem.carregar_pacientes"):
+            triagem.carregar_pacientes()
+        with cron.medir("triagem.carregar_profissionais"):
+            triagem.carregar_profissionais()
+
+        # A janela recente padrão conta a partir da data base dos dados sintéticos, não de hoje
+        triagem.filtro_data_inicio.value = filtros.inicio_recente(gerador_dados.DATA_BASE)
+        triagem.filtro_prioridade_select.value = "Todas"
+        with medir_callback(cron, "triagem.consultar"):
+            executar(triagem.consultar())
+        with medir_callback(cron, "triagem.pagina_proxima"):
+            executar(triagem.pagina_proxima(None))
+        with cron.medir(f"triagem.buscar_pagina_triagem ({SESSOES_CONCORRENTES} sessões)"):
+            executar(paginas_concorrentes(triagem, SESSOES_CONCORRENTES))
+        triagem.filtro_prioridade_select.value = triagem.opcoes_prioridade[0]
+        with medir_callback(cron, "triagem.consultar (prioridade)"):
+            executar(triagem.consultar())
+        triagem.filtro_prioridade_select.value = "Todas"
+
+        triagem.paciente_select.value = paciente
+        triagem.profissional_select.value = profissional
+        triagem.prioridade_select.value = triagem.opcoes_prioridade[1]
+        triagem.descricao_input.value = f"Benchmark {r}"
+        with medir_callback(cron, "triagem.inserir"):
+            executar(triagem.inserir(None))
+        id_triagem = consultar_um("SELECT max(id_triagem) FROM triagem")
+
+        triagem.id_update_input.value = str(id_triagem)
+        triagem.nova_descricao_input.value = f"Benchmark {r} (atualizada)"
+        with medir_callback(cron, "triagem.atualizar"):
+            executar(triagem.atualizar(None))
+
+        triagem.id_remover_input.value = str(id_triagem)
+        with medir_callback(cron, "triagem.remover"):
+            executar(triagem.remover(None))
+
+def cenario_pacientes(pacientes, cron, repeticoes):
+    for r in range(repeticoes):
+        # Os caminhos da tela: a busca pelo CPF e as escritas com RETURNING,
+        # que aplicam só a linha gravada na tabela
+        pacientes.cpf.value_input = "000.000.000-42"
+        with cron.medir("pacientes.on_consultar"):
+            executar(pacientes.on_consultar())
+
+        pacientes.nome.value_input = f"Paciente Benchmark {r}"
+        pacientes.cpf.value_input = f"BENCH-{r:06d}"
+        pacientes.rg.value_input = f"BENCH-{r:06d}"
+        pacientes.datanasc.value = datetime.date(1990, 1, 1)
+        pacientes.endereco_rua.value_input = "Rua do Benchmark"
+        pacientes.endereco_numero.value_input = "1"
+        pacientes.endereco_bairro.value_input = "Centro"
+        pacientes.endereco_cidade.value_input = "Quixadá"
+        for nome, funcao in [("pacientes.on_inserir", pacientes.on_inserir),
+                             ("pacientes.on_atualizar", pacientes.on_atualizar),
+                             ("pacientes.on_excluir", pacientes.on_excluir)]:
+            with cron.medir(nome):
+                resultado = executar(funcao())
+            if isinstance(resultado, pn.pane.Alert):
+                cron.erro(nome)
+
+def cenario_consultas(consultas, cron, repeticoes):
+    for r in range(repeticoes):
+        executar(consultas.limpar_filtros())
+        consultas.filtro_data_inicio.value = filtros.inicio_recente(gerador_dados.DATA_BASE)
+        with cron.medir("consultas.carregar_consultas"):
+            executar(consultas.carregar_consultas())
+        consultas.selecao_paciente_filtro.value = "42 - Paciente"
+        with cron.medir("consultas.carregar_consultas (paciente)"):
+            executar(consultas.carregar_consultas())
+        consultas.selecao_paciente_filtro.value = "Nenhum"
+        with cron.medir("consultas.carregar_dados_para_selecao"):
+            executar(consultas.carregar_dados_para_selecao())
+        with cron.medir("busca.buscar_pacientes (nome)"):
+            consultas.busca.buscar_pacientes("Marina Rocha")
+        with cron.medir("busca.buscar_pacientes (CPF)"):
+            consultas.busca.buscar_pacientes("000.000.12")
+        with cron.medir("busca.buscar_medicos"):
+            consultas.busca.buscar_medicos("Dr(a)")
+
+        consultas.selecao_paciente_novo.value = "1 - Paciente"
+        consultas.selecao_medico_novo.value = "1 - Médico"
+        consultas.input_data_novo.value = gerador_dados.DATA_BASE
+        consultas.input_hora_inicio_novo.value = datetime.time(9, 0)
+        consultas.input_hora_fim_novo.value = datetime.time(9, 20)
+        consultas.input_diagnostico_novo.value = f"Benchmark {r}"
+        consultas.tabela_prescricao_nova.value = pd.DataFrame(
+            [{"id_medicamento": 1, "nome_medicamento": "", "dosagem": "1 comprimido", "frequencia": "de 8 em 8 horas"}])
+        with medir_callback(cron, "consultas.inserir_consulta"):
+            executar(consultas.inserir_consulta(None))
+        id_consulta = consultar_um("SELECT max(id_consulta) FROM consulta")
+
+        consultas.input_id_consulta.value = str(id_consulta)
+        # O que a seleção na grade faria: o formulário guarda a versão lida
+        consultas.edicao.update(id=id_consulta, versao=consultar_um(
+            f"SELECT versao FROM consulta WHERE id_consulta = {id_consulta}"))
+        consultas.input_paciente_edit.options = ["1 - Paciente"]
+        consultas.input_paciente_edit.value = "1 - Paciente"
+        consultas.input_medico_edit.options = ["1 - Médico"]
+        consultas.input_medico_edit.value = "1 - Médico"
+        consultas.input_data_edit.value = gerador_dados.DATA_BASE
+        consultas.input_hora_inicio_edit.value = datetime.time(9, 0)
+        consultas.input_hora_fim_edit.value = datetime.time(9, 30)
+        consultas.input_diagnostico_edit.value = f"Benchmark {r} (atualizada)"
+        consultas.tabela_prescricao_edit.value = pd.DataFrame(
+            [{"id_medicamento": 2, "nome_medicamento": "", "dosagem": "2 comprimidos", "frequencia": "de 12 em 12 horas"}])
+        with medir_callback(cron, "consultas.salvar_alteracoes"):
+            executar(consultas.salvar_alteracoes(None))
+        with medir_callback(cron, "consultas.deletar_consulta"):
+            executar(consultas.deletar_consulta(None))
+
+def cenario_gestaoestoque(gestaoestoque, cron, repeticoes):
+    for r in range(repeticoes):
+        with cron.medir("gestaoestoque.atualizar_tabela"):
+            executar(gestaoestoque.atualizar_tabela())
+        gestaoestoque.busca_nome.value = "Dipirona"
+        with cron.medir("gestaoestoque.buscar_item"):
+            executar(gestaoestoque.buscar_item(None))
+
+        nome_item = f"Item Benchmark {r}"
+        gestaoestoque.nome.value = nome_item
+        gestaoestoque.data_fabricacao.value = datetime.date(2025, 1, 1)
+        gestaoestoque.data_validade.value = datetime.date(2027, 1, 1)
+        gestaoestoque.lote.value = f"BENCH{r}"
+        gestaoestoque.fabricante.value = "Benchmark"
+        gestaoestoque.remover_nome.value = nome_item
+        for nome, funcao in [("gestaoestoque.inserir_item", gestaoestoque.inserir_item),
+                             ("gestaoestoque.remover_item", gestaoestoque.remover_item)]:
+            with cron.medir(nome):
+                executar(funcao(None))
+            if gestaoestoque.status.object.startswith("❌"):
+                cron.erro(nome)
+
+DISPENSACOES_CONCORRENTES = 16
+
+def prescricao_qualquer():
+    """Uma prescrição gerada e o nome do produto do seu medicamento."""
+    with banco.conexao_psycopg() as con, con.cursor() as cursor:
+        cursor.execute("""
+            SELECT p.id_consulta, p.id_medicamento, i.nome
+            FROM prescricao p
+            JOIN medicamento m ON m.id_medicamento = p.id_medicamento
+            JOIN item_estoque i ON i.id_itemestoque = m.id_itemestoque
+            ORDER BY p.id_consulta LIMIT 1
+        """)
+        return cursor.fetchone()
+
+async def dispensacoes_concorrentes(estoque, id_consulta, id_medicamento, vezes):
+    """Várias dispensações de uma unidade disputando os mesmos lotes."""
+    resultados = await asyncio.gather(
+        *(tarefas.em_thread(estoque.dispensar, id_consulta, id_medicamento, 1) for _ in range(vezes)),
+        return_exceptions=True,
+    )
+    return sum(1 for r in resultados if not isinstance(r, Exception))
+
+def cenario_estoque(estoque, cron, repeticoes):
+    id_consulta, id_medicamento, produto = prescricao_qualquer()
+    for r in range(repeticoes):
+        # Um lote novo, vencendo hoje, com metade do que será pedido: por FEFO
+        # ele sai primeiro e tem de zerar; o excedente vem dos outros lotes do
+        # produto ou falha, sem nunca deixar saldo negativo
+        with cron.medir("estoque.cadastrar_lote"):
+            id_item = estoque.cadastrar_lote(
+                produto, datetime.date(2025, 1, 1), datetime.date.today(), f"BENCH-FEFO{r}", "Benchmark",
+                DISPENSACOES_CONCORRENTES // 2,
+            )
+        with cron.medir("estoque.saldo"):
+            estoque.saldo(id_item)
+        with cron.medir("estoque.saldo_produto"):
+            antes = estoque.saldo_produto(produto)["valido"]
+        nome = f"estoque.dispensar ({DISPENSACOES_CONCORRENTES} concorrentes)"
+        with cron.medir(nome):
+            atendidas = executar(dispensacoes_concorrentes(
+                estoque, id_consulta, id_medicamento, DISPENSACOES_CONCORRENTES))
+        depois = estoque.saldo_produto(produto)["valido"]
+        # O lote que vence hoje sai primeiro (FEFO) e nada é vendido duas vezes
+        if antes - depois != atendidas or estoque.saldo(id_item) != max(DISPENSACOES_CONCORRENTES // 2 - atendidas, 0):
+            cron.erro(nome)
+        with cron.medir("estoque.dispensar"):
+            try:
+                estoque.dispensar(id_consulta, id_medicamento, 1)
+            except estoque.EstoqueInsuficiente:
+                cron.erro("estoque.dispensar")
+
+        with cron.medir("estoque.resumo_validade"):
+            estoque.resumo_validade()
+        with cron.medir("estoque.itens_a_vencer (30 dias)"):
+            estoque.itens_a_vencer(30)
+
+def cenario_agregados(agregados, cron, repeticoes):
+    # Os dados acabaram de ser gerados: a primeira rodada é a carga completa
+    with cron.medir("agregados.reconstruir"):
+        agregados.reconstruir()
+    fim = gerador_dados.DATA_BASE + datetime.timedelta(days=1)
+    inicio = fim - datetime.timedelta(days=7)
+    for r in range(repeticoes):
+        with cron.medir("agregados.atualizar (incremental)"):
+            if agregados.atualizar() is None:
+                cron.erro("agregados.atualizar (incremental)")
+        with cron.medir("agregados.triagens_por_hora (7 dias)"):
+            agregados.triagens_por_hora(inicio, fim)
+        with cron.medir("agregados.espera_por_dia (7 dias)"):
+            agregados.espera_por_dia(inicio, fim)
+        with cron.medir("agregados.consultas_por_medico (7 dias)"):
+            agregados.consultas_por_medico(inicio, fim)
+
+PAGINAS_LINHA_DO_TEMPO = 5
+
+def cenario_linha_do_tempo(linha_do_tempo, cron, repeticoes):
+    # O paciente com mais consultas: o histórico mais longo da massa de dados
+    id_paciente = consultar_um("SELECT id_paciente FROM consulta GROUP BY 1 ORDER BY count(*) DESC LIMIT 1")
+    nome = f"linha_do_tempo ({PAGINAS_LINHA_DO_TEMPO} páginas)"
+    for r in range(repeticoes):
+        with cron.medir("linha_do_tempo (primeira página)"):
+            linha_do_tempo.linha_do_tempo(id_paciente)
+        with cron.medir(nome):
+            paginas, cursor = [], None
+            for _ in range(PAGINAS_LINHA_DO_TEMPO):
+                df, cursor = linha_do_tempo.linha_do_tempo(id_paciente, apos=cursor)
+                paginas.append(df)
+                if cursor is None:
+                    break
+        # As páginas emendam sem repetir nem pular eventos e em ordem decrescente
+        eventos = pd.concat(paginas)
+        chaves = list(zip(eventos["momento"], eventos["ordem"], eventos["id_evento"], eventos["id_sub"]))
+        if len(set(chaves)) != len(chaves) or chaves != sorted(chaves, reverse=True):
+            cron.erro(nome)
+        with cron.medir("linha_do_tempo (só consultas e prescrições)"):
+            linha_do_tempo.linha_do_tempo(id_paciente, tipos={"consulta", "prescricao"})
+
+def cenario_cobertura(cobertura, cron, repeticoes):
+    id_vacina = consultar_um("SELECT min(id_vacina) FROM vacina WHERE tipo = 'Influenza'")
+    id_profissional = consultar_um("SELECT min(id_profissional) FROM profissional")
+    data_ref = gerador_dados.DATA_BASE
+    for r in range(repeticoes):
+        with cron.medir("cobertura.carregar"):
+            cobertura.indice.carregar()
+        with cron.medir("cobertura.cobertura (tipo x faixa x bairro)"):
+            cobertura.cobertura(data_ref=data_ref)
+        nome = "cobertura.sem_vacina (Influenza, Centro, 60+)"
+        with cron.medir(nome):
+            faltam = cobertura.sem_vacina("Influenza", bairro="Centro", idade_min=60, data_ref=data_ref)
+        if len(faltam) == 0:
+            continue
+        # A dose registrada tira o paciente da lista sem remontar o índice
+        with cron.medir("cobertura.registrar_dose"):
+            cobertura.registrar_dose(int(faltam[0]), id_vacina, id_profissional, data_ref)
+        depois = cobertura.sem_vacina("Influenza", bairro="Centro", idade_min=60, data_ref=data_ref)
+        if len(depois) != len(faltam) - 1 or faltam[0] in depois:
+            cron.erro("cobertura.registrar_dose")
+
+LINHAS_GRADE = 1_000_000
+
+# A junção de carregar_consultas, sem filtro, limitada a LINHAS_GRADE linhas
+SQL_GRADE = """
+    SELECT c.id_consulta, p.id_paciente, p.nome AS paciente_nome, m.id_profissional AS id_medico,
+           prof.nome AS medico_nome, c.data, c.hora_inicio, c.hora_fim, c.diagnostico
+    FROM consulta c
+    JOIN paciente p ON c.id_paciente = p.id_paciente
+    JOIN medico m ON c.id_medico = m.id_profissional
+    JOIN profissional prof ON m.id_profissional = prof.id_profissional
+    ORDER BY c.data DESC, c.hora_inicio DESC
+    LIMIT :limite
+"""
+
+def ler_grade(grade, transporte):
+    with banco.conexao() as conn:
+        return grade.ler(conn, SQL_GRADE, {"limite": LINHAS_GRADE}, transporte=transporte)
+
+def memoria_grade(grade, transporte):
+    """Pico de memória (MB) de uma leitura e o tamanho do DataFrame resultante.
+
+    O pico soma o que o tracemalloc vê (objetos Python e arrays numpy) ao
+    crescimento do pool de memória do pyarrow, quando há.
+    """
+    arrow_antes = 0
+    if grade.arrow_disponivel():
+        import pyarrow
+        arrow_antes = pyarrow.default_memory_pool().max_memory()
+    tracemalloc.start()
+    try:
+        df = ler_grade(grade, transporte)
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    if grade.arrow_disponivel():
+        pico += max(pyarrow.default_memory_pool().max_memory() - arrow_antes, 0)
+    return {"linhas": len(df), "pico_mb": round(pico / 2**20, 1),
+            "dataframe_mb": round(df.memory_usage(deep=True).sum() / 2**20, 1)}
+
+def cenario_grade(grade, cron, repeticoes):
+    transportes = ["linhas", "arrow"] if grade.arrow_disponivel() else ["linhas"]
+    if len(transportes) == 1:
+        print("    pyarrow não instalado: só o transporte por linhas é medido")
+    for transporte in transportes:
+        nome = f"grade.ler ({transporte}, junção de consultas)"
+        for r in range(repeticoes):
+            with cron.medir(nome):
+                ler_grade(grade, transporte)
+        # Medida à parte: o tracemalloc deixaria o caminho por linhas mais lento
+        cron.anotar(nome, **memoria_grade(grade, transporte))
+
+def exportar(exportacao, formato, query):
+    """Consome uma exportação inteira como o endpoint faria; devolve linhas e bytes gerados."""
+    contagem = {"linhas": 0, "bytes": 0}
+    def contar(lotes):
+        for lote in lotes:
+            contagem["linhas"] += len(lote[1])
+            yield lote
+    for parte in exportacao.ESCRITORES[formato](contar(exportacao.lotes(query))):
+        contagem["bytes"] += len(parte)
+    return contagem
+
+def cenario_exportacao(exportacao, cron, repeticoes):
+    formatos = ["csv", "parquet"] if exportacao.grade.arrow_disponivel() else ["csv"]
+    for formato in formatos:
+        nome = f"exportacao ({formato}, todas as consultas)"
+        for r in range(repeticoes):
+            with cron.medir(nome):
+                exportar(exportacao, formato, filtros.consultas())
+        # O pico deve ficar na ordem de um lote, qualquer que seja o total de linhas
+        tracemalloc.start()
+        try:
+            contagem = exportar(exportacao, formato, filtros.consultas())
+            _, pico = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        cron.anotar(nome, linhas=contagem["linhas"], arquivo_mb=round(contagem["bytes"] / 2**20, 1),
+                    pico_mb=round(pico / 2**20, 1), lote=exportacao.TAMANHO_LOTE)
+
+LINHAS_IMPORTACAO = 10_000
+
+def arquivo_importacao(linhas):
+    """CSV sintético com CPFs/RGs fora da faixa usada pelo gerador_dados."""
+    i = pd.RangeIndex(linhas)
+    cpf = (90_000_000_000 + i).astype(str)
+    df = pd.DataFrame({
+        "nome": "Importado " + i.astype(str),
+        "cpf": cpf.str[:3] + "." + cpf.str[3:6] + "." + cpf.str[6:9] + "-" + cpf.str[9:],
+        "rg": "IMP" + i.astype(str).str.zfill(8),
+        "data_nascimento": "1985-06-15",
+        "endereco_rua": "Rua da Importação",
+        "endereco_numero": (i % 500).astype(str),
+        "endereco_bairro": "Centro",
+        "endereco_cidade": "Quixadá",
+        "genero": "Não Informado",
+        "telefones": "(88) 9" + i.astype(str).str.zfill(8),
+        "alergias": "",
+    })
+    return df.to_csv(index=False).encode()
+
+def cenario_importacao(importacao, cron, repeticoes):
+    conteudo = arquivo_importacao(LINHAS_IMPORTACAO)
+    for r in range(repeticoes):
+        # A primeira rodada insere; as seguintes atualizam os mesmos CPFs
+        nome = f"importacao.importar ({LINHAS_IMPORTACAO} linhas)"
+        with cron.medir(nome):
+            resultado = importacao.importar(conteudo, nome_arquivo="pacientes.csv")
+        if len(resultado["rejeitados"]):
+            cron.erro(nome)
+        print(f"    {importacao.resumo(resultado)}")
+
+CENARIOS = {
+    "triagem": cenario_triagem,
+    "pacientes": cenario_pacientes,
+    "consultas": cenario_consultas,
+    "gestaoestoque": cenario_gestaoestoque,
+    "estoque": cenario_estoque,
+    "agregados": cenario_agregados,
+    "linha_do_tempo": cenario_linha_do_tempo,
+    "cobertura": cenario_cobertura,
+    "grade": cenario_grade,
+    "exportacao": cenario_exportacao,
+    "importacao": cenario_importacao,
+}
+
+# --- Inicialização ---
+
+# Monta a tela num processo novo com um documento Bokeh ativo, como na
+# primeira sessão do servidor: os pn.state.onload ficam pendentes e o tempo
+# medido é o que a página leva para poder ser entregue.
+SCRIPT_INICIALIZACAO = """
+import sys, time
+import panel as pn
+from bokeh.document import Document
+from panel.io.state import set_curdoc
+import banco
+documento = Document()
+pn.state._loaded[documento] = False  # sessão ainda não carregada no navegador
+inicio = time.perf_counter()
+with set_curdoc(documento):
+    __import__(sys.argv[1])
+print(time.perf_counter() - inicio)
+"""
+
+TELAS = ("triagem", "pacientes", "consultas", "gestaoestoque", "painel_gestao", "historico")
+
+def medir_inicializacao(cron, telas, repeticoes):
+    ambiente = dict(os.environ, METRICAS_PORTA="0")
+    pasta = os.path.dirname(os.path.abspath(__file__))
+    for tela in telas:
+        nome = f"{tela} (inicialização)"
+        for _ in range(repeticoes):
+            processo = subprocess.run([sys.executable, "-c", SCRIPT_INICIALIZACAO, tela], cwd=pasta,
+                                      env=ambiente, capture_output=True, text=True)
+            if processo.returncode != 0:
+                cron.erro(nome)
+                print(processo.stderr.strip().splitlines()[-1] if processo.stderr.strip() else f"{tela}: falhou")
+                break
+            cron.amostras.setdefault(nome, []).append(float(processo.stdout.strip().splitlines()[-1]))
+
+# --- Relatório ---
+
+def commit_atual():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def comparar(atual, base, tolerancia):
+    """Lista as operações cuja mediana piorou mais que `tolerancia` (fração)."""
+    regressoes = []
+    for tamanho, operacoes in atual["tamanhos"].items():
+        operacoes_base = base["tamanhos"].get(tamanho, {})
+        for nome, medidas in operacoes.items():
+            if nome not in operacoes_base:
+                continue
+            antes = operacoes_base[nome]["mediana_ms"]
+            depois = medidas["mediana_ms"]
+            if antes > 0 and depois > antes * (1 + tolerancia):
+                regressoes.append((tamanho, nome, antes, depois))
+    return regressoes
+
+def main():
+    parser = argparse.ArgumentParser(description="Mede consultas e callbacks dos apps em várias escalas.")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="escalas do gerador_dados (número de pacientes)")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--apps", nargs="+", choices=list(CENARIOS), default=list(CENARIOS))
+    parser.add_argument("--sem-inicializacao", action="store_true",
+                        help="não mede a montagem de cada tela num processo novo")
+    parser.add_argument("--saida", default="benchmark.json")
+    parser.add_argument("--comparar", help="relatório anterior para detectar regressões")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="piora relativa aceita na mediana (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    relatorio = {
+        "gerado_em": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit_atual(),
+        "python": platform.python_version(),
+        "repeticoes": args.repeticoes,
+        "tamanhos": {},
+        "cache": {}, "instrumentacao": {}, "memoria": {},
+    }
+
+    modulos = {}
+    for tamanho in args.tamanhos:
+        print(f"== {tamanho:,} pacientes ==")
+        with banco.conexao_psycopg() as con:
+            gerador_dados.preparar_schema(con, SCHEMA)
+            gerador_dados.gerar(con, SCHEMA, tamanho)
+            with con.cursor() as cursor:
+                cursor.execute("RESET search_path")
+            con.commit()
+        # Dados novos: nada do tamanho anterior pode vir do cache
+        cache.invalidar()
+        instrumentacao.zerar()
+
+        cron = Cronometro()
+        if not args.sem_inicializacao:
+            medir_inicializacao(cron, TELAS, args.repeticoes)
+        for app in args.apps:
+            if app not in modulos:
+                modulos[app] = importar(app, cron)
+            CENARIOS[app](modulos[app], cron, args.repeticoes)
+
+        resumo = cron.resumo()
+        relatorio["tamanhos"][str(tamanho)] = resumo
+        relatorio["cache"][str(tamanho)] = cache.estatisticas()
+        # Consultas que mais somaram tempo e de qual callback vieram
+        relatorio["instrumentacao"][str(tamanho)] = instrumentacao.retrato(limite=20)
+        relatorio["memoria"][str(tamanho)] = cron.anotacoes
+        for nome, medidas in resumo.items():
+            erros = f"  ({medidas['erros']} erro(s))" if medidas["erros"] else ""
+            print(f"  {nome:<45} mediana {medidas['mediana_ms']:9.2f} ms   p95 {medidas['p95_ms']:9.2f} ms{erros}")
+        for nome, valores in cron.anotacoes.items():
+            print(f"  {nome:<45} " + "   ".join(f"{chave} {valor}" for chave, valor in valores.items()))
+
+    with open(args.saida, "w", encoding="utf-8") as arquivo:
+        json.dump(relatorio, arquivo, indent=2, ensure_ascii=False)
+    print(f"Relatório salvo em {args.saida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as arquivo:
+            base = json.load(arquivo)
+        regressoes = comparar(relatorio, base, args.tolerancia)
+        for tamanho, nome, antes, depois in regressoes:
+            print(f"REGRESSÃO [{tamanho}] {nome}: {antes:.2f} ms -> {depois:.2f} ms")
+        if regressoes:
+            sys.exit(1)
+        print("Nenhuma regressão acima da tolerância.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import logging
+import os
+import re
+
+import pandas as pd
+import panel as pn
+import psycopg2.errors
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+import banco
+from tarefas import aguardar
+
+# Busca de pacientes e médicos para os campos de digitação das telas.
+#
+# Em vez de mandar o cadastro inteiro para o navegador, cada busca devolve só
+# os BUSCA_LIMITE melhores resultados:
+#   - texto com letras: trecho do nome (ILIKE) ordenado por semelhança, ambos
+#     atendidos pelo índice GiST de trigramas (migracoes/005_busca.sql);
+#   - só dígitos/pontuação: prefixo do CPF ou do RG, sem a máscara.
+# Cada consulta roda com statement_timeout, então uma busca ruim não segura a
+# tela; se estourar, a busca volta vazia.
+
+BUSCA_LIMITE = int(os.getenv("BUSCA_LIMITE") or 20)
+BUSCA_TIMEOUT_MS = int(os.getenv("BUSCA_TIMEOUT_MS") or 500)
+BUSCA_ESPERA_MS = 300       # pausa na digitação antes de buscar
+MINIMO_LETRAS = 3           # trigramas não ajudam com menos que isso
+MINIMO_DIGITOS = 3
+
+COLUNAS_PACIENTE = ["id_paciente", "nome", "cpf"]
+COLUNAS_MEDICO = ["id_profissional", "nome"]
+
+logger = logging.getLogger(__name__)
+
+def _padrao_like(termo):
+    # Escapa os curingas do LIKE digitados pelo usuário
+    return "%" + re.sub(r"([\\%_])", r"\\\1", termo) + "%"
+
+def _executar(query, params, colunas):
+    try:
+        with banco.conexao() as conn:
+            conn.execute(text(f"SET LOCAL statement_timeout = {BUSCA_TIMEOUT_MS}"))
+            return pd.read_sql_query(text(query), conn, params=params)
+    except OperationalError as e:
+        if isinstance(e.orig, psycopg2.errors.QueryCanceled):
+            logger.warning("Busca cancelada por tempo: %s", params)
+            return pd.DataFrame(columns=colunas)
+        raise
+
+def buscar_pacientes(termo, limite=BUSCA_LIMITE):
+    """Pacientes cujo nome contém o termo, ou cujo CPF/RG começa com os dígitos digitados."""
+    termo = (termo or "").strip()
+    digitos = re.sub(r"\D", "", termo)
+
+    if termo and not re.search(r"[^\d\s.\-/]", termo):
+        if len(digitos) < MINIMO_DIGITOS:
+            return pd.DataFrame(columns=COLUNAS_PACIENTE)
+        query = """
+            (SELECT id_paciente, nome, cpf FROM paciente
+             WHERE regexp_replace(cpf, '\\D', '', 'g') LIKE :prefixo
+             ORDER BY regexp_replace(cpf, '\\D', '', 'g') LIMIT :limite)
+            UNION
+            (SELECT id_paciente, nome, cpf FROM paciente
+             WHERE regexp_replace(rg, '\\D', '', 'g') LIKE :prefixo
+             ORDER BY regexp_replace(rg, '\\D', '', 'g') LIMIT :limite)
+            ORDER BY nome LIMIT :limite
+        """
+        return _executar(query, {"prefixo": digitos + "%", "limite": limite}, COLUNAS_PACIENTE)
+
+    if len(termo) < MINIMO_LETRAS:
+        return pd.DataFrame(columns=COLUNAS_PACIENTE)
+    query = """
+        SELECT id_paciente, nome, cpf FROM paciente
+        WHERE nome ILIKE :padrao
+        ORDER BY nome <-> :termo
+        LIMIT :limite
+    """
+    return _executar(query, {"padrao": _padrao_like(termo), "termo": termo, "limite": limite}, COLUNAS_PACIENTE)
+
+def buscar_medicos(termo, limite=BUSCA_LIMITE):
+    """Médicos cujo nome contém o termo; sem termo, os primeiros em ordem alfabética."""
+    termo = (termo or "").strip()
+    if not termo:
+        query = """
+            SELECT p.id_profissional, p.nome
+            FROM profissional p JOIN medico m ON m.id_profissional = p.id_profissional
+            ORDER BY p.nome LIMIT :limite
+        """
+        return _executar(query, {"limite": limite}, COLUNAS_MEDICO)
+    query = """
+        SELECT p.id_profissional, p.nome
+        FROM profissional p JOIN medico m ON m.id_profissional = p.id_profissional
+        WHERE p.nome ILIKE :padrao
+        ORDER BY p.nome <-> :termo
+        LIMIT :limite
+    """
+    return _executar(query, {"padrao": _padrao_like(termo), "termo": termo, "limite": limite}, COLUNAS_MEDICO)
+
+
+# --- Digitação ---
+
+def ao_digitar(widget, callback, espera_ms=BUSCA_ESPERA_MS, parametro="value_input"):
+    """Chama `callback(texto)` quando o usuário para de digitar por `espera_ms`.
+
+    Cada tecla cancela a busca agendada pela anterior, então uma palavra
+    digitada de uma vez gera uma única consulta.
+    """
+    pendente = [None]
+
+    async def buscar():
+        await aguardar(callback(getattr(widget, parametro)))
+
+    def on_digitar(event):
+        if pendente[0] is not None:
+            pendente[0].stop()
+        pendente[0] = pn.state.add_periodic_callback(buscar, period=espera_ms, count=1)
+
+    return widget.param.watch(on_digitar, parametro)
@@ -0,0 +1,172 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+import banco
+from ouvinte import ouvinte, RESSINCRONIZAR
+
+# Cache de dados de referência (pacientes e profissionais) por processo.
+#
+# Todas as sessões do servidor compartilham a mesma cópia. Cada entrada expira
+# após CACHE_TTL segundos e, passando de CACHE_MAXIMO entradas, sai a usada há
+# mais tempo. Gravações em pacientes.py invalidam o grupo na hora; alterações
+# feitas por outros processos chegam pelo canal referencia_alterada
+# (migracoes/004_notificar_referencia.sql).
+#
+# Os DataFrames devolvidos são compartilhados: quem precisar alterá-los deve
+# trabalhar numa cópia.
+
+CACHE_TTL = float(os.getenv("CACHE_TTL") or 300)
+CACHE_MAXIMO = int(os.getenv("CACHE_MAXIMO") or 32)
+
+class CacheTTL:
+    """Dicionário thread-safe com expiração por tempo e descarte LRU."""
+
+    def __init__(self, maximo=CACHE_MAXIMO, ttl=CACHE_TTL):
+        self.maximo = maximo
+        self.ttl = ttl
+        self._dados = OrderedDict()   # chave -> (expira_em, valor)
+        self._carregando = {}         # chave -> Lock, para uma única carga por chave
+        # Geração de cada grupo (e de "todos"), incrementada a cada invalidar():
+        # uma carga que começou antes da invalidação não grava o valor antigo
+        self._geracoes = {}
+        self._geracao_todos = 0
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+        self.descartes = 0
+
+    def _buscar(self, chave):
+        item = self._dados.get(chave)
+        if item is None:
+            return None
+        expira_em, valor = item
+        if expira_em < time.monotonic():
+            del self._dados[chave]
+            return None
+        self._dados.move_to_end(chave)
+        return item
+
+    def _geracao(self, chave):
+        return self._geracao_todos, self._geracoes.get(chave[0], 0)
+
+    def obter(self, chave, carregar):
+        """Valor da chave; na falta (ou expirado) chama `carregar()` e guarda o resultado."""
+        with self._lock:
+            item = self._buscar(chave)
+            if item is not None:
+                self.acertos += 1
+                return item[1]
+            self.falhas += 1
+            lock_chave = self._carregando.setdefault(chave, threading.Lock())
+
+        # Sessões pedindo a mesma chave ao mesmo tempo esperam uma única carga
+        with lock_chave:
+            with self._lock:
+                item = self._buscar(chave)
+                geracao = self._geracao(chave)
+            if item is not None:
+                return item[1]
+            valor = carregar()
+            with self._lock:
+                # Invalidado durante a carga: o valor pode ser anterior à alteração,
+                # então vai para quem pediu mas não fica guardado
+                if self._geracao(chave) == geracao:
+                    self._dados[chave] = (time.monotonic() + self.ttl, valor)
+                    self._dados.move_to_end(chave)
+                    while len(self._dados) > self.maximo:
+                        self._dados.popitem(last=False)
+                        self.descartes += 1
+                self._carregando.pop(chave, None)
+            return valor
+
+    def invalidar(self, grupo=None):
+        """Remove as entradas do grupo (primeiro elemento da chave), ou todas."""
+        with self._lock:
+            if grupo is None:
+                self._geracao_todos += 1
+                self._dados.clear()
+            else:
+                self._geracoes[grupo] = self._geracoes.get(grupo, 0) + 1
+                for chave in [chave for chave in self._dados if chave[0] == grupo]:
+                    del self._dados[chave]
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self.acertos + self.falhas
+            return {
+                "entradas": len(self._dados),
+                "acertos": self.acertos,
+                "falhas": self.falhas,
+                "descartes": self.descartes,
+                "taxa_acerto": self.acertos / consultas if consultas else 0.0,
+            }
+
+cache = CacheTTL()
+
+
+# --- Dados de referência ---
+
+# Grupo do cache afetado por alterações em cada tabela
+GRUPOS_POR_TABELA = {
+    "paciente": "pacientes",
+    "profissional": "profissionais",
+    "medico": "profissionais",
+}
+
+def _ler(query):
+    with banco.conexao() as conn:
+        return pd.read_sql(query, conn)
+
+def _mapa(df, coluna_id):
+    # nome -> id sem iterar linha a linha
+    return dict(zip(df["nome"], df[coluna_id]))
+
+def tabela_pacientes():
+    """DataFrame (id_paciente, nome) de todos os pacientes, ordenado por nome."""
+    _assinar()
+    return cache.obter(("pacientes", "tabela"),
+                       lambda: _ler("SELECT id_paciente, nome FROM paciente ORDER BY nome"))
+
+def tabela_profissionais():
+    _assinar()
+    return cache.obter(("profissionais", "tabela"),
+                       lambda: _ler("SELECT id_profissional, nome FROM profissional ORDER BY nome"))
+
+def pacientes():
+    """Dicionário nome -> id_paciente."""
+    return cache.obter(("pacientes", "mapa"), lambda: _mapa(tabela_pacientes(), "id_paciente"))
+
+def profissionais():
+    """Dicionário nome -> id_profissional."""
+    return cache.obter(("profissionais", "mapa"), lambda: _mapa(tabela_profissionais(), "id_profissional"))
+
+def invalidar(grupo=None):
+    cache.invalidar(grupo)
+
+def estatisticas():
+    return cache.estatisticas()
+
+
+# --- Invalidação por notificação ---
+
+_assinado = False
+_lock_assinatura = threading.Lock()
+
+def on_referencia_alterada(evento):
+    if evento.dados["operacao"] == RESSINCRONIZAR:
+        cache.invalidar()
+    else:
+        cache.invalidar(GRUPOS_POR_TABELA.get(evento.dados.get("tabela")))
+
+def _assinar():
+    global _assinado
+    if _assinado:
+        return
+    with _lock_assinatura:
+        if not _assinado:
+            ouvinte.assinar("referencia_alterada", on_referencia_alterada)
+            _assinado = True
@@ -0,0 +1,291 @@
+import argparse
+import datetime
+import logging
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+import banco
+from ouvinte import ouvinte, RESSINCRONIZAR
+
+# Cobertura vacinal por tipo de vacina, faixa etária e bairro.
+#
+# O índice fica em memória, um por processo. Os pacientes são arrays
+# alinhados e ordenados por id (id, nascimento, código do bairro), e cada
+# tipo de vacina é um bitmap com um bit por paciente (1 = recebeu ao menos
+# uma dose). Cada pergunta vira operações vetorizadas do numpy: o recorte
+# (bairro, idade) é uma máscara, a interseção com a vacina é um AND e as
+# contagens por grupo saem de um bincount. Um milhão de pacientes ocupam
+# ~125 KB por tipo de vacina.
+#
+# As doses gravadas por registrar_dose() entram no bitmap na hora. As
+# gravadas em outros processos chegam pelo canal vacinacao_alterada
+# (migração 010), e só os pacientes afetados são relidos. Alterações no
+# cadastro de pacientes (canal referencia_alterada) fazem o índice ser
+# remontado na próxima consulta.
+
+# Idade inicial de cada faixa etária; a última faixa não tem limite superior
+FAIXAS_ETARIAS = (0, 2, 5, 10, 20, 40, 60, 80)
+NOMES_FAIXAS = [f"{inicio}-{fim - 1}" for inicio, fim in zip(FAIXAS_ETARIAS, FAIXAS_ETARIAS[1:])] \
+    + [f"{FAIXAS_ETARIAS[-1]}+"]
+
+logger = logging.getLogger(__name__)
+
+def _anos_antes(data, anos):
+    """A mesma data `anos` anos antes (29/02 vira 28/02)."""
+    try:
+        return data.replace(year=data.year - anos)
+    except ValueError:
+        return data.replace(year=data.year - anos, day=28)
+
+def _data64(data):
+    return np.datetime64(data, "D")
+
+class IndiceCobertura:
+    """Pacientes e bitmaps de vacinação em memória (ver o comentário do módulo)."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._valido = False
+        self.ids = np.empty(0, dtype=np.int64)
+        self.nascimento = np.empty(0, dtype="datetime64[D]")
+        self.bairro = np.empty(0, dtype=np.int32)
+        self.bairros = []
+        self.bitmaps = {}       # tipo -> np.uint8, bit i = paciente self.ids[i]
+        self.carregado_em = None
+
+    # --- Montagem ---
+
+    def carregar(self):
+        """Lê pacientes e doses do banco e remonta o índice inteiro."""
+        with self._lock:
+            with banco.conexao() as conn:
+                pacientes = pd.read_sql(text("""
+                    SELECT id_paciente, data_nascimento, endereco_bairro FROM paciente ORDER BY id_paciente
+                """), conn)
+                doses = pd.read_sql(text("""
+                    SELECT DISTINCT rv.id_paciente, v.tipo
+                    FROM paciente_recebe_vacina rv
+                    JOIN vacina v ON v.id_vacina = rv.id_vacina
+                """), conn)
+                tipos = conn.execute(text("SELECT DISTINCT tipo FROM vacina")).scalars().all()
+
+            self.ids = pacientes["id_paciente"].to_numpy(dtype=np.int64)
+            self.nascimento = pd.to_datetime(pacientes["data_nascimento"]).to_numpy().astype("datetime64[D]")
+            codigos, nomes = pd.factorize(pacientes["endereco_bairro"], sort=True)
+            self.bairro = codigos.astype(np.int32)
+            self.bairros = list(nomes)
+
+            self.bitmaps = {tipo: self._bitmap_vazio() for tipo in tipos}
+            posicoes = np.searchsorted(self.ids, doses["id_paciente"].to_numpy(dtype=np.int64))
+            codigos_tipo, nomes_tipo = pd.factorize(doses["tipo"])
+            for codigo, tipo in enumerate(nomes_tipo):
+                marcados = np.zeros(len(self.ids), dtype=bool)
+                marcados[posicoes[codigos_tipo == codigo]] = True
+                self.bitmaps[tipo] = np.packbits(marcados, bitorder="little")
+            self._valido = True
+            self.carregado_em = datetime.datetime.now()
+
+    def invalidar(self):
+        """O índice será remontado na próxima consulta."""
+        self._valido = False
+
+    def _garantir(self):
+        if not self._valido:
+            self.carregar()
+
+    def _bitmap_vazio(self):
+        return np.zeros((len(self.ids) + 7) // 8, dtype=np.uint8)
+
+    # --- Atualização incremental ---
+
+    def atualizar_pacientes(self, ids_paciente):
+        """Relê as doses só destes pacientes e acerta os bits deles em todos os tipos."""
+        ids_paciente = np.unique(np.asarray(ids_paciente, dtype=np.int64))
+        with self._lock:
+            if not self._valido:
+                return
+            posicoes = np.searchsorted(self.ids, ids_paciente)
+            if (posicoes >= len(self.ids)).any() or (self.ids[np.minimum(posicoes, len(self.ids) - 1)] != ids_paciente).any():
+                # Paciente novo: o índice inteiro precisa ser remontado
+                self.invalidar()
+                return
+            with banco.conexao() as conn:
+                doses = pd.read_sql(text("""
+                    SELECT DISTINCT rv.id_paciente, v.tipo
+                    FROM paciente_recebe_vacina rv
+                    JOIN vacina v ON v.id_vacina = rv.id_vacina
+                    WHERE rv.id_paciente = ANY(:ids)
+                """), conn, params={"ids": ids_paciente.tolist()})
+            bytes_, bits = posicoes >> 3, (1 << (posicoes & 7)).astype(np.uint8)
+            for bitmap in self.bitmaps.values():
+                np.bitwise_and.at(bitmap, bytes_, ~bits)
+            for tipo, grupo in doses.groupby("tipo"):
+                bitmap = self.bitmaps.setdefault(tipo, self._bitmap_vazio())
+                marcados = np.searchsorted(self.ids, grupo["id_paciente"].to_numpy(dtype=np.int64))
+                np.bitwise_or.at(bitmap, marcados >> 3, (1 << (marcados & 7)).astype(np.uint8))
+
+    # --- Consultas ---
+
+    def _vacinados(self, tipo):
+        bitmap = self.bitmaps.get(tipo)
+        if bitmap is None:
+            raise KeyError(f"Tipo de vacina desconhecido: {tipo}")
+        return np.unpackbits(bitmap, count=len(self.ids), bitorder="little").view(bool)
+
+    def recorte(self, bairro=None, idade_min=None, idade_max=None, data_ref=None):
+        """Máscara dos pacientes do bairro com idade em [idade_min, idade_max] na data de referência."""
+        data_ref = data_ref or datetime.date.today()
+        mascara = np.ones(len(self.ids), dtype=bool)
+        if bairro is not None:
+            if bairro not in self.bairros:
+                return np.zeros(len(self.ids), dtype=bool)
+            mascara &= self.bairro == self.bairros.index(bairro)
+        if idade_min is not None:
+            mascara &= self.nascimento <= _data64(_anos_antes(data_ref, idade_min))
+        if idade_max is not None:
+            mascara &= self.nascimento > _data64(_anos_antes(data_ref, idade_max + 1))
+        return mascara
+
+    def faixas(self, data_ref=None):
+        """Índice em FAIXAS_ETARIAS da faixa de cada paciente na data de referência."""
+        data_ref = data_ref or datetime.date.today()
+        # Datas de corte crescentes: a da faixa mais velha primeiro
+        cortes = np.array([_data64(_anos_antes(data_ref, idade)) for idade in reversed(FAIXAS_ETARIAS)])
+        atingidas = len(cortes) - np.searchsorted(cortes, self.nascimento, side="left")
+        return np.maximum(atingidas - 1, 0)
+
+    def pacientes(self, tipo, vacinados=False, **filtros):
+        """Ids (ordenados) dos pacientes do recorte que receberam (ou não) a vacina."""
+        with self._lock:
+            self._garantir()
+            mascara = self.recorte(**filtros)
+            vacina = self._vacinados(tipo)
+            mascara &= vacina if vacinados else ~vacina
+            return self.ids[mascara]
+
+    def cobertura(self, tipos=None, por=("faixa_etaria", "bairro"), data_ref=None):
+        """DataFrame com população, vacinados e cobertura (%) por tipo e pelos grupos de `por`."""
+        with self._lock:
+            self._garantir()
+            dimensoes = []
+            if "faixa_etaria" in por:
+                dimensoes.append(("faixa_etaria", self.faixas(data_ref), NOMES_FAIXAS))
+            if "bairro" in por:
+                dimensoes.append(("bairro", self.bairro, self.bairros))
+
+            # Um código de grupo por paciente, combinando as dimensões pedidas
+            grupo = np.zeros(len(self.ids), dtype=np.int64)
+            total_grupos = 1
+            for _, codigos, nomes in dimensoes:
+                grupo = grupo * len(nomes) + codigos
+                total_grupos *= len(nomes)
+            populacao = np.bincount(grupo, minlength=total_grupos)
+
+            partes = []
+            for tipo in (tipos or sorted(self.bitmaps)):
+                vacinados = np.bincount(grupo[self._vacinados(tipo)], minlength=total_grupos)
+                partes.append(pd.DataFrame({"tipo": tipo, "grupo": np.arange(total_grupos),
+                                            "populacao": populacao, "vacinados": vacinados}))
+
+        df = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame(
+            columns=["tipo", "grupo", "populacao", "vacinados"])
+        resto = df["grupo"].to_numpy()
+        for nome, _, nomes in reversed(dimensoes):
+            df[nome] = np.asarray(nomes, dtype=object)[resto % len(nomes)]
+            resto = resto // len(nomes)
+        df = df[df["populacao"] > 0]
+        df = df.assign(cobertura=(100 * df["vacinados"] / df["populacao"]).round(1))
+        return df[["tipo", *[nome for nome, _, _ in dimensoes], "populacao", "vacinados", "cobertura"]] \
+            .reset_index(drop=True)
+
+indice = IndiceCobertura()
+
+
+# --- Interface do módulo ---
+
+def cobertura(tipos=None, por=("faixa_etaria", "bairro"), data_ref=None):
+    """Cobertura por tipo de vacina, faixa etária e bairro (ver IndiceCobertura.cobertura)."""
+    _assinar()
+    return indice.cobertura(tipos, por, data_ref)
+
+def sem_vacina(tipo, bairro=None, idade_min=None, idade_max=None, data_ref=None):
+    """Ids dos pacientes do recorte que nunca receberam a vacina `tipo`.
+
+    Ex.: sem_vacina("Influenza", bairro="Centro", idade_min=60).
+    """
+    _assinar()
+    return indice.pacientes(tipo, bairro=bairro, idade_min=idade_min, idade_max=idade_max, data_ref=data_ref)
+
+def vacinados(tipo, bairro=None, idade_min=None, idade_max=None, data_ref=None):
+    _assinar()
+    return indice.pacientes(tipo, vacinados=True, bairro=bairro, idade_min=idade_min, idade_max=idade_max,
+                            data_ref=data_ref)
+
+def registrar_dose(id_paciente, id_vacina, id_profissional, data_aplicacao=None):
+    """Grava a dose e já a reflete no índice deste processo."""
+    with banco.conexao_psycopg() as con, con.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO paciente_recebe_vacina (id_paciente, id_vacina, id_profissional, data_aplicacao)
+            VALUES (%s, %s, %s, COALESCE(%s, CURRENT_DATE))
+        """, (id_paciente, id_vacina, id_profissional, data_aplicacao))
+        con.commit()
+    indice.atualizar_pacientes([id_paciente])
+
+def invalidar():
+    indice.invalidar()
+
+
+# --- Atualização por notificação ---
+
+_assinado = False
+_lock_assinatura = threading.Lock()
+
+def on_vacinacao_alterada(evento):
+    if evento.dados["operacao"] == RESSINCRONIZAR or evento.dados.get("id") is None:
+        indice.invalidar()
+    else:
+        indice.atualizar_pacientes(evento.dados["id"])
+
+def on_referencia_alterada(evento):
+    if evento.dados["operacao"] == RESSINCRONIZAR or evento.dados.get("tabela") == "paciente":
+        indice.invalidar()
+
+def _assinar():
+    global _assinado
+    if _assinado:
+        return
+    with _lock_assinatura:
+        if not _assinado:
+            ouvinte.assinar("vacinacao_alterada", on_vacinacao_alterada)
+            ouvinte.assinar("referencia_alterada", on_referencia_alterada)
+            _assinado = True
+
+def main():
+    parser = argparse.ArgumentParser(description="Cobertura vacinal por tipo, faixa etária e bairro.")
+    parser.add_argument("--sem", metavar="TIPO", help="lista quem não recebeu a vacina TIPO")
+    parser.add_argument("--bairro")
+    parser.add_argument("--idade-min", type=int)
+    parser.add_argument("--idade-max", type=int)
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    indice.carregar()
+    print(f"Índice montado em {time.perf_counter() - inicio:.2f}s ({len(indice.ids):,} pacientes, "
+          f"{len(indice.bitmaps)} tipos de vacina)")
+
+    inicio = time.perf_counter()
+    if args.sem:
+        ids = indice.pacientes(args.sem, bairro=args.bairro, idade_min=args.idade_min, idade_max=args.idade_max)
+        print(f"{len(ids):,} paciente(s) sem {args.sem} ({(time.perf_counter() - inicio) * 1000:.1f} ms)")
+        print(", ".join(map(str, ids[:50])) + (" ..." if len(ids) > 50 else ""))
+    else:
+        df = indice.cobertura(por=("faixa_etaria",))
+        print(f"Calculado em {(time.perf_counter() - inicio) * 1000:.1f} ms")
+        print(df.to_string(index=False))
+
+if __name__ == "__main__":
+    main()
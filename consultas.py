@@ -1,45 +1,41 @@
 import panel as pn
 import pandas as pd
-from sqlalchemy import create_engine, MetaData, select, and_, delete, insert, update
-from sqlalchemy.orm import sessionmaker
-from dotenv import load_dotenv
-import os
-import datetime
+from sqlalchemy import select, or_, delete, insert, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+import banco
+import busca
+import exportacao
+import filtros
+import grade
+import instrumentacao
+import particoes
+from ouvinte import ouvinte
+import tabelas
+from tarefas import em_thread, carregando
 
 # Configuração da extensão do Panel
 pn.extension("tabulator", notifications=True, sizing_mode="stretch_width")
 
-# Carrega as variáveis de ambiente do arquivo .env
-load_dotenv()
-
-DB_HOST = os.getenv("DB_HOST")
-DB_NAME = os.getenv("DB_NAME")
-DB_USER = os.getenv("DB_USER")
-DB_PASS = os.getenv("DB_PASS")
-
-# Conexão com o banco de dados
-DATABASE_URL = f"postgresql+psycopg2://{DB_USER}:{DB_PASS}@{DB_HOST}/{DB_NAME}"
-engine = create_engine(DATABASE_URL)
-metadata = MetaData()
-metadata.reflect(bind=engine)
-Session = sessionmaker(bind=engine)
-session = Session()
-
-# Mapeamento das tabelas
-consulta_table = metadata.tables['consulta']
-prescricao_table = metadata.tables['prescricao']
-paciente_table = metadata.tables['paciente']
-medico_table = metadata.tables['medico']
-profissional_table = metadata.tables['profissional']
-medicamento_table = metadata.tables['medicamento']
-itemestoque_table = metadata.tables['item_estoque']
+instrumentacao.servir_metricas("consultas")
+
+# Mapeamento das tabelas (definidas em tabelas.py, sem refletir o banco)
+consulta_table = tabelas.consulta
+prescricao_table = tabelas.prescricao
+paciente_table = tabelas.paciente
+medico_table = tabelas.medico
+profissional_table = tabelas.profissional
+medicamento_table = tabelas.medicamento
+itemestoque_table = tabelas.item_estoque
 
 # --- Widgets de Interface (Estilo Feio e Simplificado) ---
 
 # --- FILTROS (AGORA COM TABELAS DE SELEÇÃO) ---
+busca_paciente_filtro = pn.widgets.TextInput(name="Buscar Paciente", placeholder="Nome, CPF ou RG...")
+busca_medico_filtro = pn.widgets.TextInput(name="Buscar Médico", placeholder="Nome do médico...")
 tabela_pacientes_filtro = pn.widgets.Tabulator(
-    pd.DataFrame(columns=['id_paciente', 'nome']),
-    titles={'id_paciente': 'ID', 'nome': 'Nome do Paciente'},
+    pd.DataFrame(columns=busca.COLUNAS_PACIENTE),
+    titles={'id_paciente': 'ID', 'nome': 'Nome do Paciente', 'cpf': 'CPF'},
     pagination='local', page_size=3, height=150, layout='fit_data', disabled=True
 )
 tabela_medicos_filtro = pn.widgets.Tabulator(
@@ -49,23 +45,27 @@ tabela_medicos_filtro = pn.widgets.Tabulator(
 )
 selecao_paciente_filtro = pn.widgets.StaticText(name="Filtrar por Paciente", value="Nenhum")
 selecao_medico_filtro = pn.widgets.StaticText(name="Filtrar por Médico", value="Nenhum")
-filtro_data = pn.widgets.DatePicker(name='Filtrar por Data')
+# Abre nos meses recentes (só as partições recentes são lidas); limpar a data mostra todo o histórico
+filtro_data_inicio = pn.widgets.DatePicker(name='Data Inicial', value=filtros.inicio_recente())
+filtro_data_fim = pn.widgets.DatePicker(name='Data Final')
 botao_filtrar = pn.widgets.Button(name="Consultar")
 botao_limpar_filtros = pn.widgets.Button(name="Limpar Filtros")
 
 
 # Tabela principal de Consultas
-colunas_consulta_fields = ["id_consulta", "id_paciente", "paciente_nome", "id_medico", "medico_nome", "data", "hora_inicio", "hora_fim", "diagnostico"]
+colunas_consulta_fields = ["id_consulta", "id_paciente", "paciente_nome", "id_medico", "medico_nome", "data", "hora_inicio", "hora_fim", "diagnostico", "versao"]
 tabela_consultas = pn.widgets.Tabulator(
     pd.DataFrame(columns=colunas_consulta_fields),
     titles={"id_consulta": "ID Consulta", "id_paciente": "ID Paciente", "paciente_nome": "Paciente", "id_medico": "ID Médico", "medico_nome": "Médico", "data": "Data", "hora_inicio": "Início", "hora_fim": "Fim", "diagnostico": "Diagnóstico"},
+    formatters={"data": grade.DATA, "hora_inicio": grade.HORA, "hora_fim": grade.HORA},
+    hidden_columns=["versao"],
     pagination='local', page_size=10, height=350, layout='fit_data', disabled=True
 )
 
 # Formulário de Edição
 input_id_consulta = pn.widgets.StaticText(name="ID Consulta", value="")
-input_paciente_edit = pn.widgets.AutocompleteInput(name="Paciente", options=[], placeholder="Selecione ou digite o nome do paciente...")
-input_medico_edit = pn.widgets.AutocompleteInput(name="Médico", options=[], placeholder="Selecione ou digite o nome do médico...")
+input_paciente_edit = pn.widgets.AutocompleteInput(name="Paciente", options=[], placeholder="Digite nome, CPF ou RG do paciente...", search_strategy="includes", case_sensitive=False, min_characters=3)
+input_medico_edit = pn.widgets.AutocompleteInput(name="Médico", options=[], placeholder="Digite o nome do médico...", search_strategy="includes", case_sensitive=False, min_characters=3)
 input_data_edit = pn.widgets.DatePicker(name="Data")
 input_hora_inicio_edit = pn.widgets.TimePicker(name="Hora Início")
 input_hora_fim_edit = pn.widgets.TimePicker(name="Hora Fim")
@@ -79,9 +79,11 @@ botao_salvar = pn.widgets.Button(name="Atualizar")
 botao_deletar = pn.widgets.Button(name="Excluir")
 
 # --- Formulário de Inclusão (COM TABELAS DE SELEÇÃO) ---
+busca_paciente_novo = pn.widgets.TextInput(name="Buscar Paciente", placeholder="Nome, CPF ou RG...")
+busca_medico_novo = pn.widgets.TextInput(name="Buscar Médico", placeholder="Nome do médico...")
 tabela_pacientes_novo = pn.widgets.Tabulator(
-    pd.DataFrame(columns=['id_paciente', 'nome']),
-    titles={'id_paciente': 'ID', 'nome': 'Nome do Paciente'},
+    pd.DataFrame(columns=busca.COLUNAS_PACIENTE),
+    titles={'id_paciente': 'ID', 'nome': 'Nome do Paciente', 'cpf': 'CPF'},
     pagination='local', page_size=5, height=200, layout='fit_data', disabled=True
 )
 tabela_medicos_novo = pn.widgets.Tabulator(
@@ -111,73 +113,61 @@ def get_id_from_selection(value):
     try: return int(value.split(' - ')[0])
     except (ValueError, IndexError): return None
 
-def carregar_consultas(event=None):
-    query = select(
-        consulta_table.c.id_consulta, paciente_table.c.id_paciente, paciente_table.c.nome.label("paciente_nome"),
-        medico_table.c.id_profissional.label("id_medico"), profissional_table.c.nome.label("medico_nome"),
-        consulta_table.c.data, consulta_table.c.hora_inicio, consulta_table.c.hora_fim, consulta_table.c.diagnostico
-    ).select_from(
-        consulta_table.join(paciente_table, consulta_table.c.id_paciente == paciente_table.c.id_paciente)
-        .join(medico_table, consulta_table.c.id_medico == medico_table.c.id_profissional)
-        .join(profissional_table, medico_table.c.id_profissional == profissional_table.c.id_profissional)
-    ).order_by(consulta_table.c.data.desc(), consulta_table.c.hora_inicio.desc())
-    
-    filtros = []
-    id_paciente_filtro = get_id_from_selection(selecao_paciente_filtro.value)
-    if id_paciente_filtro:
-        filtros.append(consulta_table.c.id_paciente == id_paciente_filtro)
-    
-    id_medico_filtro = get_id_from_selection(selecao_medico_filtro.value)
-    if id_medico_filtro:
-        filtros.append(consulta_table.c.id_medico == id_medico_filtro)
-
-    if filtro_data.value:
-        filtros.append(consulta_table.c.data == filtro_data.value)
-        
-    if filtros:
-        query = query.where(and_(*filtros))
-        
-    result = session.execute(query).fetchall()
-    
-    if result:
-        df = pd.DataFrame(result, columns=result[0].keys())
-        if 'hora_inicio' in df.columns:
-            df['hora_inicio'] = df['hora_inicio'].apply(lambda t: t.strftime('%H:%M:%S') if pd.notna(t) and isinstance(t, datetime.time) else '')
-        if 'hora_fim' in df.columns:
-            df['hora_fim'] = df['hora_fim'].apply(lambda t: t.strftime('%H:%M:%S') if pd.notna(t) and isinstance(t, datetime.time) else '')
-    else:
-        df = pd.DataFrame(columns=colunas_consulta_fields)
-        
-    tabela_consultas.value = df
-
-def carregar_dados_para_selecao():
-    # Carrega pacientes
-    query_pacientes = select(paciente_table.c.id_paciente, paciente_table.c.nome).order_by(paciente_table.c.nome)
-    df_pacientes = pd.DataFrame(session.execute(query_pacientes).fetchall(), columns=['id_paciente', 'nome'])
-    tabela_pacientes_filtro.value = df_pacientes
-    tabela_pacientes_filtro.disabled = False
-    tabela_pacientes_novo.value = df_pacientes
-    tabela_pacientes_novo.disabled = False
-    
-    # Carrega médicos
-    query_medicos = select(profissional_table.c.id_profissional, profissional_table.c.nome)\
-        .select_from(profissional_table.join(medico_table, profissional_table.c.id_profissional == medico_table.c.id_profissional))\
-        .order_by(profissional_table.c.nome)
-    df_medicos = pd.DataFrame(session.execute(query_medicos).fetchall(), columns=['id_profissional', 'nome'])
-    tabela_medicos_filtro.value = df_medicos
-    tabela_medicos_filtro.disabled = False
-    tabela_medicos_novo.value = df_medicos
-    tabela_medicos_novo.disabled = False
-
-def limpar_filtros(event=None):
+def ler(query):
+    with banco.conexao() as conn:
+        return grade.ler(conn, query)
+
+def gravar(*comandos):
+    """Executa os comandos numa única transação."""
+    with banco.sessao() as session:
+        for comando in comandos:
+            if comando is not None:
+                session.execute(comando)
+        session.commit()
+
+async def carregar_consultas(event=None):
+    query = filtros.consultas(
+        id_paciente=get_id_from_selection(selecao_paciente_filtro.value),
+        id_medico=get_id_from_selection(selecao_medico_filtro.value),
+        data_inicio=filtro_data_inicio.value, data_fim=filtro_data_fim.value, com_versao=True,
+    )
+    with carregando(tabela_consultas, botao_filtrar):
+        tabela_consultas.value = await em_thread(ler, query)
+
+# As tabelas de seleção recebem só os resultados da busca (busca.py), nunca o cadastro inteiro
+async def pesquisar_pacientes(tabela, termo):
+    with carregando(tabela):
+        tabela.value = await em_thread(busca.buscar_pacientes, termo)
+    tabela.disabled = False
+
+async def pesquisar_medicos(tabela, termo):
+    with carregando(tabela):
+        tabela.value = await em_thread(busca.buscar_medicos, termo)
+    tabela.disabled = False
+
+async def carregar_dados_para_selecao():
+    await pesquisar_pacientes(tabela_pacientes_filtro, busca_paciente_filtro.value_input)
+    await pesquisar_pacientes(tabela_pacientes_novo, busca_paciente_novo.value_input)
+    await pesquisar_medicos(tabela_medicos_filtro, busca_medico_filtro.value_input)
+    await pesquisar_medicos(tabela_medicos_novo, busca_medico_novo.value_input)
+
+async def opcoes_autocomplete(widget, funcao_busca, coluna_id, termo):
+    # Escolher uma opção também altera value_input; nesse caso a lista fica como está
+    if termo == widget.value:
+        return
+    df = await em_thread(funcao_busca, termo)
+    widget.options = [f"{id_} - {nome}" for id_, nome in zip(df[coluna_id], df['nome'])]
+
+async def limpar_filtros(event=None):
     selecao_paciente_filtro.value = 'Nenhum'
     selecao_medico_filtro.value = 'Nenhum'
-    filtro_data.value = None
+    filtro_data_inicio.value = filtros.inicio_recente()
+    filtro_data_fim.value = None
     tabela_pacientes_filtro.selection = []
     tabela_medicos_filtro.selection = []
-    carregar_consultas()
+    await carregar_consultas()
     
-def preencher_campos_edicao(event):
+async def preencher_campos_edicao(event):
     if not event.new:
         input_id_consulta.value = ''; input_paciente_edit.value = ''; input_medico_edit.value = ''
         input_data_edit.value = None; input_hora_inicio_edit.value = None; input_hora_fim_edit.value = None
@@ -186,29 +176,22 @@ def preencher_campos_edicao(event):
     index = event.new[0]
     row = tabela_consultas.value.iloc[index]
     input_id_consulta.value = str(row['id_consulta'])
+    edicao.update(id=int(row['id_consulta']), versao=int(row['versao']))
     paciente_selecionado = f"{row['id_paciente']} - {row['paciente_nome']}"
     medico_selecionado = f"{row['id_medico']} - {row['medico_nome']}"
     input_paciente_edit.options = [paciente_selecionado]; input_paciente_edit.value = paciente_selecionado
     input_medico_edit.options = [medico_selecionado]; input_medico_edit.value = medico_selecionado
-    input_data_edit.value = pd.to_datetime(row['data']).date()
-    try:
-        input_hora_inicio_edit.value = datetime.datetime.strptime(row['hora_inicio'], '%H:%M:%S').time() if row['hora_inicio'] else None
-    except (TypeError, ValueError):
-        input_hora_inicio_edit.value = None
-    try:
-        input_hora_fim_edit.value = datetime.datetime.strptime(row['hora_fim'], '%H:%M:%S').time() if row['hora_fim'] else None
-    except (TypeError, ValueError):
-        input_hora_fim_edit.value = None
+    input_data_edit.value = grade.data(row['data'])
+    input_hora_inicio_edit.value = grade.hora(row['hora_inicio'])
+    input_hora_fim_edit.value = grade.hora(row['hora_fim'])
 
     input_diagnostico_edit.value = row['diagnostico']
-    cols = ["id_medicamento", "nome_medicamento", "dosagem", "frequencia"]
     query_prescricao = select(prescricao_table.c.id_medicamento, itemestoque_table.c.nome.label("nome_medicamento"), prescricao_table.c.dosagem, prescricao_table.c.frequencia)\
         .select_from(prescricao_table.join(medicamento_table, prescricao_table.c.id_medicamento == medicamento_table.c.id_medicamento)\
         .join(itemestoque_table, medicamento_table.c.id_itemestoque == itemestoque_table.c.id_itemestoque))\
         .where(prescricao_table.c.id_consulta == row['id_consulta'])
-    result_prescricao = session.execute(query_prescricao).fetchall()
-    df_prescricao = pd.DataFrame(result_prescricao, columns=cols) if result_prescricao else pd.DataFrame(columns=cols)
-    tabela_prescricao_edit.value = df_prescricao
+    with carregando(tabela_prescricao_edit):
+        tabela_prescricao_edit.value = await em_thread(ler, query_prescricao)
 
 # --- Funções de callback para seleção nas tabelas ---
 def on_paciente_select_filtro(event):
@@ -239,11 +222,65 @@ def on_medico_select_novo(event):
     row = tabela_medicos_novo.value.iloc[index]
     selecao_medico_novo.value = f"{row['id_profissional']} - {row['nome']}"
 
-def salvar_alteracoes(event):
+def comando_prescricoes(id_consulta, df, nova=False):
+    """Um único comando que deixa as prescrições da consulta iguais à tabela editada.
+
+    Remove os medicamentos que saíram da tabela, insere os novos e só reescreve
+    as linhas cuja dosagem ou frequência mudou (ON CONFLICT em pk_prescricao);
+    as que não mudaram ficam intocadas. Numa consulta nova não há o que remover.
+    """
+    df = df.dropna(subset=['id_medicamento']).drop_duplicates('id_medicamento', keep='last')
+    ids = [int(i) for i in df['id_medicamento']]
+    removidas = delete(prescricao_table).where(prescricao_table.c.id_consulta == id_consulta)
+    if ids:
+        removidas = removidas.where(prescricao_table.c.id_medicamento.not_in(ids))
+    else:
+        return None if nova else removidas
+
+    stmt = pg_insert(prescricao_table).values([
+        {"id_consulta": id_consulta, "id_medicamento": i, "dosagem": dosagem, "frequencia": frequencia}
+        for i, dosagem, frequencia in zip(ids, df['dosagem'], df['frequencia'])
+    ])
+    stmt = stmt.on_conflict_do_update(
+        constraint='pk_prescricao',
+        set_={"dosagem": stmt.excluded.dosagem, "frequencia": stmt.excluded.frequencia},
+        where=or_(prescricao_table.c.dosagem.is_distinct_from(stmt.excluded.dosagem),
+                  prescricao_table.c.frequencia.is_distinct_from(stmt.excluded.frequencia)),
+    )
+    return stmt if nova else stmt.add_cte(removidas.cte("removidas"))
+
+# Consulta aberta no formulário de edição e a versão que a grade mostrava ao selecioná-la
+edicao = {"id": None, "versao": None}
+
+def gravar_edicao(id_consulta, versao, data, stmt, prescricoes):
+    """Grava a consulta e as prescrições numa transação e devolve a nova versão.
+
+    O UPDATE da consulta só grava sobre `versao`; se ela mudou ou sumiu desde
+    a seleção, nada é gravado e levanta banco.ConflitoDeVersao.
+    """
+    stmt = stmt.where(consulta_table.c.versao == versao)
+    with banco.sessao() as session:
+        particoes.garantir(session, "consulta", data)
+        nova = session.execute(stmt.returning(consulta_table.c.versao)).scalar_one_or_none()
+        if nova is None:
+            atual = session.execute(
+                select(consulta_table.c.versao).where(consulta_table.c.id_consulta == id_consulta)
+            ).scalar_one_or_none()
+            raise banco.ConflitoDeVersao(f"a consulta {id_consulta}", atual)
+        if prescricoes is not None:
+            session.execute(prescricoes)
+        session.commit()
+    return nova
+
+async def salvar_alteracoes(event):
     if not input_id_consulta.value:
         pn.state.notifications.warning("Selecione uma consulta para editar.")
         return
     id_consulta = int(input_id_consulta.value)
+    if edicao["id"] != id_consulta or edicao["versao"] is None:
+        # Sem a versão lida da grade não há como saber se outra mesa alterou a consulta
+        pn.state.notifications.warning("Selecione a consulta na lista antes de salvar.")
+        return
     # Na edição, mantemos o Autocomplete, então a lógica é diferente
     id_paciente = get_id_from_selection(input_paciente_edit.value)
     id_medico = get_id_from_selection(input_medico_edit.value)
@@ -258,37 +295,51 @@ def salvar_alteracoes(event):
             id_paciente=id_paciente, id_medico=id_medico, data=input_data_edit.value,
             hora_inicio=input_hora_inicio_edit.value, hora_fim=input_hora_fim_edit.value,
             diagnostico=input_diagnostico_edit.value)
-        session.execute(stmt)
-        session.execute(delete(prescricao_table).where(prescricao_table.c.id_consulta == id_consulta))
-        for _, row in tabela_prescricao_edit.value.iterrows():
-            if pd.notna(row['id_medicamento']):
-                session.execute(insert(prescricao_table).values(
-                    id_consulta=id_consulta, id_medicamento=int(row['id_medicamento']),
-                    dosagem=row['dosagem'], frequencia=row['frequencia']))
-        session.commit()
+        with carregando(botao_salvar):
+            edicao["versao"] = await em_thread(
+                gravar_edicao, id_consulta, edicao["versao"], input_data_edit.value, stmt,
+                comando_prescricoes(id_consulta, tabela_prescricao_edit.value))
         pn.state.notifications.success("Consulta atualizada com sucesso!")
-        carregar_consultas()
+        await carregar_consultas()
+    except banco.ConflitoDeVersao as conflito:
+        # O formulário mantém o que foi digitado; salvar de novo grava sobre a versão atual
+        edicao["versao"] = conflito.versao_atual
+        if conflito.versao_atual is None:
+            pn.state.notifications.error(str(conflito))
+        else:
+            pn.state.notifications.error(
+                f"{conflito} A lista foi recarregada com os dados atuais: confira e salve de novo para gravar por cima.",
+                duration=0)
+        await carregar_consultas()
     except Exception as e:
-        session.rollback()
         pn.state.notifications.error(f"Erro ao salvar: {e}")
 
-def deletar_consulta(event):
+async def deletar_consulta(event):
     if not input_id_consulta.value:
         pn.state.notifications.warning("Nenhuma consulta selecionada para excluir.")
         return
     id_consulta = int(input_id_consulta.value)
     try:
         stmt = delete(consulta_table).where(consulta_table.c.id_consulta == id_consulta)
-        session.execute(stmt)
-        session.commit()
+        with carregando(botao_deletar):
+            await em_thread(gravar, stmt)
         pn.state.notifications.success(f"Consulta {id_consulta} excluída com sucesso!")
         tabela_consultas.selection = []
-        carregar_consultas()
+        await carregar_consultas()
     except Exception as e:
-        session.rollback()
         pn.state.notifications.error(f"Erro ao excluir consulta: {e}")
 
-def inserir_consulta(event):
+def gravar_consulta_nova(data, stmt, prescricoes):
+    with banco.sessao() as session:
+        particoes.garantir(session, "consulta", data)
+        id_consulta = session.execute(stmt).scalar_one()
+        comando = comando_prescricoes(id_consulta, prescricoes, nova=True)
+        if comando is not None:
+            session.execute(comando)
+        session.commit()
+    return id_consulta
+
+async def inserir_consulta(event):
     id_paciente = get_id_from_selection(selecao_paciente_novo.value)
     id_medico = get_id_from_selection(selecao_medico_novo.value)
     if not id_paciente:
@@ -303,22 +354,15 @@ def inserir_consulta(event):
             hora_inicio=input_hora_inicio_novo.value, hora_fim=input_hora_fim_novo.value,
             diagnostico=input_diagnostico_novo.value
         ).returning(consulta_table.c.id_consulta)
-        result = session.execute(stmt)
-        id_consulta_novo = result.scalar_one()
-        for _, row in tabela_prescricao_nova.value.iterrows():
-            if pd.notna(row['id_medicamento']):
-                session.execute(insert(prescricao_table).values(
-                    id_consulta=id_consulta_novo, id_medicamento=int(row['id_medicamento']),
-                    dosagem=row['dosagem'], frequencia=row['frequencia']))
-        session.commit()
+        with carregando(botao_inserir):
+            await em_thread(gravar_consulta_nova, input_data_novo.value, stmt, tabela_prescricao_nova.value)
         pn.state.notifications.success("Consulta inserida com sucesso!")
         selecao_paciente_novo.value = 'Nenhum'; selecao_medico_novo.value = 'Nenhum'
         tabela_pacientes_novo.selection = []; tabela_medicos_novo.selection = []
         input_data_novo.value = None; input_hora_inicio_novo.value = None; input_hora_fim_novo.value = None
         input_diagnostico_novo.value = ''; tabela_prescricao_nova.value = pd.DataFrame(columns=tabela_prescricao_nova.value.columns)
-        carregar_consultas()
+        await carregar_consultas()
     except Exception as e:
-        session.rollback()
         pn.state.notifications.error(f"Erro ao inserir consulta: {e}")
 
 # --- Conexão dos Widgets com a Lógica (Event Handlers) ---
@@ -327,9 +371,31 @@ tabela_medicos_filtro.param.watch(on_medico_select_filtro, 'selection')
 tabela_pacientes_novo.param.watch(on_paciente_select_novo, 'selection')
 tabela_medicos_novo.param.watch(on_medico_select_novo, 'selection')
 
-# Funções de busca para o Autocomplete da Edição (não foi removido)
-input_paciente_edit.param.watch(lambda e: setattr(input_paciente_edit, 'options', buscar_pacientes(e.new)), 'value_input')
-input_medico_edit.param.watch(lambda e: setattr(input_medico_edit, 'options', buscar_medicos(e.new)), 'value_input')
+# Buscas disparadas quando o usuário para de digitar
+busca.ao_digitar(busca_paciente_filtro, lambda termo: pesquisar_pacientes(tabela_pacientes_filtro, termo))
+busca.ao_digitar(busca_paciente_novo, lambda termo: pesquisar_pacientes(tabela_pacientes_novo, termo))
+busca.ao_digitar(busca_medico_filtro, lambda termo: pesquisar_medicos(tabela_medicos_filtro, termo))
+busca.ao_digitar(busca_medico_novo, lambda termo: pesquisar_medicos(tabela_medicos_novo, termo))
+busca.ao_digitar(input_paciente_edit, lambda termo: opcoes_autocomplete(
+    input_paciente_edit, busca.buscar_pacientes, 'id_paciente', termo))
+busca.ao_digitar(input_medico_edit, lambda termo: opcoes_autocomplete(
+    input_medico_edit, busca.buscar_medicos, 'id_profissional', termo))
+
+# --- Exportação ---
+
+def atualizar_links_exportacao(event=None):
+    """Links de download da listagem inteira com os filtros atuais (exportacao.py)."""
+    valores = dict(paciente=get_id_from_selection(selecao_paciente_filtro.value),
+                   medico=get_id_from_selection(selecao_medico_filtro.value),
+                   inicio=filtro_data_inicio.value, fim=filtro_data_fim.value)
+    links_exportacao.object = "Exportar: " + " · ".join(
+        f"[{formato.upper()}]({exportacao.url('consultas', formato, **valores)})" for formato in ("csv", "parquet")
+    )
+
+links_exportacao = pn.pane.Markdown("")
+for widget in (selecao_paciente_filtro, selecao_medico_filtro, filtro_data_inicio, filtro_data_fim):
+    widget.param.watch(atualizar_links_exportacao, 'value')
+atualizar_links_exportacao()
 
 botao_filtrar.on_click(carregar_consultas)
 botao_limpar_filtros.on_click(limpar_filtros)
@@ -343,13 +409,16 @@ botao_inserir.on_click(inserir_consulta)
 filtros_view = pn.Column(
     pn.pane.Markdown("Filtro de Consultas"),
     pn.pane.Markdown("Selecione um Paciente para Filtrar:"),
+    busca_paciente_filtro,
     tabela_pacientes_filtro,
     selecao_paciente_filtro,
     pn.pane.Markdown("Selecione um Médico para Filtrar:"),
+    busca_medico_filtro,
     tabela_medicos_filtro,
     selecao_medico_filtro,
-    filtro_data, 
-    pn.Row(botao_filtrar, botao_limpar_filtros)
+    pn.Row(filtro_data_inicio, filtro_data_fim),
+    pn.Row(botao_filtrar, botao_limpar_filtros),
+    links_exportacao,
 )
 edicao_view = pn.Column(
     pn.pane.Markdown("Editar / Remover Consulta"),
@@ -361,9 +430,11 @@ edicao_view = pn.Column(
 novo_view = pn.Column(
     pn.pane.Markdown("Adicionar Nova Consulta"),
     pn.pane.Markdown("1. Selecione um Paciente:"),
+    busca_paciente_novo,
     tabela_pacientes_novo,
     selecao_paciente_novo,
     pn.pane.Markdown("2. Selecione um Médico:"),
+    busca_medico_novo,
     tabela_medicos_novo,
     selecao_medico_novo,
     pn.pane.Markdown("3. Preencha os detalhes e a prescrição:"),
@@ -377,9 +448,11 @@ app_layout = pn.Column(
     sizing_mode="stretch_width"
 )
 
-# Carrega os dados iniciais ao iniciar a aplicação
-carregar_consultas()
-carregar_dados_para_selecao()
+# Carrega os dados iniciais depois que a página é entregue ao navegador
+pn.state.onload(carregar_consultas)
+pn.state.onload(carregar_dados_para_selecao)
+# Pacientes ou médicos cadastrados em outra tela aparecem sem recarregar a página
+ouvinte.assinar_sessao("referencia_alterada", lambda evento: carregar_dados_para_selecao())
 
 
 # Torna o layout "servível"
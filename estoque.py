@@ -0,0 +1,253 @@
+import datetime
+import logging
+
+import pandas as pd
+from psycopg2.extras import execute_values
+from sqlalchemy import text
+
+import banco
+from tarefas import em_thread
+
+# Quantidades do estoque (migração 006).
+#
+# Cada linha de Item_estoque é um lote de um produto (o produto é o nome do
+# item). Todo movimento entra em Movimento_estoque, que só aceita inserções, e
+# uma trigger mantém o saldo de cada lote em Saldo_estoque. A dispensação de
+# uma prescrição escolhe os lotes pelo vencimento mais próximo (FEFO) e trava
+# as linhas de saldo com SELECT ... FOR UPDATE antes de baixar, então duas
+# dispensações simultâneas do mesmo produto são serializadas e nunca vendem a
+# mesma unidade duas vezes. O CHECK (quantidade >= 0) do saldo é a garantia
+# final no banco.
+
+TIPOS = ("entrada", "dispensacao", "perda", "ajuste")
+
+# Faixas do resumo de validade (migração 007); 0 são os vencidos com saldo
+FAIXAS_VALIDADE = (0, 7, 30, 90)
+# Horário diário do recálculo das faixas
+HORA_RECALCULO = datetime.time(0, 5)
+
+logger = logging.getLogger(__name__)
+
+# Lotes do mesmo produto do medicamento com saldo e dentro da validade, na
+# ordem em que devem sair. As linhas são travadas nessa ordem, o que também
+# evita deadlock entre dispensações concorrentes.
+LOTES_FEFO = """
+    SELECT s.id_itemestoque, i.lote, i.data_validade, s.quantidade
+    FROM saldo_estoque s
+    JOIN item_estoque i ON i.id_itemestoque = s.id_itemestoque
+    WHERE i.nome = (SELECT ie.nome FROM medicamento m
+                    JOIN item_estoque ie ON ie.id_itemestoque = m.id_itemestoque
+                    WHERE m.id_medicamento = %s)
+      AND s.quantidade > 0
+      AND i.data_validade >= CURRENT_DATE
+    ORDER BY i.data_validade, s.id_itemestoque
+    FOR UPDATE OF s
+"""
+
+def sql_itens(filtro_nome=None):
+    """Lotes com o saldo, como a tela de estoque lista (SQL com :parametros e parâmetros)."""
+    query = """
+        SELECT i.*, COALESCE(s.quantidade, 0) AS saldo
+        FROM Item_estoque i LEFT JOIN Saldo_estoque s ON s.id_itemestoque = i.id_itemestoque
+    """
+    params = {}
+    if filtro_nome:
+        query += " WHERE i.nome ILIKE :nome"
+        params["nome"] = f"%{filtro_nome}%"
+    query += " ORDER BY i.nome ASC, i.data_validade ASC"
+    return query, params
+
+INSERIR_MOVIMENTOS = """
+    INSERT INTO movimento_estoque (id_itemestoque, tipo, quantidade, id_consulta, id_medicamento, observacao)
+    VALUES %s
+"""
+
+class EstoqueInsuficiente(Exception):
+    """Não há saldo (dentro da validade) para atender o pedido."""
+
+class LoteComHistorico(Exception):
+    """O lote tem movimentos no livro e não pode ser apagado."""
+
+def _positiva(quantidade):
+    quantidade = int(quantidade)
+    if quantidade <= 0:
+        raise ValueError("A quantidade deve ser maior que zero.")
+    return quantidade
+
+def _inserir(cursor, movimentos):
+    """movimentos: [(id_itemestoque, tipo, quantidade, id_consulta, id_medicamento, observacao)]"""
+    execute_values(cursor, INSERIR_MOVIMENTOS, movimentos)
+
+
+# --- Entradas e saídas ---
+
+def cadastrar_lote(nome, data_fabricacao, data_validade, lote, fabricante, quantidade=0):
+    """Cadastra um lote em Item_estoque e, se houver quantidade, registra a entrada.
+
+    Retorna o id_itemestoque criado.
+    """
+    with banco.conexao_psycopg() as con, con.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO item_estoque (nome, data_fabricacao, data_validade, lote, fabricante)
+            VALUES (%s, %s, %s, %s, %s) RETURNING id_itemestoque
+        """, (nome, data_fabricacao, data_validade, lote, fabricante))
+        id_item = cursor.fetchone()[0]
+        if quantidade:
+            _inserir(cursor, [(id_item, "entrada", _positiva(quantidade), None, None, "Cadastro do lote")])
+        con.commit()
+    return id_item
+
+def receber(id_itemestoque, quantidade, observacao=None):
+    """Registra a entrada de `quantidade` unidades no lote."""
+    with banco.conexao_psycopg() as con, con.cursor() as cursor:
+        _inserir(cursor, [(id_itemestoque, "entrada", _positiva(quantidade), None, None, observacao)])
+        con.commit()
+
+def registrar_perda(id_itemestoque, quantidade, observacao=None):
+    """Baixa unidades perdidas (vencidas, quebradas...) de um lote específico."""
+    quantidade = _positiva(quantidade)
+    with banco.conexao_psycopg() as con, con.cursor() as cursor:
+        cursor.execute(
+            "SELECT quantidade FROM saldo_estoque WHERE id_itemestoque = %s FOR UPDATE", (id_itemestoque,)
+        )
+        linha = cursor.fetchone()
+        disponivel = linha[0] if linha else 0
+        if disponivel < quantidade:
+            raise EstoqueInsuficiente(f"O lote {id_itemestoque} tem só {disponivel} unidade(s).")
+        _inserir(cursor, [(id_itemestoque, "perda", -quantidade, None, None, observacao)])
+        con.commit()
+
+def dispensar(id_consulta, id_medicamento, quantidade, observacao=None):
+    """Dispensa a prescrição (id_consulta, id_medicamento) pelos lotes que vencem primeiro.
+
+    Retorna [(id_itemestoque, lote, quantidade)] com o que saiu de cada lote.
+    Levanta EstoqueInsuficiente (sem baixar nada) se o saldo válido não basta.
+    """
+    quantidade = _positiva(quantidade)
+    with banco.conexao_psycopg() as con, con.cursor() as cursor:
+        cursor.execute(LOTES_FEFO, (id_medicamento,))
+        lotes = cursor.fetchall()
+        retiradas = []
+        restante = quantidade
+        for id_item, lote, _validade, disponivel in lotes:
+            if restante == 0:
+                break
+            retirada = min(restante, disponivel)
+            retiradas.append((id_item, lote, retirada))
+            restante -= retirada
+        if restante:
+            raise EstoqueInsuficiente(
+                f"Saldo válido insuficiente: pedidas {quantidade}, disponíveis {quantidade - restante}."
+            )
+        _inserir(cursor, [
+            (id_item, "dispensacao", -retirada, id_consulta, id_medicamento, observacao)
+            for id_item, _lote, retirada in retiradas
+        ])
+        con.commit()
+    return retiradas
+
+def remover_produto(nome):
+    """Apaga os lotes do produto `nome`; retorna quantos foram apagados.
+
+    O livro é só de inserção, então um lote com movimentos não pode sair de
+    Item_estoque: se algum lote do produto tem histórico, nada é apagado e
+    levanta LoteComHistorico. O saldo desses lotes sai com uma perda.
+    """
+    with banco.conexao_psycopg() as con, con.cursor() as cursor:
+        # FOR UPDATE segura os movimentos novos desses lotes até o fim da transação
+        cursor.execute("SELECT id_itemestoque, lote FROM item_estoque WHERE nome = %s FOR UPDATE", (nome,))
+        lotes = cursor.fetchall()
+        if not lotes:
+            return 0
+        ids = [id_item for id_item, _lote in lotes]
+        cursor.execute("""
+            SELECT i.id_itemestoque FROM unnest(%s) AS i(id_itemestoque)
+            WHERE EXISTS (SELECT 1 FROM movimento_estoque m WHERE m.id_itemestoque = i.id_itemestoque)
+        """, (ids,))
+        com_historico = {id_item for (id_item,) in cursor.fetchall()}
+        if com_historico:
+            descricao = ", ".join(f"{lote} (id {id_item})" for id_item, lote in lotes if id_item in com_historico)
+            raise LoteComHistorico(
+                f"'{nome}' tem lotes com movimentos no estoque, que não podem ser apagados: {descricao}. "
+                "Para zerar o saldo deles, registre uma perda."
+            )
+        cursor.execute("DELETE FROM item_estoque WHERE id_itemestoque = ANY(%s)", (ids,))
+        con.commit()
+    return len(ids)
+
+
+# --- Consultas de saldo ---
+
+def saldo(id_itemestoque):
+    """Saldo atual do lote (busca pela chave em Saldo_estoque)."""
+    with banco.conexao_psycopg() as con, con.cursor() as cursor:
+        cursor.execute("SELECT quantidade FROM saldo_estoque WHERE id_itemestoque = %s", (id_itemestoque,))
+        linha = cursor.fetchone()
+    return linha[0] if linha else 0
+
+def saldo_produto(nome):
+    """Saldo total e ainda dentro da validade de todos os lotes de um produto."""
+    with banco.conexao_psycopg() as con, con.cursor() as cursor:
+        cursor.execute("""
+            SELECT COALESCE(sum(s.quantidade), 0),
+                   COALESCE(sum(s.quantidade) FILTER (WHERE i.data_validade >= CURRENT_DATE), 0)
+            FROM item_estoque i JOIN saldo_estoque s ON s.id_itemestoque = i.id_itemestoque
+            WHERE i.nome = %s
+        """, (nome,))
+        total, valido = cursor.fetchone()
+    return {"total": total, "valido": valido}
+
+
+# --- Validade ---
+
+def resumo_validade():
+    """{faixa: (lotes, unidades)} lido do resumo pré-calculado."""
+    with banco.conexao_psycopg() as con, con.cursor() as cursor:
+        cursor.execute("""
+            SELECT faixa, count(*), COALESCE(sum(quantidade), 0)
+            FROM resumo_validade GROUP BY faixa
+        """)
+        contagens = {faixa: (lotes, unidades) for faixa, lotes, unidades in cursor.fetchall()}
+    return {faixa: contagens.get(faixa, (0, 0)) for faixa in FAIXAS_VALIDADE}
+
+def itens_a_vencer(dias=30, limite=500):
+    """Lotes que vencem em até `dias` (7, 30 ou 90), do mais próximo ao mais distante.
+
+    Com dias=0 retorna os lotes já vencidos que ainda têm saldo.
+    """
+    if dias not in FAIXAS_VALIDADE:
+        raise ValueError(f"dias deve ser um de {FAIXAS_VALIDADE}")
+    condicao = "faixa = 0 AND quantidade > 0" if dias == 0 else "faixa BETWEEN 1 AND :dias"
+    query = f"""
+        SELECT id_itemestoque, nome, lote, data_validade, quantidade
+        FROM resumo_validade
+        WHERE {condicao}
+        ORDER BY data_validade, id_itemestoque
+        LIMIT :limite
+    """
+    with banco.conexao() as conn:
+        return pd.read_sql(text(query), conn, params={"dias": dias, "limite": limite})
+
+def recalcular_validade():
+    """Aplica a passagem dos dias ao resumo (no máximo uma vez por dia)."""
+    with banco.conexao_psycopg() as con, con.cursor() as cursor:
+        cursor.execute("SELECT recalcular_resumo_validade()")
+        alteradas = cursor.fetchone()[0]
+        con.commit()
+    return alteradas
+
+async def tarefa_validade():
+    """Tarefa agendada por servidor.py (pn.state.schedule_task) para recalcular as faixas."""
+    try:
+        alteradas = await em_thread(recalcular_validade)
+        logger.info("Resumo de validade recalculado: %s linha(s) alterada(s)", alteradas)
+    except Exception:
+        logger.exception("Falha ao recalcular o resumo de validade")
+
+def horarios_validade():
+    """Agora (para recuperar um dia perdido) e depois todo dia em HORA_RECALCULO."""
+    yield datetime.datetime.now()
+    proximo = datetime.datetime.combine(datetime.date.today(), HORA_RECALCULO)
+    while True:
+        proximo += datetime.timedelta(days=1)
+        yield proximo
@@ -0,0 +1,215 @@
+import csv
+import datetime
+import io
+import os
+import time
+from urllib.parse import urlencode
+
+import psycopg2.extensions
+from tornado.iostream import StreamClosedError
+from tornado.web import RequestHandler
+
+import banco
+import filtros
+import grade
+import instrumentacao
+from fila import PRIORIDADES
+from tarefas import em_thread
+
+# Exportação das listagens de triagem e de consultas em CSV ou Parquet.
+#
+# GET /exportar/<listagem>.<formato>?<filtros> devolve a listagem inteira com
+# os mesmos filtros da tela (filtros.py). As linhas vêm de um cursor nomeado
+# (cursor do lado do servidor), TAMANHO_LOTE por vez, e cada lote é escrito e
+# enviado antes do próximo ser lido: a memória do processo não cresce com o
+# tamanho da exportação. O flush aguarda o cliente consumir o que já foi
+# enviado, então um download lento também não acumula lotes no servidor.
+#
+# Como o download dura o quanto o cliente quiser, cada exportação usa uma
+# conexão própria (fora do pool das telas), e uma transação parada por mais de
+# OCIOSA_S segundos esperando o cliente é encerrada pelo PostgreSQL, para não
+# segurar o VACUUM e a manutenção das partições.
+#
+# Filtros aceitos:
+#   triagem:   prioridade, inicio, fim (AAAA-MM-DD, inclusivas), ordem (ASC/DESC)
+#   consultas: paciente, medico (IDs), inicio, fim
+#
+# Parquet requer o pacote pyarrow; cada lote vira um row group.
+
+TAMANHO_LOTE = int(os.getenv("EXPORTACAO_LOTE") or 5000)
+OCIOSA_S = int(os.getenv("EXPORTACAO_OCIOSA_S") or 60)
+
+ROTA = r"/exportar/(triagem|consultas)\.(csv|parquet)"
+
+TIPOS_CONTEUDO = {
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+# --- Leitura em lotes ---
+
+def lotes(query, params=None, tamanho=TAMANHO_LOTE):
+    """Gera (description, linhas) de `query` em lotes de até `tamanho` linhas.
+
+    `query` é texto SQL com :parametros ou um select do SQLAlchemy. O primeiro
+    lote é sempre gerado, mesmo vazio, para que o arquivo tenha as colunas.
+    """
+    lido, leitura = 0, 0.0
+    con = banco.conexao_dedicada()
+    try:
+        with con.cursor() as cursor:
+            cursor.execute("SET idle_in_transaction_session_timeout = %s", (OCIOSA_S * 1000,))
+        # Cursor comum (sem instrumentação por execute): a leitura é medida inteira no final
+        with con.cursor(name="exportacao", cursor_factory=psycopg2.extensions.cursor) as cursor:
+            sql = grade.sql_literal(banco.engine.dialect, cursor, query, params)
+            inicio = time.perf_counter()
+            cursor.execute(sql)
+            while True:
+                linhas = cursor.fetchmany(tamanho)
+                leitura += time.perf_counter() - inicio
+                if not linhas and lido:
+                    break
+                lido += len(linhas)
+                yield cursor.description, linhas
+                if len(linhas) < tamanho:
+                    break
+                inicio = time.perf_counter()
+    finally:
+        con.close()
+    instrumentacao.registrar(sql, leitura, lido)
+
+
+# --- Escrita ---
+
+def csv_em_partes(lotes):
+    """Bytes do CSV (UTF-8 com BOM, para o Excel), um pedaço por lote."""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    for numero, (colunas, linhas) in enumerate(lotes):
+        if numero == 0:
+            buffer.write("\ufeff")
+            escritor.writerow([coluna.name for coluna in colunas])
+        escritor.writerows(linhas)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+
+class _Saida:
+    """Arquivo só de escrita que guarda os bytes até serem retirados para a resposta."""
+
+    def __init__(self):
+        self.partes = []
+        self.posicao = 0
+        self.closed = False
+
+    def write(self, dados):
+        dados = bytes(dados)
+        self.partes.append(dados)
+        self.posicao += len(dados)
+        return len(dados)
+
+    def tell(self):
+        return self.posicao
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def retirar(self):
+        dados = b"".join(self.partes)
+        self.partes.clear()
+        return dados
+
+def parquet_em_partes(lotes):
+    """Bytes do Parquet, um row group por lote; o rodapé sai no último pedaço."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    saida = _Saida()
+    escritor = None
+    for colunas, linhas in lotes:
+        if escritor is None:
+            esquema = pa.schema([(coluna.name, grade.tipo_arrow(pa, coluna.type_code, coluna.precision, coluna.scale)) for coluna in colunas])
+            escritor = pq.ParquetWriter(pa.PythonFile(saida, mode="w"), esquema)
+        if linhas:
+            # Tipo inferido e convertido depois: numeric (Decimal) e lotes só com nulos
+            arrays = [pa.array(valores).cast(campo.type) for valores, campo in zip(zip(*linhas), esquema)]
+            escritor.write_table(pa.Table.from_arrays(arrays, schema=esquema))
+        yield saida.retirar()
+    escritor.close()
+    yield saida.retirar()
+
+ESCRITORES = {"csv": csv_em_partes, "parquet": parquet_em_partes}
+
+def _fechar(*geradores):
+    for gerador in geradores:
+        gerador.close()
+
+
+# --- Filtros da query string ---
+
+def _data(valor):
+    return datetime.date.fromisoformat(valor) if valor else None
+
+def _inteiro(valor):
+    return int(valor) if valor else None
+
+def _triagem(argumento):
+    prioridade = argumento("prioridade")
+    if prioridade and prioridade not in PRIORIDADES:
+        raise ValueError(f"Prioridade desconhecida: {prioridade}")
+    return filtros.sql_triagens(prioridade, _data(argumento("inicio")), _data(argumento("fim")),
+                                argumento("ordem") or "DESC")
+
+def _consultas(argumento):
+    query = filtros.consultas(_inteiro(argumento("paciente")), _inteiro(argumento("medico")),
+                              _data(argumento("inicio")), _data(argumento("fim")))
+    return query, None
+
+LISTAGENS = {"triagem": _triagem, "consultas": _consultas}
+
+def url(listagem, formato, **valores):
+    """Caminho de download da listagem com os filtros dados (vazios ficam de fora)."""
+    valores = {
+        nome: valor.isoformat() if isinstance(valor, datetime.date) else valor
+        for nome, valor in valores.items() if valor not in (None, "")
+    }
+    return f"/exportar/{listagem}.{formato}" + (f"?{urlencode(valores)}" if valores else "")
+
+
+# --- Endpoint ---
+
+class ExportacaoHandler(RequestHandler):
+    """GET /exportar/<listagem>.<formato>: a listagem filtrada, enviada lote a lote."""
+
+    async def get(self, listagem, formato):
+        try:
+            query, params = LISTAGENS[listagem](lambda nome: self.get_query_argument(nome, None) or None)
+        except ValueError as e:
+            self.set_status(400)
+            self.finish(f"Filtro inválido: {e}")
+            return
+        if formato == "parquet" and not grade.arrow_disponivel():
+            self.set_status(501)
+            self.finish("Exportação em Parquet requer o pacote pyarrow.")
+            return
+
+        nome = f"{listagem}-{datetime.date.today():%Y%m%d}.{formato}"
+        self.set_header("Content-Type", TIPOS_CONTEUDO[formato])
+        self.set_header("Content-Disposition", f'attachment; filename="{nome}"')
+
+        fonte = lotes(query, params)
+        partes = ESCRITORES[formato](fonte)
+        try:
+            while (parte := await em_thread(next, partes, None)) is not None:
+                if parte:
+                    self.write(parte)
+                    await self.flush()
+        except StreamClosedError:
+            pass  # o cliente cancelou o download
+        finally:
+            # Fecha o cursor e a conexão também quando o download é interrompido
+            await em_thread(_fechar, partes, fonte)
@@ -0,0 +1,213 @@
+import heapq
+import logging
+import threading
+from collections import namedtuple
+
+import banco
+from ouvinte import ouvinte, RESSINCRONIZAR
+
+# Fila de atendimento por prioridade.
+#
+# Mantém em memória um heap por profissional (mais um para entradas sem
+# profissional definido) ordenado por (prioridade de Manchester, hora de
+# entrada). A tabela Fila é a fonte da verdade: o heap é reconstruído dela na
+# inicialização e acompanha as alterações de outras sessões e processos pelos
+# canais fila_alterada/triagem_alterada do ouvinte.
+
+# Classificações usadas na triagem, da mais urgente para a menos urgente
+PRIORIDADES = ['Vermelho (Emergência)', 'Amarelo (Urgente)', 'Verde (Não Urgente)', 'Azul (Eletivo)']
+RANK_PRIORIDADE = {prioridade: rank for rank, prioridade in enumerate(PRIORIDADES)}
+
+logger = logging.getLogger(__name__)
+
+EntradaFila = namedtuple(
+    "EntradaFila",
+    ["id_fila", "id_triagem", "id_paciente", "nome_paciente", "id_profissional", "prioridade", "hora_entrada"],
+)
+
+SELECT_ENTRADAS = """
+    SELECT f.id_fila, f.id_triagem, f.id_paciente, p.nome, f.id_profissional,
+           t.classificacao_de_prioridade, f.hora_entrada
+    FROM fila f
+    JOIN triagem t ON t.id_triagem = f.id_triagem
+    JOIN paciente p ON p.id_paciente = f.id_paciente
+    WHERE f.hora_chamada IS NULL
+"""
+
+def chave(entrada):
+    """Ordem de atendimento: prioridade, depois quem chegou primeiro."""
+    return (RANK_PRIORIDADE.get(entrada.prioridade, len(PRIORIDADES)), entrada.hora_entrada, entrada.id_fila)
+
+class FilaPrioridade:
+
+    def __init__(self):
+        self._heaps = {}          # id_profissional (ou None) -> [(chave, id_fila)]
+        self._entradas = {}       # id_fila -> EntradaFila das entradas aguardando
+        self._por_triagem = {}    # id_triagem -> id_fila
+        self._lock = threading.RLock()
+        self._carregada = False
+
+    # --- Estado em memória ---
+
+    def carregar(self):
+        """Reconstrói os heaps a partir das entradas da tabela Fila ainda não chamadas.
+
+        A leitura acontece sob a trava: um `adicionar` que chega durante a
+        carga espera e é aplicado sobre o estado novo, em vez de se perder.
+        """
+        with self._lock:
+            with banco.conexao_psycopg() as con, con.cursor() as cursor:
+                cursor.execute(SELECT_ENTRADAS)
+                entradas = [EntradaFila(*linha) for linha in cursor.fetchall()]
+            self._entradas = {entrada.id_fila: entrada for entrada in entradas}
+            self._por_triagem = {entrada.id_triagem: entrada.id_fila for entrada in entradas}
+            self._heaps = {}
+            for entrada in entradas:
+                self._heaps.setdefault(entrada.id_profissional, []).append((chave(entrada), entrada.id_fila))
+            for heap in self._heaps.values():
+                heapq.heapify(heap)
+            self._carregada = True
+
+    def adicionar(self, entrada):
+        with self._lock:
+            if self._entradas.get(entrada.id_fila) == entrada:
+                return
+            self._entradas[entrada.id_fila] = entrada
+            self._por_triagem[entrada.id_triagem] = entrada.id_fila
+            # Versões antigas da mesma entrada ficam no heap e são descartadas ao chegar no topo
+            heapq.heappush(self._heaps.setdefault(entrada.id_profissional, []), (chave(entrada), entrada.id_fila))
+
+    def descartar(self, id_fila):
+        with self._lock:
+            entrada = self._entradas.pop(id_fila, None)
+            if entrada is not None:
+                self._por_triagem.pop(entrada.id_triagem, None)
+
+    def _topo(self, id_profissional):
+        """Topo válido do heap do profissional, limpando entradas obsoletas (O(log n) amortizado)."""
+        heap = self._heaps.get(id_profissional)
+        while heap:
+            chave_heap, id_fila = heap[0]
+            entrada = self._entradas.get(id_fila)
+            if entrada is not None and entrada.id_profissional == id_profissional and chave(entrada) == chave_heap:
+                return chave_heap, entrada
+            heapq.heappop(heap)
+        return None
+
+    def proximo(self, id_profissional):
+        """Próximo paciente do profissional (ou sem profissional definido), sem retirá-lo da fila."""
+        with self._lock:
+            candidatos = [topo for topo in (self._topo(id_profissional), self._topo(None)) if topo]
+            return min(candidatos)[1] if candidatos else None
+
+    def aguardando(self, id_profissional=None, limite=20):
+        """Primeiras entradas na ordem de atendimento (todas, ou as visíveis a um profissional)."""
+        with self._lock:
+            entradas = [
+                entrada for entrada in self._entradas.values()
+                if id_profissional is None or entrada.id_profissional in (id_profissional, None)
+            ]
+        return heapq.nsmallest(limite, entradas, key=chave)
+
+    def __len__(self):
+        return len(self._entradas)
+
+    # --- Operações persistidas ---
+
+    def entrar(self, cursor, id_triagem, tipo_consulta=None, id_profissional=None):
+        """Coloca a triagem na fila usando o cursor (e a transação) de quem chama.
+
+        Retorna a EntradaFila; chame `adicionar` com ela depois do commit.
+        """
+        cursor.execute("""
+            WITH nova AS (
+                INSERT INTO fila (data, tipo_consulta, id_triagem, id_profissional, id_paciente)
+                SELECT CURRENT_DATE, %s, t.id_triagem, %s, t.id_paciente FROM triagem t WHERE t.id_triagem = %s
+                RETURNING *
+            ), vinculo AS (
+                INSERT INTO paciente_fila (id_paciente, id_fila) SELECT id_paciente, id_fila FROM nova
+            )
+            SELECT n.id_fila, n.id_triagem, n.id_paciente, p.nome, n.id_profissional,
+                   t.classificacao_de_prioridade, n.hora_entrada
+            FROM nova n
+            JOIN triagem t ON t.id_triagem = n.id_triagem
+            JOIN paciente p ON p.id_paciente = n.id_paciente
+        """, (tipo_consulta, id_profissional, id_triagem))
+        linha = cursor.fetchone()
+        return EntradaFila(*linha) if linha else None
+
+    def chamar_proximo(self, id_profissional):
+        """Retira e retorna o próximo paciente do profissional, registrando a chamada no banco.
+
+        Se outra sessão ou processo já chamou o candidato, ele é descartado e
+        o seguinte é tentado.
+        """
+        while True:
+            # A trava cobre só a escolha e o descarte; a conexão e o UPDATE ficam
+            # fora dela, e o WHERE hora_chamada IS NULL decide entre duas sessões
+            # que escolheram o mesmo candidato
+            entrada = self.proximo(id_profissional)
+            if entrada is None:
+                return None
+            with banco.conexao_psycopg() as con, con.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE fila SET hora_chamada = CURRENT_TIMESTAMP,
+                                    id_profissional = COALESCE(id_profissional, %s)
+                    WHERE id_fila = %s AND hora_chamada IS NULL
+                    RETURNING id_fila
+                """, (id_profissional, entrada.id_fila))
+                chamada = cursor.fetchone()
+                con.commit()
+            self.descartar(entrada.id_fila)
+            if chamada:
+                return entrada
+
+    # --- Sincronização com outras sessões/processos ---
+
+    def sincronizar(self, id_fila):
+        with banco.conexao_psycopg() as con, con.cursor() as cursor:
+            cursor.execute(SELECT_ENTRADAS + " AND f.id_fila = %s", (id_fila,))
+            linha = cursor.fetchone()
+        if linha:
+            self.adicionar(EntradaFila(*linha))
+        else:
+            self.descartar(id_fila)
+
+    def on_fila_alterada(self, evento):
+        operacao, id_fila = evento.dados["operacao"], evento.dados["id"]
+        if operacao == RESSINCRONIZAR:
+            self.carregar()
+        elif operacao == "DELETE":
+            self.descartar(id_fila)
+        else:
+            self.sincronizar(id_fila)
+
+    def on_triagem_alterada(self, evento):
+        # Mudança de prioridade na triagem reposiciona a entrada na fila
+        with self._lock:
+            id_fila = self._por_triagem.get(evento.dados["id"])
+        if id_fila is not None:
+            self.sincronizar(id_fila)
+
+_servico = FilaPrioridade()
+_lock_servico = threading.Lock()
+_assinado = False
+
+def obter_servico():
+    """Serviço de fila do processo, carregado do banco no primeiro uso.
+
+    Se o banco estiver fora do ar a fila começa vazia e a carga é tentada de
+    novo na próxima chamada.
+    """
+    global _assinado
+    with _lock_servico:
+        if not _assinado:
+            ouvinte.assinar("fila_alterada", _servico.on_fila_alterada)
+            ouvinte.assinar("triagem_alterada", _servico.on_triagem_alterada)
+            _assinado = True
+        if not _servico._carregada:
+            try:
+                _servico.carregar()
+            except Exception:
+                logger.exception("Não foi possível carregar a fila de atendimento")
+    return _servico
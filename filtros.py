@@ -0,0 +1,116 @@
+import datetime
+import os
+
+from sqlalchemy import and_, select
+
+import particoes
+import tabelas
+
+# Filtros das listagens de triagem e de consultas.
+#
+# As telas (triagem.py, consultas.py) e a exportação (exportacao.py) montam a
+# consulta por aqui, então o arquivo exportado tem exatamente as linhas que a
+# tela mostraria com os mesmos filtros.
+#
+# As telas abrem com a data inicial em inicio_recente(): Triagem e Consulta
+# são particionadas por mês (migração 012) e a listagem padrão lê só as
+# partições dos meses recentes. Limpar a data volta a olhar todo o histórico.
+
+# Meses anteriores ao atual incluídos na listagem padrão
+MESES_RECENTES = int(os.getenv("LISTAGEM_MESES_RECENTES") or 1)
+
+def inicio_recente(hoje=None):
+    """Data inicial padrão das listagens: primeiro dia de MESES_RECENTES meses atrás."""
+    return particoes.somar_meses(hoje or datetime.date.today(), -MESES_RECENTES)
+
+# Colunas da grade de triagem; {origem} é a tabela triagem ou uma CTE com as
+# linhas recém-gravadas, e {extras} colunas que só a tela usa (a versão)
+SELECT_TRIAGEM = """
+    SELECT
+        t.id_triagem AS "ID", p.nome AS "Paciente", prof.nome AS "Profissional",
+        t.classificacao_de_prioridade AS "Prioridade", t.descricao AS "Descrição",
+        t.data AS "Data e Hora"{extras}
+    FROM {origem} t
+    JOIN paciente p ON t.id_paciente = p.id_paciente
+    JOIN profissional prof ON t.id_profissional = prof.id_profissional
+    """
+
+def triagens(prioridade=None, data_inicio=None, data_fim=None):
+    """Condições (SQL com :parametros) e parâmetros do filtro de triagens.
+
+    `data_fim` é inclusiva: entra o dia inteiro.
+    """
+    condicoes, params = [], {}
+    if prioridade:
+        condicoes.append("t.classificacao_de_prioridade = :prioridade")
+        params["prioridade"] = prioridade
+    if data_inicio:
+        condicoes.append("t.data >= :data_inicio")
+        params["data_inicio"] = data_inicio
+    if data_fim:
+        condicoes.append("t.data < :data_fim")
+        params["data_fim"] = data_fim + datetime.timedelta(days=1)
+    return condicoes, params
+
+# Colunas da grade da tela de triagem: as da listagem mais a versão usada nas edições
+SELECT_GRADE_TRIAGEM = SELECT_TRIAGEM.format(origem="{origem}", extras=', t.versao AS "Versão"')
+
+def sql_pagina_triagens(prioridade=None, data_inicio=None, data_fim=None, ordem="DESC", apos=None, limite=50):
+    """Uma página da grade de triagem, com paginação por chave em (data, id_triagem).
+
+    `apos` é o cursor da última linha da página anterior. Pede uma linha a
+    mais que `limite`, para saber se há próxima página.
+    """
+    ordem = "ASC" if ordem == "ASC" else "DESC"
+    comparador = ">" if ordem == "ASC" else "<"
+    condicoes, params = triagens(prioridade, data_inicio, data_fim)
+    params["limite"] = limite + 1
+    if apos:
+        condicoes.append(f"(t.data, t.id_triagem) {comparador} (:cursor_data, :cursor_id)")
+        params["cursor_data"], params["cursor_id"] = apos
+    query = SELECT_GRADE_TRIAGEM.format(origem="triagem")
+    if condicoes:
+        query += " WHERE " + " AND ".join(condicoes)
+    query += f" ORDER BY t.data {ordem}, t.id_triagem {ordem} LIMIT :limite"
+    return query, params
+
+def sql_triagens(prioridade=None, data_inicio=None, data_fim=None, ordem="DESC"):
+    """Listagem completa de triagens com o filtro da tela, na ordem da tela."""
+    ordem = "ASC" if ordem == "ASC" else "DESC"
+    condicoes, params = triagens(prioridade, data_inicio, data_fim)
+    query = SELECT_TRIAGEM.format(origem="triagem", extras="")
+    if condicoes:
+        query += " WHERE " + " AND ".join(condicoes)
+    query += f" ORDER BY t.data {ordem}, t.id_triagem {ordem}"
+    return query, params
+
+def consultas(id_paciente=None, id_medico=None, data_inicio=None, data_fim=None, com_versao=False):
+    """Select da listagem de consultas com os filtros da tela (datas inclusivas).
+
+    `com_versao` acrescenta a versão da linha, usada pela tela ao gravar edições.
+    """
+    consulta, paciente, medico, profissional = tabelas.consulta, tabelas.paciente, tabelas.medico, tabelas.profissional
+    query = select(
+        consulta.c.id_consulta, paciente.c.id_paciente, paciente.c.nome.label("paciente_nome"),
+        medico.c.id_profissional.label("id_medico"), profissional.c.nome.label("medico_nome"),
+        consulta.c.data, consulta.c.hora_inicio, consulta.c.hora_fim, consulta.c.diagnostico
+    ).select_from(
+        consulta.join(paciente, consulta.c.id_paciente == paciente.c.id_paciente)
+        .join(medico, consulta.c.id_medico == medico.c.id_profissional)
+        .join(profissional, medico.c.id_profissional == profissional.c.id_profissional)
+    ).order_by(consulta.c.data.desc(), consulta.c.hora_inicio.desc(), consulta.c.id_consulta.desc())
+    if com_versao:
+        query = query.add_columns(consulta.c.versao)
+
+    condicoes = []
+    if id_paciente:
+        condicoes.append(consulta.c.id_paciente == id_paciente)
+    if id_medico:
+        condicoes.append(consulta.c.id_medico == id_medico)
+    if data_inicio:
+        condicoes.append(consulta.c.data >= data_inicio)
+    if data_fim:
+        condicoes.append(consulta.c.data <= data_fim)
+    if condicoes:
+        query = query.where(and_(*condicoes))
+    return query
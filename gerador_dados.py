@@ -0,0 +1,308 @@
+import argparse
+import datetime
+import pathlib
+import time
+
+import banco
+import migrar
+import particoes
+
+# Gerador determinístico de dados sintéticos para medir as telas em escala.
+#
+# Todo o volume é derivado do número de pacientes e gerado dentro do banco com
+# generate_series, seguindo a ordem das chaves estrangeiras de esquema.sql e
+# respeitando as restrições UNIQUE (CPF, RG, CRM, COREN). Os valores vêm de
+# fórmulas sobre o número da linha, então a mesma escala sempre gera os mesmos
+# dados.
+#
+# Os dados são sempre gerados num schema próprio, marcado na criação: gerar()
+# apaga as tabelas antes de inserir e se recusa a fazer isso em qualquer
+# schema que não tenha sido criado por preparar_schema(), como o da aplicação.
+#
+# Uso: python gerador_dados.py --pacientes 1000000 --schema bench
+
+ESQUEMA_SQL = pathlib.Path(__file__).parent / "esquema.sql"
+DATA_BASE = datetime.date(2025, 7, 31)
+# Comentário que identifica os schemas criados por preparar_schema()
+MARCA_SCHEMA = "gerador_dados"
+
+TABELAS = [
+    "Paciente_Fila", "Paciente_Assiste_Video", "Paciente_Recebe_Vacina", "Profissional_Gerencia_ItemEstoque",
+    "Prescricao", "Consulta_atestado", "Consulta", "Atestado", "Fila_triagem", "Fila", "Triagem", "Video", "Vacina", "Medicamento",
+    "Profissional_especializacao", "Paciente_Alergias", "Paciente_Telefones",
+    "TecnicoEnfermagem", "Enfermeiro", "Medico", "Movimento_estoque", "Saldo_estoque", "Item_estoque", "Profissional", "Paciente",
+]
+
+def volumes(pacientes):
+    """Quantidade de linhas de cada entidade para uma escala de pacientes."""
+    profissionais = max(pacientes // 200, 20)
+    return {
+        "pacientes": pacientes,
+        "profissionais": profissionais,
+        "medicos": profissionais * 2 // 5,
+        "enfermeiros": profissionais * 3 // 10,
+        "itens": max(pacientes // 20, 40),
+        "videos": 50,
+        "triagens": pacientes * 4,
+        "atestados": pacientes // 5,
+        "consultas": pacientes * 3,
+    }
+
+# Cada passo é (descrição, SQL). Os parâmetros vêm de volumes() + data_base.
+PASSOS = [
+    ("Paciente", """
+        INSERT INTO Paciente (nome, cpf, rg, data_nascimento, endereco_rua, endereco_numero,
+                              endereco_complemento, endereco_bairro, endereco_cidade, genero)
+        SELECT
+            (ARRAY['Ana', 'Bruno', 'Carlos', 'Daniela', 'Eduardo', 'Fernanda', 'Gustavo', 'Helena', 'Igor', 'Juliana',
+                   'Karla', 'Lucas', 'Marina', 'Nelson', 'Olga', 'Paulo', 'Raquel', 'Sérgio', 'Tânia', 'Vítor'])[1 + mod(i, 20)]
+            || ' ' || (ARRAY['Sousa', 'Costa', 'Lima', 'Alves', 'Martins', 'Rocha', 'Pereira', 'Gomes', 'Oliveira', 'Ferreira',
+                             'Santos', 'Nogueira', 'Azevedo', 'Barbosa', 'Cavalcante', 'Moura', 'Ribeiro', 'Teixeira', 'Vieira', 'Xavier'])[1 + mod(i / 20, 20)]
+            || ' ' || (ARRAY['Silva', 'Araújo', 'Batista', 'Carvalho', 'Dias', 'Freitas', 'Holanda', 'Leite', 'Macedo', 'Pinheiro'])[1 + mod(i / 400, 10)],
+            substr(d, 1, 3) || '.' || substr(d, 4, 3) || '.' || substr(d, 7, 3) || '-' || substr(d, 10, 2),
+            lpad(i::text, 13, '0'),
+            %(data_base)s::date - mod(i::bigint * 7919, 365 * 90)::int,
+            'Rua ' || (1 + mod(i, 400)),
+            (1 + mod(i * 31, 2000))::text,
+            CASE WHEN mod(i, 7) = 0 THEN 'Apto ' || (1 + mod(i, 300)) END,
+            (ARRAY['Centro', 'Junco', 'Campo Novo', 'Planalto Universitário', 'São João', 'Combate', 'Baviera',
+                   'Alto São Francisco', 'Campo Velho', 'Putiú', 'Jardim dos Monólitos', 'Cohab'])[1 + mod(i * 13, 12)],
+            (ARRAY['Quixadá', 'Quixeramobim', 'Ibicuitinga', 'Banabuiú', 'Choró'])[1 + mod(i / 7, 5)],
+            (ARRAY['Feminino', 'Masculino', 'Não Informado', 'Outro'])[1 + mod(i * 17, 4)]
+        FROM generate_series(1, %(pacientes)s) i, LATERAL (SELECT lpad(i::text, 11, '0') AS d) cpf
+    """),
+    ("Paciente_Telefones", """
+        INSERT INTO Paciente_Telefones (id_paciente, telefone)
+        SELECT i, '(88) 9' || lpad(i::text, 8, '0') FROM generate_series(1, %(pacientes)s) i
+        UNION ALL
+        SELECT i, '(88) 3' || lpad(i::text, 8, '0') FROM generate_series(3, %(pacientes)s, 3) i
+    """),
+    ("Paciente_Alergias", """
+        INSERT INTO Paciente_Alergias (id_paciente, alergia)
+        SELECT i, (ARRAY['Dipirona', 'Penicilina', 'Lactose', 'Amendoim', 'Frutos do mar', 'Látex'])[1 + mod(i / 5, 6)]
+        FROM generate_series(5, %(pacientes)s, 5) i
+    """),
+    ("Profissional", """
+        INSERT INTO Profissional (nome, cargo, cpf)
+        SELECT
+            CASE WHEN i <= %(medicos)s THEN 'Dr(a). ' WHEN i <= %(medicos)s + %(enfermeiros)s THEN 'Enf. ' ELSE 'Téc. ' END
+            || (ARRAY['Ricardo', 'Márcia', 'Flávio', 'Lúcia', 'Marcos', 'Sofia', 'Tiago', 'Beatriz', 'Rafael', 'Clara'])[1 + mod(i, 10)]
+            || ' ' || (ARRAY['Borges', 'Andrade', 'Mendes', 'Guimarães', 'Paulo', 'Rezende', 'Castro', 'Lopes'])[1 + mod(i / 10, 8)]
+            || ' ' || i,
+            CASE WHEN i <= %(medicos)s THEN 'Médico' WHEN i <= %(medicos)s + %(enfermeiros)s THEN 'Enfermeiro' ELSE 'Técnico de Enfermagem' END,
+            substr(d, 1, 3) || '.' || substr(d, 4, 3) || '.' || substr(d, 7, 3) || '-' || substr(d, 10, 2)
+        FROM generate_series(1, %(profissionais)s) i, LATERAL (SELECT lpad((90000000000 + i)::text, 11, '0') AS d) cpf
+    """),
+    ("Medico", """
+        INSERT INTO Medico (id_profissional, crm)
+        SELECT i, 'CRM-CE ' || lpad(i::text, 6, '0') FROM generate_series(1, %(medicos)s) i
+    """),
+    ("Enfermeiro", """
+        INSERT INTO Enfermeiro (id_profissional, coren)
+        SELECT i, 'COREN-CE ' || lpad(i::text, 6, '0')
+        FROM generate_series(%(medicos)s + 1, %(medicos)s + %(enfermeiros)s) i
+    """),
+    ("TecnicoEnfermagem", """
+        INSERT INTO TecnicoEnfermagem (id_profissional, coren)
+        SELECT i, 'COREN-CE TE ' || lpad(i::text, 6, '0')
+        FROM generate_series(%(medicos)s + %(enfermeiros)s + 1, %(profissionais)s) i
+    """),
+    ("Profissional_especializacao", """
+        INSERT INTO Profissional_especializacao (id_profissional, especializacao)
+        SELECT i, (ARRAY['Clínica Geral', 'Cardiologia', 'Pediatria', 'Dermatologia', 'Ginecologia', 'Psiquiatria'])[1 + mod(i, 6)]
+        FROM generate_series(1, %(medicos)s) i
+    """),
+    # A cada 5 itens, 1 é vacina; os demais são medicamentos. Vários lotes por nome.
+    ("Item_estoque", """
+        INSERT INTO Item_estoque (nome, data_fabricacao, data_validade, lote, fabricante)
+        SELECT
+            CASE WHEN mod(i, 5) = 0
+                THEN (ARRAY['Vacina COVID-19 (frasco)', 'Vacina Gripe (Influenza - frasco)', 'Vacina Sarampo (Tríplice - frasco)',
+                            'Vacina Febre Amarela (frasco)', 'Vacina HPV (frasco)', 'Vacina Hepatite B (frasco)',
+                            'Vacina Tétano (dT - frasco)', 'Vacina Pneumocócica (frasco)'])[1 + mod(i / 5, 8)]
+                ELSE (ARRAY['Dipirona 500mg (caixa)', 'Amoxicilina 500mg (caixa)', 'Paracetamol 750mg (caixa)', 'Ibuprofeno 600mg (caixa)',
+                            'Losartana 50mg (caixa)', 'Omeprazol 20mg (caixa)', 'Nimesulida 100mg (caixa)', 'Captopril 25mg (caixa)',
+                            'Metformina 850mg (caixa)', 'Sinvastatina 20mg (caixa)', 'Seringa Descartável 5ml (caixa)', 'Gaze Estéril (pacote)'])[1 + mod(i, 12)]
+            END,
+            %(data_base)s::date + mod(i * 31, 900) - 90 - 730,
+            %(data_base)s::date + mod(i * 31, 900) - 90,
+            'L' || lpad(i::text, 8, '0'),
+            (ARRAY['Medley', 'EMS', 'Neo Química', 'Aché', 'Eurofarma', 'Butantan', 'Fiocruz', 'Pfizer'])[1 + mod(i, 8)]
+        FROM generate_series(1, %(itens)s) i
+    """),
+    ("Vacina", """
+        INSERT INTO Vacina (tipo, id_itemestoque)
+        SELECT (ARRAY['COVID-19', 'Influenza', 'Tríplice Viral', 'Febre Amarela', 'HPV', 'Hepatite B', 'dT', 'Pneumocócica'])[1 + mod(i / 5, 8)], i
+        FROM generate_series(5, %(itens)s, 5) i
+    """),
+    ("Medicamento", """
+        INSERT INTO Medicamento (id_itemestoque)
+        SELECT i FROM generate_series(1, %(itens)s) i WHERE mod(i, 5) <> 0
+    """),
+    ("Profissional_Gerencia_ItemEstoque", """
+        INSERT INTO Profissional_Gerencia_ItemEstoque (id_profissional, id_itemestoque)
+        SELECT %(medicos)s + 1 + mod(i, %(profissionais)s - %(medicos)s), i FROM generate_series(1, %(itens)s) i
+    """),
+    # Entrada inicial de cada lote; o saldo é mantido pela trigger da migração 006
+    ("Movimento_estoque", """
+        INSERT INTO Movimento_estoque (id_itemestoque, tipo, quantidade, data, observacao)
+        SELECT i, 'entrada', 50 + mod(i * 37, 451), %(data_base)s::date + mod(i * 31, 900) - 90 - 720, 'Carga inicial'
+        FROM generate_series(1, %(itens)s) i
+    """),
+    ("Video", """
+        INSERT INTO Video (titulo, descricao, categoria, id_profissional)
+        SELECT 'Vídeo educativo ' || i, 'Orientações de saúde ' || i,
+               (ARRAY['Prevenção', 'Vacinação', 'Alimentação', 'Saúde Mental', 'Primeiros Socorros'])[1 + mod(i, 5)],
+               1 + mod(i, %(profissionais)s)
+        FROM generate_series(1, %(videos)s) i
+    """),
+    # Triagens espalhadas uniformemente pelos 730 dias anteriores à data base
+    ("Triagem", """
+        INSERT INTO Triagem (data, descricao, classificacao_de_prioridade, id_paciente, id_profissional)
+        SELECT
+            %(data_base)s::timestamp + INTERVAL '1 day' - (%(triagens)s - i + 1) * (INTERVAL '730 days' / %(triagens)s),
+            (ARRAY['Febre e dor no corpo', 'Dor de cabeça', 'Dor abdominal', 'Tosse persistente', 'Pressão alta',
+                   'Corte superficial', 'Falta de ar', 'Reação alérgica'])[1 + mod(i, 8)],
+            CASE
+                WHEN mod(i * 31, 100) < 5 THEN 'Vermelho (Emergência)'
+                WHEN mod(i * 31, 100) < 25 THEN 'Amarelo (Urgente)'
+                WHEN mod(i * 31, 100) < 80 THEN 'Verde (Não Urgente)'
+                ELSE 'Azul (Eletivo)'
+            END,
+            1 + mod(i::bigint * 7919, %(pacientes)s),
+            %(medicos)s + 1 + mod(i, %(profissionais)s - %(medicos)s)
+        FROM generate_series(1, %(triagens)s) i
+    """),
+    # 80% das triagens entram na fila, 5 minutos depois; as do último dia ainda aguardam chamada
+    ("Fila", """
+        INSERT INTO Fila (hora_entrada, data, tipo_consulta, id_triagem, id_profissional, id_paciente, hora_chamada)
+        SELECT t.data + INTERVAL '5 minutes', (t.data + INTERVAL '5 minutes')::date,
+               (ARRAY['Clínica Geral', 'Cardiologia', 'Pediatria', 'Dermatologia'])[1 + mod(t.id_triagem, 4)],
+               t.id_triagem, 1 + mod(t.id_triagem, %(medicos)s), t.id_paciente,
+               CASE WHEN t.data < %(data_base)s::date
+                    THEN t.data + (15 + mod(t.id_triagem * 13, 60)) * INTERVAL '1 minute' END
+        FROM Triagem t
+        WHERE mod(t.id_triagem, 5) <> 0
+        ORDER BY t.id_triagem
+    """),
+    ("Paciente_Fila", """
+        INSERT INTO Paciente_Fila (id_paciente, id_fila) SELECT id_paciente, id_fila FROM Fila
+    """),
+    # Atestado i e Consulta i vêm da entrada de fila i (mesmo paciente, médico e dia)
+    ("Atestado", """
+        INSERT INTO Atestado (data, descricao, periodo_afastamento, id_paciente, id_medico)
+        SELECT f.data, 'Afastamento por motivo de saúde', (1 + mod(f.id_fila, 7)) || ' dias', f.id_paciente, f.id_profissional
+        FROM Fila f WHERE f.id_fila <= %(atestados)s ORDER BY f.id_fila
+    """),
+    ("Consulta", """
+        INSERT INTO Consulta (data, hora_inicio, hora_fim, diagnostico, id_paciente, id_medico, id_atestado)
+        SELECT f.data, inicio, inicio + INTERVAL '20 minutes',
+               (ARRAY['Virose comum', 'Enxaqueca tensional', 'Crise hipertensiva', 'Gastroenterite viral',
+                      'Infecção urinária', 'Rinite alérgica', 'Lombalgia', 'Check-up de rotina'])[1 + mod(f.id_fila, 8)],
+               f.id_paciente, f.id_profissional,
+               CASE WHEN f.id_fila <= %(atestados)s THEN f.id_fila END
+        FROM Fila f, LATERAL (SELECT LEAST(f.hora_entrada::time, TIME '20:00') + mod(f.id_fila * 37, 180) * INTERVAL '1 minute' AS inicio) h
+        WHERE f.id_fila <= %(consultas)s
+        ORDER BY f.id_fila
+    """),
+    # Metade das consultas tem prescrição; um terço dessas, dois medicamentos
+    ("Prescricao", """
+        INSERT INTO Prescricao (id_consulta, id_medicamento, dosagem, frequencia)
+        SELECT c.id_consulta, 1 + mod(c.id_consulta * 13 + k, m.total),
+               (ARRAY['1 comprimido', '2 comprimidos', '10 ml', '1 cápsula'])[1 + mod(c.id_consulta + k, 4)],
+               (ARRAY['de 6 em 6 horas', 'de 8 em 8 horas', 'de 12 em 12 horas', 'diariamente pela manhã'])[1 + mod(c.id_consulta, 4)]
+        FROM Consulta c
+        CROSS JOIN (SELECT count(*) AS total FROM Medicamento) m
+        CROSS JOIN LATERAL generate_series(0, CASE WHEN mod(c.id_consulta, 6) = 0 THEN 1 ELSE 0 END) k
+        WHERE mod(c.id_consulta, 2) = 0
+    """),
+    ("Paciente_Recebe_Vacina", """
+        INSERT INTO Paciente_Recebe_Vacina (id_paciente, id_vacina, id_profissional, data_aplicacao)
+        SELECT i, 1 + mod(i * 3 + k, v.total),
+               %(medicos)s + 1 + mod(i + k, %(profissionais)s - %(medicos)s),
+               %(data_base)s::date - mod(i * 11 + k * 97, 730)
+        FROM generate_series(1, %(pacientes)s) i
+        CROSS JOIN (SELECT count(*) AS total FROM Vacina) v
+        CROSS JOIN generate_series(0, 1) k
+    """),
+    ("Paciente_Assiste_Video", """
+        INSERT INTO Paciente_Assiste_Video (id_paciente, id_video, data_visualizacao)
+        SELECT i, 1 + mod(i, %(videos)s), %(data_base)s::timestamp - mod(i, 365) * INTERVAL '1 day'
+        FROM generate_series(4, %(pacientes)s, 4) i
+    """),
+]
+
+def _marca(cursor, schema):
+    """(existe, marcado): se `schema` existe e se foi criado por preparar_schema()."""
+    cursor.execute("SELECT obj_description(oid, 'pg_namespace') FROM pg_namespace WHERE nspname = %s", (schema,))
+    linha = cursor.fetchone()
+    return linha is not None, linha is not None and linha[0] == MARCA_SCHEMA
+
+def preparar_schema(con, schema, recriar=False):
+    """Cria (ou recria) `schema` com esquema.sql + migrações e aponta o search_path para ele.
+
+    Um schema que já existe só é aproveitado se foi criado aqui antes.
+    """
+    with con.cursor() as cursor:
+        existe, marcado = _marca(cursor, schema)
+        if existe and not marcado:
+            raise RuntimeError(f"O schema {schema} já existe e não foi criado pelo gerador_dados; "
+                               "use outro nome")
+        if existe and recriar:
+            cursor.execute(f"DROP SCHEMA {schema} CASCADE")
+        if recriar or not existe:
+            cursor.execute(f"CREATE SCHEMA {schema}")
+            cursor.execute(f"COMMENT ON SCHEMA {schema} IS '{MARCA_SCHEMA}'")
+        cursor.execute(f"SET search_path TO {schema}, public")
+        cursor.execute("SELECT to_regclass('paciente') IS NOT NULL")
+        if not cursor.fetchone()[0]:
+            cursor.execute(ESQUEMA_SQL.read_text(encoding="utf-8"))
+    con.commit()
+    migrar.aplicar_pendentes(con)
+
+def gerar(con, schema, pacientes, data_base=DATA_BASE, verbose=False):
+    """Apaga os dados das tabelas de `schema` e gera a escala pedida.
+
+    `schema` tem de ter sido criado por preparar_schema(), que também aponta
+    o search_path para ele. Retorna {tabela: segundos gastos}.
+    """
+    params = dict(volumes(pacientes), data_base=data_base)
+    tempos = {}
+    with con.cursor() as cursor:
+        if not _marca(cursor, schema)[1]:
+            raise RuntimeError(f"O schema {schema} não foi criado pelo gerador_dados; nada foi apagado")
+        cursor.execute(f"TRUNCATE {', '.join(f'{schema}.{tabela}' for tabela in TABELAS)} RESTART IDENTITY CASCADE")
+        # Partições mensais (migração 012) para os dois anos gerados, antes das inserções
+        for tabela in particoes.TABELAS:
+            cursor.execute("SELECT criar_particoes_mensais(%s, %s::date - 731, %s::date + 1)",
+                           (f"{schema}.{tabela}", data_base, data_base))
+        for tabela, sql in PASSOS:
+            inicio = time.perf_counter()
+            cursor.execute(sql, params)
+            tempos[tabela] = time.perf_counter() - inicio
+            if verbose:
+                print(f"{tabela:<36} {cursor.rowcount:>12,} linhas  {tempos[tabela]:8.2f}s")
+        cursor.execute("ANALYZE")
+    con.commit()
+    return tempos
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera dados sintéticos determinísticos.")
+    parser.add_argument("--pacientes", type=int, default=100000)
+    parser.add_argument("--schema", required=True,
+                        help="schema onde gerar; é criado se não existe e tem os dados apagados a cada execução")
+    parser.add_argument("--data-base", type=datetime.date.fromisoformat, default=DATA_BASE,
+                        help="data mais recente dos registros gerados (AAAA-MM-DD)")
+    args = parser.parse_args()
+
+    with banco.conexao_psycopg() as con:
+        preparar_schema(con, args.schema)
+        inicio = time.perf_counter()
+        gerar(con, args.schema, args.pacientes, args.data_base, verbose=True)
+        with con.cursor() as cursor:
+            cursor.execute("RESET search_path")
+        con.commit()
+    print(f"Concluído em {time.perf_counter() - inicio:.1f}s")
+
+if __name__ == "__main__":
+    main()
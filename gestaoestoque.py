@@ -1,40 +1,14 @@
-import os
-from dotenv import load_dotenv
-
 import pandas as pd
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 import panel as pn
 pn.extension()
 
-# Carrega variáveis de ambiente do arquivo .env
-load_dotenv()
-
-HOST = os.getenv("DB_HOST")
-PORT = os.getenv("DB_PORT")
-if PORT is None or PORT == '':
-    PORT = 5432
-else:
-    PORT = int(PORT)
-
-DBNAME = os.getenv("DB_NAME")
-USER = os.getenv("DB_USER")
-PASSWORD = os.getenv("DB_PASS")
-
-# Cria engine para conexão
-engine = create_engine(f"postgresql+psycopg2://{USER}:{PASSWORD}@{HOST}:{PORT}/{DBNAME}")
-
-# Cria a tabela Item_estoque se não existir
-create_table_sql = text("""
-CREATE TABLE IF NOT EXISTS Item_estoque (
-    nome VARCHAR(200),
-    data_fabricacao DATE,
-    data_validade DATE,
-    lote VARCHAR(100),
-    fabricante VARCHAR(100)
-)
-""")
-with engine.begin() as conn:
-    conn.execute(create_table_sql)
+import banco
+import estoque
+import instrumentacao
+from tarefas import em_thread, carregando
+
+instrumentacao.servir_metricas("gestaoestoque")
 
 # Widgets para inserção
 nome = pn.widgets.TextInput(name="Nome")
@@ -42,6 +16,7 @@ data_fabricacao = pn.widgets.DatePicker(name="Data de Fabricação")
 data_validade = pn.widgets.DatePicker(name="Data de Validade")
 lote = pn.widgets.TextInput(name="Lote")
 fabricante = pn.widgets.TextInput(name="Fabricante")
+quantidade = pn.widgets.IntInput(name="Quantidade recebida", value=0, start=0)
 botao_inserir = pn.widgets.Button(name="Inserir", button_type="primary")
 
 # Widgets para busca e remoção
@@ -51,98 +26,176 @@ botao_buscar = pn.widgets.Button(name="Buscar", button_type="primary")
 remover_nome = pn.widgets.TextInput(name="Remover vacina pelo nome exato")
 botao_remover = pn.widgets.Button(name="Remover", button_type="danger")
 
+# Widgets de movimentação (ver estoque.py)
+mov_id_item = pn.widgets.IntInput(name="ID do lote", value=None)
+mov_tipo = pn.widgets.Select(name="Movimento", options={"Entrada": "entrada", "Perda": "perda"})
+mov_quantidade = pn.widgets.IntInput(name="Quantidade", value=1, start=1)
+botao_movimentar = pn.widgets.Button(name="Registrar movimento", button_type="primary")
+
+disp_id_consulta = pn.widgets.IntInput(name="ID da consulta", value=None)
+disp_id_medicamento = pn.widgets.IntInput(name="ID do medicamento", value=None)
+disp_quantidade = pn.widgets.IntInput(name="Quantidade", value=1, start=1)
+botao_dispensar = pn.widgets.Button(name="Dispensar prescrição", button_type="success")
+
+# Widgets do painel de validade (lidos só do resumo, ver estoque.py)
+faixa_validade = pn.widgets.Select(
+    name="Vencendo em", value=30,
+    options={"7 dias": 7, "30 dias": 30, "90 dias": 90, "Vencidos com saldo": 0},
+)
+resumo_validade = pn.pane.Markdown("")
+painel_validade = pn.pane.DataFrame(pd.DataFrame(), width=1000, height=250)
+
 # Feedback
 status = pn.pane.Markdown("")
 
 # Painel da tabela
 painel_tabela = pn.pane.DataFrame(pd.DataFrame(), width=1000, height=300)
 
+def ler_itens(filtro_nome=None):
+    query, params = estoque.sql_itens(filtro_nome)
+    with banco.conexao() as conn:
+        return pd.read_sql(text(query), conn, params=params)
+
 # Função para atualizar painel da tabela lendo do banco
-def atualizar_tabela(filtro_nome=None):
-    query = "SELECT * FROM Item_estoque"
-    params = {}
-    if filtro_nome:
-        query += " WHERE nome ILIKE :nome"
-        params["nome"] = f"%{filtro_nome}%"
-    query += " ORDER BY nome ASC"
-    df = pd.read_sql(text(query), engine, params=params)
-    painel_tabela.object = df
-
-# Inicializa com todos os dados
-atualizar_tabela()
+async def atualizar_tabela(filtro_nome=None):
+    with carregando(painel_tabela):
+        painel_tabela.object = await em_thread(ler_itens, filtro_nome)
+
+def ler_validade(dias):
+    return estoque.resumo_validade(), estoque.itens_a_vencer(dias)
+
+# Função para atualizar o painel de validade
+async def atualizar_validade(event=None):
+    with carregando(painel_validade):
+        contagens, itens = await em_thread(ler_validade, faixa_validade.value)
+    rotulos = {7: "até 7 dias", 30: "até 30 dias", 90: "até 90 dias", 0: "vencidos"}
+    resumo_validade.object = " · ".join(
+        f"**{rotulos[faixa]}**: {lotes} lote(s), {unidades} unidade(s)"
+        for faixa, (lotes, unidades) in contagens.items()
+    )
+    painel_validade.object = itens
+
+# Carrega os dados depois que a página é entregue ao navegador
+pn.state.onload(atualizar_tabela)
+pn.state.onload(atualizar_validade)
 
 # Função para inserir dados
-def inserir_item(event):
+async def inserir_item(event):
     if not all([nome.value, data_fabricacao.value, data_validade.value, lote.value, fabricante.value]):
         status.object = "❌ Preencha todos os campos antes de inserir."
         return
     try:
-        insert_sql = text("""
-            INSERT INTO Item_estoque (nome, data_fabricacao, data_validade, lote, fabricante)
-            VALUES (:nome, :data_fabricacao, :data_validade, :lote, :fabricante)
-        """)
-        with engine.begin() as conn:
-            conn.execute(insert_sql, {
-                "nome": nome.value,
-                "data_fabricacao": data_fabricacao.value,
-                "data_validade": data_validade.value,
-                "lote": lote.value,
-                "fabricante": fabricante.value
-            })
+        with carregando(botao_inserir):
+            await em_thread(
+                estoque.cadastrar_lote, nome.value, data_fabricacao.value, data_validade.value,
+                lote.value, fabricante.value, quantidade.value or 0,
+            )
         status.object = "✅ Item inserido com sucesso!"
-        atualizar_tabela()
+        await atualizar_tabela()
+        await atualizar_validade()
         # Limpa os campos
         nome.value = ""
         data_fabricacao.value = None
         data_validade.value = None
         lote.value = ""
         fabricante.value = ""
+        quantidade.value = 0
     except Exception as e:
         status.object = f"❌ Erro ao inserir: {e}"
 
 # Função para buscar por nome
-def buscar_item(event):
+async def buscar_item(event):
     filtro = busca_nome.value.strip()
-    atualizar_tabela(filtro_nome=filtro)
+    await atualizar_tabela(filtro_nome=filtro)
     status.object = f"🔎 Exibindo resultados para: '{filtro}'" if filtro else "🔎 Exibindo todos os itens."
 
 # Função para remover item por nome exato
-def remover_item(event):
+async def remover_item(event):
     nome_remover = remover_nome.value.strip()
     if not nome_remover:
         status.object = "❌ Informe o nome exato da vacina para remover."
         return
     try:
-        delete_sql = text("DELETE FROM Item_estoque WHERE nome = :nome")
-        with engine.begin() as conn:
-            result = conn.execute(delete_sql, {"nome": nome_remover})
-        if result.rowcount > 0:
+        with carregando(botao_remover):
+            removidos = await em_thread(estoque.remover_produto, nome_remover)
+        if removidos > 0:
             status.object = f"🗑️ Vacina '{nome_remover}' removida com sucesso."
         else:
             status.object = f"⚠️ Vacina '{nome_remover}' não encontrada."
-        atualizar_tabela()
+        await atualizar_tabela()
+        await atualizar_validade()
         remover_nome.value = ""
+    except estoque.LoteComHistorico as e:
+        status.object = f"⚠️ {e}"
     except Exception as e:
         status.object = f"❌ Erro ao remover: {e}"
 
+# Função para registrar entrada ou perda em um lote
+async def movimentar_item(event):
+    if not mov_id_item.value or not mov_quantidade.value:
+        status.object = "❌ Informe o lote e a quantidade."
+        return
+    registrar = estoque.receber if mov_tipo.value == "entrada" else estoque.registrar_perda
+    try:
+        with carregando(botao_movimentar):
+            await em_thread(registrar, mov_id_item.value, mov_quantidade.value)
+        status.object = f"✅ Movimento registrado no lote {mov_id_item.value}."
+        await atualizar_tabela()
+        await atualizar_validade()
+    except estoque.EstoqueInsuficiente as e:
+        status.object = f"⚠️ {e}"
+    except Exception as e:
+        status.object = f"❌ Erro ao registrar movimento: {e}"
+
+# Função para dispensar uma prescrição pelos lotes que vencem primeiro
+async def dispensar_prescricao(event):
+    if not all([disp_id_consulta.value, disp_id_medicamento.value, disp_quantidade.value]):
+        status.object = "❌ Informe consulta, medicamento e quantidade."
+        return
+    try:
+        with carregando(botao_dispensar):
+            retiradas = await em_thread(
+                estoque.dispensar, disp_id_consulta.value, disp_id_medicamento.value, disp_quantidade.value
+            )
+        lotes = ", ".join(f"{qtd} do lote {lote_item}" for _id, lote_item, qtd in retiradas)
+        status.object = f"✅ Dispensado: {lotes}."
+        await atualizar_tabela()
+        await atualizar_validade()
+    except estoque.EstoqueInsuficiente as e:
+        status.object = f"⚠️ {e}"
+    except Exception as e:
+        status.object = f"❌ Erro ao dispensar: {e}"
+
 # Conecta botões às funções
 botao_inserir.on_click(inserir_item)
 botao_buscar.on_click(buscar_item)
 botao_remover.on_click(remover_item)
+botao_movimentar.on_click(movimentar_item)
+botao_dispensar.on_click(dispensar_prescricao)
+faixa_validade.param.watch(atualizar_validade, "value")
 
 # Layout completo
 layout = pn.Column(
     "## 💉 Estoque de Vacinas e Medicamentos",
     pn.Row(nome, lote),
-    pn.Row(fabricante),
+    pn.Row(fabricante, quantidade),
     pn.Row(data_fabricacao, data_validade),
     botao_inserir,
     pn.Spacer(height=10),
     pn.Row(busca_nome, botao_buscar),
     pn.Row(remover_nome, botao_remover),
+    pn.Spacer(height=10),
+    "### Movimentação",
+    pn.Row(mov_id_item, mov_tipo, mov_quantidade, botao_movimentar),
+    pn.Row(disp_id_consulta, disp_id_medicamento, disp_quantidade, botao_dispensar),
     status,
     pn.Spacer(height=20),
-    painel_tabela
+    painel_tabela,
+    pn.Spacer(height=20),
+    "### ⏳ Validade",
+    faixa_validade,
+    resumo_validade,
+    painel_validade,
 )
 
 layout.servable()
@@ -0,0 +1,209 @@
+import datetime
+import io
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from bokeh.models.widgets.tables import DateFormatter
+from sqlalchemy import text
+
+import instrumentacao
+
+# Conversão dos resultados de consulta para as grades (Tabulator) das telas.
+#
+# O DataFrame é montado coluna a coluna a partir do fetchall(), e as colunas
+# de data e hora mantêm dtype datetime64 (TIME vira datetime64 em 1970-01-01,
+# já que o pandas não tem um tipo só de hora). A formatação para exibição fica
+# no navegador, com os formatadores abaixo no `formatters` do Tabulator.
+# Nenhuma listagem converte valor por valor para texto no servidor, e os
+# formulários leem as datas e horas da grade sem precisar reinterpretar texto.
+#
+# Com GRADE_TRANSPORTE=arrow (e o pacote pyarrow instalado) ler() nem chega a
+# montar tuplas: a consulta vira um COPY (...) TO STDOUT, que o leitor CSV do
+# pyarrow converte em lotes colunares (record batches) já com os tipos das
+# colunas no PostgreSQL, à medida que o COPY chega. Os textos e os NUMERIC
+# do DataFrame ficam em memória Arrow (pd.ArrowDtype).
+
+DATA = DateFormatter(format="%d/%m/%Y")
+DATA_HORA = DateFormatter(format="%d/%m/%Y %H:%M")
+HORA = DateFormatter(format="%H:%M")
+
+# "linhas" (fetchall) ou "arrow" (COPY lido pelo pyarrow)
+TRANSPORTE = os.getenv("GRADE_TRANSPORTE") or "linhas"
+
+_NAT = np.iinfo(np.int64).min
+
+def _microssegundos(hora):
+    return ((hora.hour * 60 + hora.minute) * 60 + hora.second) * 1_000_000 + hora.microsecond
+
+def _coluna(valores):
+    """Array de uma coluna, com o dtype escolhido pelo primeiro valor não nulo."""
+    amostra = next((valor for valor in valores if valor is not None), None)
+    if isinstance(amostra, datetime.datetime):
+        if amostra.tzinfo is not None:
+            return pd.to_datetime(valores, utc=True)
+        return np.array(valores, dtype="datetime64[us]")
+    if isinstance(amostra, datetime.date):
+        return np.array(valores, dtype="datetime64[D]").astype("datetime64[s]")
+    if isinstance(amostra, datetime.time):
+        return np.fromiter((_NAT if valor is None else _microssegundos(valor) for valor in valores),
+                           dtype=np.int64, count=len(valores)).view("datetime64[us]")
+    return list(valores)
+
+def dataframe(linhas, colunas):
+    """DataFrame das linhas de um fetchall(), montado coluna a coluna."""
+    if not linhas:
+        return pd.DataFrame(columns=colunas)
+    return pd.DataFrame({nome: _coluna(valores) for nome, valores in zip(colunas, zip(*linhas))})
+
+def de_cursor(cursor):
+    """DataFrame com o restante do resultado de um cursor psycopg2."""
+    return dataframe(cursor.fetchall(), [coluna.name for coluna in cursor.description])
+
+def de_resultado(resultado):
+    """DataFrame de um Result do SQLAlchemy."""
+    return dataframe(resultado.fetchall(), list(resultado.keys()))
+
+def ler(conn, query, params=None, transporte=None):
+    """Executa `query` (texto SQL com :parametros ou select do SQLAlchemy) e devolve o DataFrame.
+
+    `transporte` sobrepõe GRADE_TRANSPORTE; sem pyarrow o transporte é
+    sempre por linhas.
+    """
+    query = text(query) if isinstance(query, str) else query
+    if (transporte or TRANSPORTE) == "arrow" and arrow_disponivel():
+        return _ler_arrow(conn, query, params)
+    return de_resultado(conn.execute(query, params or {}))
+
+def hora(valor):
+    """datetime.time de uma célula de hora da grade (None se vazia)."""
+    return None if pd.isna(valor) else pd.Timestamp(valor).time()
+
+def data(valor):
+    """datetime.date de uma célula de data da grade (None se vazia)."""
+    return None if pd.isna(valor) else pd.Timestamp(valor).date()
+
+
+# --- Transporte em Arrow ---
+
+# OID do tipo no PostgreSQL -> nome do tipo no pyarrow; os demais chegam como texto
+_TIPOS_ARROW = {
+    16: "bool_", 20: "int64", 21: "int64", 23: "int64",
+    700: "float64", 701: "float64",
+    1082: "date32", 1114: "timestamp", 1184: "timestamp",
+}
+_OID_TIME = 1083
+_OID_NUMERIC = 1700
+
+def arrow_disponivel():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def tipo_arrow(pa, oid, precisao=None, escala=None):
+    """Tipo pyarrow de uma coluna pelo OID do PostgreSQL (texto para os não mapeados).
+
+    NUMERIC não passa por float: vira decimal128 quando a coluna declara a
+    precisão (o cursor a informa) e texto quando não declara.
+    """
+    if oid == _OID_TIME:
+        return pa.time64("us")
+    if oid == _OID_NUMERIC:
+        if precisao and precisao <= 38:
+            return pa.decimal128(precisao, escala or 0)
+        return pa.string()
+    if oid not in _TIPOS_ARROW:
+        return pa.string()
+    nome = _TIPOS_ARROW[oid]
+    if nome == "timestamp":
+        return pa.timestamp("us", tz="UTC") if oid == 1184 else pa.timestamp("us")
+    return getattr(pa, nome)()
+
+def sql_literal(dialect, cursor, query, params=None):
+    """O SQL da consulta com os parâmetros já embutidos (o COPY não aceita parâmetros)."""
+    query = text(query) if isinstance(query, str) else query
+    compilado = query.compile(dialect=dialect)
+    valores = dict(compilado.params)
+    valores.update(params or {})
+    return cursor.mogrify(str(compilado), valores).decode("utf-8")
+
+def _tipo_pandas(tipo):
+    # Datas e horas continuam datetime64 (os formatadores da grade contam com
+    # isso); textos e decimais ficam na memória Arrow, sem virar objetos Python
+    import pyarrow as pa
+    if pa.types.is_string(tipo) or pa.types.is_decimal(tipo):
+        return pd.ArrowDtype(tipo)
+    return None
+
+def _copiar(cursor, sql, destino, erro):
+    # Roda numa thread: o COPY escreve no cano enquanto o pyarrow lê do outro lado
+    try:
+        cursor.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv)", destino)
+    except BaseException as e:
+        erro.append(e)
+    finally:
+        try:
+            destino.close()
+        except OSError:
+            pass  # o leitor desistiu e fechou a outra ponta
+
+def _ler_arrow(conn, query, params):
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+
+    inicio = time.perf_counter()
+    with conn.connection.dbapi_connection.cursor() as cursor:
+        sql = sql_literal(conn.dialect, cursor, query, params)
+        cursor.execute(f"SELECT * FROM ({sql}) consulta LIMIT 0")
+        colunas = [(coluna.name, tipo_arrow(pa, coluna.type_code, coluna.precision, coluna.scale))
+                   for coluna in cursor.description]
+        nomes = [nome for nome, _ in colunas]
+
+        # O resultado do COPY nunca fica inteiro num buffer: passa por um cano
+        # e o leitor CSV do pyarrow converte um bloco de cada vez em lote colunar
+        leitura, escrita = os.pipe()
+        entrada = io.open(leitura, "rb")
+        erro = []
+        copia = threading.Thread(target=_copiar, args=(cursor, sql, io.open(escrita, "wb"), erro), daemon=True)
+        copia.start()
+        lido = False
+        try:
+            if not entrada.peek(1):
+                lotes = []
+            else:
+                leitor = pa_csv.open_csv(
+                    entrada,
+                    read_options=pa_csv.ReadOptions(column_names=nomes),
+                    convert_options=pa_csv.ConvertOptions(
+                        column_types=dict(colunas),
+                        # No CSV do COPY o nulo é o campo vazio sem aspas; "" é texto vazio
+                        strings_can_be_null=True, quoted_strings_can_be_null=False,
+                        true_values=["t"], false_values=["f"],
+                    ),
+                )
+                lotes = list(leitor)
+            lido = True
+        finally:
+            entrada.close()
+            copia.join()
+            if not lido:
+                # O leitor desistiu no meio: a conexão pode ter ficado dentro do COPY
+                conn.invalidate()
+            # Um COPY que falhou chega ao leitor como CSV truncado; o erro dele é o que
+            # importa. O cano quebrado é só efeito do leitor ter fechado: vale o erro dele
+            if erro and (lido or not isinstance(erro[0], BrokenPipeError)):
+                raise erro[0]
+
+    tabela = pa.Table.from_batches(lotes, schema=pa.schema(colunas))
+    for indice, (nome, tipo) in enumerate(colunas):
+        if pa.types.is_time(tipo):
+            # TIME vira datetime64 em 1970-01-01, como no transporte por linhas
+            micros = tabela.column(indice).cast(pa.int64())
+            tabela = tabela.set_column(indice, nome, micros.cast(pa.timestamp("us")))
+    df = tabela.to_pandas(date_as_object=False, types_mapper=_tipo_pandas)
+    instrumentacao.registrar(sql, time.perf_counter() - inicio, len(df))
+    return df
@@ -0,0 +1,106 @@
+import pandas as pd
+import panel as pn
+
+import busca
+import grade
+import instrumentacao
+from linha_do_tempo import COLUNAS, EVENTOS, linha_do_tempo
+from tarefas import em_thread, carregando
+
+pn.extension("tabulator", notifications=True, sizing_mode="stretch_width")
+
+instrumentacao.servir_metricas("historico")
+
+# Histórico do paciente: a linha do tempo de linha_do_tempo.py, uma página por
+# vez. "Carregar mais" busca a próxima página pelo cursor e a acrescenta à
+# tabela, sem reler as anteriores.
+
+TAMANHO_PAGINA = 50
+NOMES_TIPOS = {
+    "triagem": "Triagens", "fila": "Fila", "consulta": "Consultas", "prescricao": "Prescrições",
+    "atestado": "Atestados", "vacina": "Vacinas", "video": "Vídeos",
+}
+
+busca_paciente = pn.widgets.TextInput(name="Buscar Paciente", placeholder="Nome, CPF ou RG...")
+tabela_pacientes = pn.widgets.Tabulator(
+    pd.DataFrame(columns=busca.COLUNAS_PACIENTE),
+    titles={'id_paciente': 'ID', 'nome': 'Nome do Paciente', 'cpf': 'CPF'},
+    pagination='local', page_size=5, height=200, layout='fit_data', disabled=True
+)
+selecao_paciente = pn.widgets.StaticText(name="Paciente", value="Nenhum")
+filtro_tipos = pn.widgets.CheckButtonGroup(
+    name="Eventos", options={NOMES_TIPOS[e.tipo]: e.tipo for e in EVENTOS}, value=[e.tipo for e in EVENTOS]
+)
+tabela_eventos = pn.widgets.Tabulator(
+    pd.DataFrame(columns=COLUNAS),
+    titles={"momento": "Data e Hora", "titulo": "Evento", "detalhe": "Detalhe", "profissional": "Profissional"},
+    hidden_columns=["tipo", "ordem", "id_evento", "id_sub"], formatters={"momento": grade.DATA_HORA},
+    show_index=False, layout='fit_data_stretch', height=500, disabled=True
+)
+botao_mais = pn.widgets.Button(name="Carregar mais", disabled=True)
+info = pn.pane.Markdown("")
+
+estado = {"id_paciente": None, "cursor": None}
+
+
+# --- Callbacks ---
+
+async def pesquisar_pacientes(termo):
+    with carregando(tabela_pacientes):
+        tabela_pacientes.value = await em_thread(busca.buscar_pacientes, termo)
+    tabela_pacientes.disabled = False
+
+async def carregar_pagina(continuar=False):
+    if estado["id_paciente"] is None or not filtro_tipos.value:
+        tabela_eventos.value = pd.DataFrame(columns=COLUNAS)
+        botao_mais.disabled = True
+        return
+    with carregando(tabela_eventos, botao_mais):
+        df, proximo = await em_thread(
+            linha_do_tempo, estado["id_paciente"], apos=estado["cursor"] if continuar else None,
+            limite=TAMANHO_PAGINA, tipos=set(filtro_tipos.value),
+        )
+    if continuar:
+        tabela_eventos.stream(df, follow=False)
+    else:
+        tabela_eventos.value = df
+    estado["cursor"] = proximo
+    botao_mais.disabled = proximo is None
+    info.object = f"{len(tabela_eventos.value)} evento(s)" + ("" if proximo else ", fim do histórico.")
+
+async def on_paciente_select(event):
+    if not event.new:
+        return
+    row = tabela_pacientes.value.iloc[event.new[0]]
+    selecao_paciente.value = f"{row['id_paciente']} - {row['nome']}"
+    estado["id_paciente"] = int(row['id_paciente'])
+    await carregar_pagina()
+
+async def carregar_inicial():
+    await pesquisar_pacientes(busca_paciente.value_input)
+
+async def carregar_mais(event):
+    await carregar_pagina(continuar=True)
+
+async def mudar_tipos(event):
+    await carregar_pagina()
+
+busca.ao_digitar(busca_paciente, pesquisar_pacientes)
+tabela_pacientes.param.watch(on_paciente_select, 'selection')
+filtro_tipos.param.watch(mudar_tipos, 'value')
+botao_mais.on_click(carregar_mais)
+
+layout = pn.Column(
+    "## 🗂️ Histórico do Paciente",
+    pn.Row(
+        pn.Column(busca_paciente, tabela_pacientes, selecao_paciente, width=400, sizing_mode="fixed"),
+        pn.Column(filtro_tipos, tabela_eventos, pn.Row(botao_mais, info)),
+    ),
+    sizing_mode="stretch_width",
+)
+
+pn.state.onload(carregar_inicial)
+layout.servable()
+
+if __name__ == "__main__":
+    pn.serve(layout, port=5012, show=True)
@@ -0,0 +1,300 @@
+import argparse
+import datetime
+import io
+import os
+import time
+
+import pandas as pd
+
+import banco
+import cache
+
+# Importação em massa de pacientes a partir de CSV ou Parquet.
+#
+# O arquivo é lido em lotes de TAMANHO_LOTE linhas. Cada lote é validado de
+# forma vetorizada (pandas, coluna a coluna) e as linhas válidas vão por COPY
+# para uma tabela temporária. No fim, um único comando incorpora a tabela
+# temporária em Paciente (inserindo CPFs novos e atualizando os já
+# cadastrados), Paciente_Telefones e Paciente_Alergias, tudo na mesma
+# transação. As linhas rejeitadas voltam com o número da linha no arquivo e o
+# motivo.
+#
+# Uso: python importacao.py pacientes.csv [--rejeitados rejeitados.csv]
+
+TAMANHO_LOTE = 50_000
+
+# Colunas aceitas: (tamanho máximo, obrigatória). telefones e alergias são
+# listas separadas por SEPARADOR_LISTA.
+COLUNAS = {
+    "nome": (100, True),
+    "cpf": (20, True),
+    "rg": (20, True),
+    "data_nascimento": (None, True),
+    "endereco_rua": (100, True),
+    "endereco_numero": (10, True),
+    "endereco_complemento": (50, False),
+    "endereco_bairro": (50, True),
+    "endereco_cidade": (50, True),
+    "genero": (30, False),
+    "telefones": (None, False),
+    "alergias": (None, False),
+}
+SEPARADOR_LISTA = "|"
+TAMANHO_ITEM = {"telefones": 20, "alergias": 100}
+GENEROS = ['Não Informado', 'Masculino', 'Feminino', 'Outro']
+DATA_MINIMA = pd.Timestamp(1900, 1, 1)
+
+REGEX_CPF = r"\d{3}\.?\d{3}\.?\d{3}-?\d{2}"
+REGEX_RG = r"[0-9A-Za-z][0-9A-Za-z.\-/ ]{3,19}"
+
+CRIAR_TABELA_TEMPORARIA = """
+    CREATE TEMP TABLE importacao_paciente (
+        linha INTEGER PRIMARY KEY,
+        nome TEXT, cpf TEXT, rg TEXT, data_nascimento DATE,
+        endereco_rua TEXT, endereco_numero TEXT, endereco_complemento TEXT,
+        endereco_bairro TEXT, endereco_cidade TEXT, genero TEXT,
+        telefones TEXT, alergias TEXT
+    ) ON COMMIT DROP
+"""
+
+# RG já usado por outro paciente (CPF diferente): não dá para incorporar
+REMOVER_CONFLITOS_RG = """
+    DELETE FROM importacao_paciente s
+    USING paciente p
+    WHERE p.rg = s.rg AND p.cpf <> s.cpf
+    RETURNING s.linha
+"""
+
+INCORPORAR = """
+    WITH gravados AS (
+        INSERT INTO paciente (nome, cpf, rg, data_nascimento, endereco_rua, endereco_numero,
+                              endereco_complemento, endereco_bairro, endereco_cidade, genero)
+        SELECT nome, cpf, rg, data_nascimento, endereco_rua, endereco_numero,
+               NULLIF(endereco_complemento, ''), endereco_bairro, endereco_cidade, genero
+        FROM importacao_paciente
+        ON CONFLICT (cpf) DO UPDATE SET
+            nome = EXCLUDED.nome, rg = EXCLUDED.rg, data_nascimento = EXCLUDED.data_nascimento,
+            endereco_rua = EXCLUDED.endereco_rua, endereco_numero = EXCLUDED.endereco_numero,
+            endereco_complemento = EXCLUDED.endereco_complemento, endereco_bairro = EXCLUDED.endereco_bairro,
+            endereco_cidade = EXCLUDED.endereco_cidade, genero = EXCLUDED.genero
+        RETURNING id_paciente, cpf, (xmax = 0) AS inserido
+    ), telefones AS (
+        INSERT INTO paciente_telefones (id_paciente, telefone)
+        SELECT DISTINCT g.id_paciente, btrim(item)
+        FROM gravados g
+        JOIN importacao_paciente s ON s.cpf = g.cpf,
+        unnest(string_to_array(s.telefones, %(separador)s)) item
+        WHERE btrim(item) <> ''
+        ON CONFLICT DO NOTHING
+    ), alergias AS (
+        INSERT INTO paciente_alergias (id_paciente, alergia)
+        SELECT DISTINCT g.id_paciente, btrim(item)
+        FROM gravados g
+        JOIN importacao_paciente s ON s.cpf = g.cpf,
+        unnest(string_to_array(s.alergias, %(separador)s)) item
+        WHERE btrim(item) <> ''
+        ON CONFLICT DO NOTHING
+    )
+    SELECT count(*) FILTER (WHERE inserido), count(*) FILTER (WHERE NOT inserido) FROM gravados
+"""
+
+# --- Leitura ---
+
+def _formato(nome):
+    extensao = os.path.splitext(nome or "")[1].lower()
+    if extensao in (".parquet", ".pq"):
+        return "parquet"
+    if extensao in (".csv", ".txt", ""):
+        return "csv"
+    raise ValueError(f"Formato não suportado: {extensao} (use CSV ou Parquet)")
+
+def _separador_csv(amostra):
+    # Planilhas exportadas no Brasil costumam usar ';'
+    cabecalho = amostra.splitlines()[0] if amostra else ""
+    return ";" if cabecalho.count(";") > cabecalho.count(",") else ","
+
+def ler_lotes(arquivo, formato, tamanho_lote=TAMANHO_LOTE):
+    """Gera DataFrames (todas as colunas como texto) de até `tamanho_lote` linhas.
+
+    `arquivo` pode ser um caminho ou os bytes do arquivo. O índice de cada
+    lote continua a numeração do anterior.
+    """
+    if isinstance(arquivo, bytes):
+        arquivo = io.BytesIO(arquivo)
+
+    if formato == "parquet":
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ValueError("Ler Parquet requer o pacote pyarrow instalado.") from e
+        # Só um lote do arquivo fica em memória por vez, como no CSV
+        inicio = 0
+        for lote in pq.ParquetFile(arquivo).iter_batches(batch_size=tamanho_lote):
+            df = lote.to_pandas().astype("string").fillna("")
+            df.index = pd.RangeIndex(inicio, inicio + len(df))
+            inicio += len(df)
+            yield df
+        return
+
+    if hasattr(arquivo, "read"):
+        amostra = arquivo.read(4096)
+        arquivo.seek(0)
+        amostra = amostra.decode("utf-8-sig", errors="ignore") if isinstance(amostra, bytes) else amostra
+    else:
+        with open(arquivo, encoding="utf-8-sig") as f:
+            amostra = f.read(4096)
+    yield from pd.read_csv(
+        arquivo, sep=_separador_csv(amostra), index_col=False, dtype=str, keep_default_na=False,
+        encoding="utf-8-sig", chunksize=tamanho_lote,
+    )
+
+# --- Validação ---
+
+def validar_lote(df, cpfs_vistos, rgs_vistos, primeira_linha=2):
+    """Valida um lote inteiro de uma vez.
+
+    Retorna (validos, rejeitados): `validos` já normalizado para o COPY e
+    `rejeitados` com as colunas originais mais `linha` e `motivo`. Os
+    conjuntos de CPFs/RGs vistos acumulam entre lotes para detectar
+    duplicatas no arquivo todo. `primeira_linha` é o número, no arquivo, da
+    linha de índice 0 (2 no CSV, que tem cabeçalho; 1 no Parquet).
+    """
+    original = df
+    df = df.reindex(columns=list(COLUNAS), fill_value="").fillna("").astype(str)
+    df = df.apply(lambda coluna: coluna.str.strip())
+    motivo = pd.Series("", index=df.index, dtype=object)
+
+    def rejeitar(mascara, texto):
+        # Fica só o primeiro motivo de cada linha
+        motivo.mask(mascara & (motivo == ""), texto, inplace=True)
+
+    faltando = [c for c, (_, obrigatoria) in COLUNAS.items() if obrigatoria and c not in original.columns]
+    if faltando:
+        raise ValueError(f"Colunas obrigatórias ausentes no arquivo: {', '.join(faltando)}")
+
+    for coluna, (tamanho, obrigatoria) in COLUNAS.items():
+        if obrigatoria:
+            rejeitar(df[coluna] == "", f"{coluna} vazio")
+        if tamanho:
+            rejeitar(df[coluna].str.len() > tamanho, f"{coluna} com mais de {tamanho} caracteres")
+
+    rejeitar(~df["cpf"].str.fullmatch(REGEX_CPF), "CPF inválido")
+    df["cpf"] = df["cpf"].str.replace(r"\D", "", regex=True).str.replace(
+        r"^(\d{3})(\d{3})(\d{3})(\d{2})$", r"\1.\2.\3-\4", regex=True)
+    rejeitar(~df["rg"].str.fullmatch(REGEX_RG), "RG inválido")
+
+    datas = pd.to_datetime(df["data_nascimento"], format="%Y-%m-%d", errors="coerce")
+    datas = datas.fillna(pd.to_datetime(df["data_nascimento"], format="%d/%m/%Y", errors="coerce"))
+    rejeitar(datas.isna(), "data de nascimento inválida")
+    rejeitar((datas < DATA_MINIMA) | (datas > pd.Timestamp(datetime.date.today())), "data de nascimento fora do intervalo")
+    df["data_nascimento"] = datas.dt.strftime("%Y-%m-%d")
+
+    df["genero"] = df["genero"].replace("", "Não Informado")
+    rejeitar(~df["genero"].isin(GENEROS), "gênero inválido")
+
+    for coluna, tamanho in TAMANHO_ITEM.items():
+        itens = df[coluna].str.split(SEPARADOR_LISTA).explode().str.strip()
+        longos = itens.index[itens.str.len() > tamanho].unique()
+        rejeitar(df.index.isin(longos), f"item de {coluna} com mais de {tamanho} caracteres")
+
+    # Duplicatas só entre as linhas que passaram nas demais regras
+    for coluna, vistos in (("cpf", cpfs_vistos), ("rg", rgs_vistos)):
+        ok = motivo == ""
+        valores = df.loc[ok, coluna]
+        duplicados = valores.duplicated() | valores.isin(vistos)
+        rejeitar(df.index.isin(valores.index[duplicados]), f"{coluna.upper()} repetido no arquivo")
+    ok = motivo == ""
+    cpfs_vistos.update(df.loc[ok, "cpf"])
+    rgs_vistos.update(df.loc[ok, "rg"])
+
+    validos = df[ok]
+    validos.insert(0, "linha", validos.index + primeira_linha)
+    rejeitados = original[~ok].copy()
+    rejeitados.insert(0, "motivo", motivo[~ok])
+    rejeitados.insert(0, "linha", rejeitados.index + primeira_linha)
+    return validos, rejeitados
+
+# --- Carga ---
+
+def _copiar(cursor, validos):
+    buffer = io.StringIO()
+    validos.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    cursor.copy_expert(
+        f"COPY importacao_paciente ({', '.join(validos.columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+def importar(arquivo, nome_arquivo=None, formato=None, tamanho_lote=TAMANHO_LOTE):
+    """Importa pacientes de um CSV/Parquet (caminho ou bytes).
+
+    Retorna um dicionário com linhas lidas, inseridos, atualizados, rejeitados
+    (DataFrame), segundos e linhas por segundo.
+    """
+    inicio = time.perf_counter()
+    formato = formato or _formato(nome_arquivo or (arquivo if isinstance(arquivo, str) else None))
+    # Numeração das linhas como no arquivo: começa em 1, e o CSV tem o cabeçalho
+    primeira_linha = 2 if formato == "csv" else 1
+    cpfs_vistos, rgs_vistos = set(), set()
+    lista_rejeitados = []
+    linhas = 0
+
+    with banco.conexao_psycopg() as con, con.cursor() as cursor:
+        cursor.execute(CRIAR_TABELA_TEMPORARIA)
+        for lote in ler_lotes(arquivo, formato, tamanho_lote):
+            linhas += len(lote)
+            validos, rejeitados = validar_lote(lote, cpfs_vistos, rgs_vistos, primeira_linha)
+            if len(rejeitados):
+                lista_rejeitados.append(rejeitados)
+            if len(validos):
+                _copiar(cursor, validos)
+
+        cursor.execute("CREATE INDEX ON importacao_paciente (cpf)")
+        cursor.execute("ANALYZE importacao_paciente")
+        cursor.execute(REMOVER_CONFLITOS_RG)
+        linhas_conflito = [linha for linha, in cursor.fetchall()]
+        cursor.execute(INCORPORAR, {"separador": SEPARADOR_LISTA})
+        inseridos, atualizados = cursor.fetchone()
+        con.commit()
+
+    if inseridos or atualizados:
+        cache.invalidar("pacientes")
+
+    if linhas_conflito:
+        # Essas linhas já estão só na tabela temporária: o relatório traz o número e o motivo
+        conflitos = pd.DataFrame({"linha": linhas_conflito, "motivo": "RG já cadastrado para outro CPF"})
+        lista_rejeitados.append(conflitos)
+    rejeitados = (pd.concat(lista_rejeitados, ignore_index=True).sort_values("linha", ignore_index=True)
+                  if lista_rejeitados else pd.DataFrame(columns=["linha", "motivo"]))
+
+    segundos = time.perf_counter() - inicio
+    return {
+        "linhas": linhas,
+        "inseridos": inseridos,
+        "atualizados": atualizados,
+        "rejeitados": rejeitados,
+        "segundos": segundos,
+        "linhas_por_segundo": linhas / segundos if segundos else 0.0,
+    }
+
+def resumo(resultado):
+    return (
+        f"{resultado['linhas']} linhas em {resultado['segundos']:.1f} s "
+        f"({resultado['linhas_por_segundo']:,.0f} linhas/s): "
+        f"{resultado['inseridos']} inseridos, {resultado['atualizados']} atualizados, "
+        f"{len(resultado['rejeitados'])} rejeitados"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Importa pacientes de um arquivo CSV ou Parquet.")
+    parser.add_argument("arquivo")
+    parser.add_argument("--rejeitados", help="CSV onde gravar as linhas rejeitadas")
+    parser.add_argument("--lote", type=int, default=TAMANHO_LOTE, help="linhas validadas por vez")
+    args = parser.parse_args()
+
+    resultado = importar(args.arquivo, tamanho_lote=args.lote)
+    print(resumo(resultado))
+    if args.rejeitados and len(resultado["rejeitados"]):
+        resultado["rejeitados"].to_csv(args.rejeitados, index=False)
+        print(f"Linhas rejeitadas salvas em {args.rejeitados}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+import bisect
+import contextvars
+import inspect
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import psycopg2.extensions
+from sqlalchemy import event
+
+# Medição das consultas feitas pelas telas.
+#
+# Toda consulta que passa pelo engine (eventos do SQLAlchemy) ou por um cursor
+# psycopg2 de banco.conexao_psycopg() (CursorInstrumentado) é registrada com
+# a latência, o número de linhas e o callback da tela que a disparou. Por
+# (callback, consulta) são mantidos contadores e um histograma de latência;
+# consultas acima de CONSULTA_LENTA_MS vão para o log com o plano (EXPLAIN).
+# O retrato das métricas é servido em JSON por servir_metricas().
+
+CONSULTA_LENTA_MS = float(os.getenv("CONSULTA_LENTA_MS") or 200)
+# Cada consulta lenta tem o plano capturado no máximo uma vez nesse intervalo
+EXPLAIN_INTERVALO_S = float(os.getenv("EXPLAIN_INTERVALO_S") or 60)
+METRICAS_HOST = os.getenv("METRICAS_HOST") or "127.0.0.1"
+# Sem METRICAS_PORTA, cada tela sobe o endpoint na sua porta padrão (PORTAS_METRICAS)
+METRICAS_PORTA = int(os.environ["METRICAS_PORTA"]) if os.getenv("METRICAS_PORTA") else None
+PORTAS_METRICAS = {
+    "triagem": 9108, "consultas": 9109, "pacientes": 9110,
+    "gestaoestoque": 9111, "painel_gestao": 9112, "historico": 9113,
+}
+
+# Limites superiores (ms) dos baldes do histograma; o último balde é o resto
+LIMITES_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+LENTAS_MAXIMO = 100
+
+logger = logging.getLogger(__name__)
+
+# Callback da tela que originou o trabalho (propagado para as threads do
+# executor junto com o contexto, ver tarefas.em_thread)
+callback_atual = contextvars.ContextVar("callback_atual", default=None)
+
+# Módulos cujos frames não contam como callback (as telas servidas são
+# carregadas como bokeh_app_*, que não casa com "bokeh.")
+_BIBLIOTECAS = ("asyncio", "panel.", "param.", "bokeh.", "tornado.", "tarefas", "concurrent.")
+
+_PLANEJAVEIS = ("select", "insert", "update", "delete", "with")
+
+_lock = threading.Lock()
+_estatisticas = {}      # (callback, consulta) -> dict
+_lentas = deque(maxlen=LENTAS_MAXIMO)
+_ultimo_explain = {}    # consulta -> time.monotonic()
+
+
+# --- Nome do callback ---
+
+def callback_da_pilha(frame):
+    """Nome da corrotina mais externa de código da aplicação na pilha de `frame`.
+
+    Quando um callback (ex.: inserir) aguarda outra corrotina (ex.:
+    carregar_dados_triagem) que chama em_thread, o nome registrado é o do
+    callback que o usuário disparou.
+    """
+    nome = None
+    while frame is not None and frame.f_code.co_flags & inspect.CO_COROUTINE:
+        if not frame.f_globals.get("__name__", "").startswith(_BIBLIOTECAS):
+            nome = frame.f_code.co_name
+        frame = frame.f_back
+    return nome
+
+
+# --- Registro ---
+
+_LITERAIS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTAS = re.compile(r"\(\?(?:, \?)*\)(?:, \(\?(?:, \?)*\))*")
+_ESPACOS = re.compile(r"\s+")
+
+def normalizar(sql):
+    """Texto da consulta sem literais nem espaços extras (chave das métricas).
+
+    Comandos montados com os valores embutidos (ex.: execute_values) caem na
+    mesma chave, qualquer que seja o número de linhas.
+    """
+    sql = _ESPACOS.sub(" ", sql).strip()
+    sql = _LITERAIS.sub("?", sql)
+    return _LISTAS.sub("(...)", sql)
+
+def _novo():
+    return {"execucoes": 0, "total_ms": 0.0, "max_ms": 0.0, "linhas": 0, "erros": 0,
+            "histograma": [0] * (len(LIMITES_MS) + 1)}
+
+def registrar(sql, duracao_s, linhas, erro=False):
+    """Acumula uma execução nas métricas de (callback atual, consulta)."""
+    ms = duracao_s * 1000
+    chave = (callback_atual.get(), normalizar(sql))
+    with _lock:
+        dados = _estatisticas.get(chave)
+        if dados is None:
+            dados = _estatisticas[chave] = _novo()
+        dados["execucoes"] += 1
+        dados["total_ms"] += ms
+        dados["max_ms"] = max(dados["max_ms"], ms)
+        dados["linhas"] += max(linhas or 0, 0)
+        dados["erros"] += bool(erro)
+        dados["histograma"][bisect.bisect_left(LIMITES_MS, ms)] += 1
+    return chave
+
+def _explicar(dbapi_connection, sql, parametros):
+    """Plano da consulta, num savepoint para não abortar a transação de quem chamou."""
+    with dbapi_connection.cursor(cursor_factory=psycopg2.extensions.cursor) as cursor:
+        cursor.execute("SAVEPOINT instrumentacao_explain")
+        try:
+            cursor.execute("EXPLAIN " + sql, parametros)
+            plano = "\n".join(linha[0] for linha in cursor.fetchall())
+        except Exception as erro:
+            cursor.execute("ROLLBACK TO SAVEPOINT instrumentacao_explain")
+            plano = f"(EXPLAIN falhou: {erro})"
+        cursor.execute("RELEASE SAVEPOINT instrumentacao_explain")
+    return plano
+
+def _consulta_lenta(dbapi_connection, chave, sql, parametros, duracao_s, varias):
+    agora = time.monotonic()
+    callback, normalizada = chave
+    plano = None
+    planejavel = not varias and normalizada.lstrip("( ").lower().startswith(_PLANEJAVEIS)
+    with _lock:
+        if planejavel and agora - _ultimo_explain.get(normalizada, -EXPLAIN_INTERVALO_S) >= EXPLAIN_INTERVALO_S:
+            _ultimo_explain[normalizada] = agora
+        else:
+            planejavel = False
+    if planejavel:
+        try:
+            plano = _explicar(dbapi_connection, sql, parametros)
+        except Exception as erro:
+            plano = f"(EXPLAIN falhou: {erro})"
+    lenta = {
+        "quando": time.time(), "callback": callback, "consulta": normalizada,
+        "duracao_ms": round(duracao_s * 1000, 2), "plano": plano,
+    }
+    with _lock:
+        _lentas.append(lenta)
+    logger.warning("Consulta lenta (%.0f ms, callback %s): %s%s", lenta["duracao_ms"], callback or "-",
+                   normalizada[:500], f"\n{plano}" if plano else "")
+
+def _medir(dbapi_connection, sql, parametros, inicio, linhas, erro=False, varias=False):
+    duracao = time.perf_counter() - inicio
+    chave = registrar(sql, duracao, linhas, erro)
+    if not erro and duracao * 1000 >= CONSULTA_LENTA_MS:
+        _consulta_lenta(dbapi_connection, chave, sql, parametros, duracao, varias)
+
+
+# --- Eventos do SQLAlchemy ---
+
+def instalar(engine):
+    """Liga a medição às consultas executadas pelo `engine`."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _antes(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("instrumentacao_inicio", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _depois(conn, cursor, statement, parameters, context, executemany):
+        inicio = conn.info["instrumentacao_inicio"].pop()
+        _medir(cursor.connection, statement, parameters, inicio, cursor.rowcount, varias=executemany)
+
+    @event.listens_for(engine, "handle_error")
+    def _erro(contexto):
+        pilha = contexto.connection.info.get("instrumentacao_inicio") if contexto.connection is not None else None
+        if pilha and contexto.statement is not None:
+            registrar(contexto.statement, time.perf_counter() - pilha.pop(), 0, erro=True)
+
+
+# --- Cursor psycopg2 ---
+
+class CursorInstrumentado(psycopg2.extensions.cursor):
+    """Cursor psycopg2 que registra cada execute/executemany (ver banco.conexao_psycopg)."""
+
+    def _executar(self, metodo, query, parametros, varias):
+        inicio = time.perf_counter()
+        try:
+            resultado = metodo(query, parametros)
+        except Exception:
+            registrar(self._texto(query), time.perf_counter() - inicio, 0, erro=True)
+            raise
+        _medir(self.connection, self._texto(query), parametros, inicio, self.rowcount, varias=varias)
+        return resultado
+
+    def _texto(self, query):
+        if isinstance(query, bytes):
+            return query.decode(self.connection.encoding if self.connection.encoding != "SQL_ASCII" else "utf-8",
+                                errors="replace")
+        if not isinstance(query, str):
+            return query.as_string(self)
+        return query
+
+    def execute(self, query, vars=None):
+        return self._executar(super().execute, query, vars, False)
+
+    def executemany(self, query, vars_list):
+        return self._executar(super().executemany, query, vars_list, True)
+
+
+# --- Retrato e endpoint ---
+
+def _percentil(histograma, fracao):
+    alvo = sum(histograma) * fracao
+    acumulado = 0
+    for indice, quantidade in enumerate(histograma):
+        acumulado += quantidade
+        if quantidade and acumulado >= alvo:
+            return LIMITES_MS[indice] if indice < len(LIMITES_MS) else float("inf")
+    return 0
+
+def retrato(limite=50):
+    """Métricas acumuladas, das consultas que mais somaram tempo para as que menos somaram.
+
+    p50_ms/p95_ms são o limite superior do balde do histograma onde o
+    percentil cai.
+    """
+    with _lock:
+        itens = [(chave, dict(dados, histograma=list(dados["histograma"]))) for chave, dados in _estatisticas.items()]
+        lentas = list(_lentas)
+    itens.sort(key=lambda item: item[1]["total_ms"], reverse=True)
+    consultas = []
+    for (callback, consulta), dados in itens[:limite]:
+        consultas.append(dict(
+            dados, callback=callback, consulta=consulta,
+            media_ms=dados["total_ms"] / dados["execucoes"],
+            p50_ms=_percentil(dados["histograma"], 0.5),
+            p95_ms=_percentil(dados["histograma"], 0.95),
+        ))
+    por_callback = {}
+    for (callback, _consulta), dados in itens:
+        soma = por_callback.setdefault(callback or "-", {"execucoes": 0, "total_ms": 0.0})
+        soma["execucoes"] += dados["execucoes"]
+        soma["total_ms"] += dados["total_ms"]
+    return {
+        "limites_ms": list(LIMITES_MS),
+        "consulta_lenta_ms": CONSULTA_LENTA_MS,
+        "por_callback": por_callback,
+        "consultas": consultas,
+        "lentas": lentas,
+    }
+
+def zerar():
+    with _lock:
+        _estatisticas.clear()
+        _lentas.clear()
+        _ultimo_explain.clear()
+
+def corpo_metricas():
+    """retrato() e as métricas do pool, em JSON (bytes)."""
+    import banco  # banco importa este módulo
+    return json.dumps(dict(retrato(), pool=banco.metricas_pool()), default=str).encode("utf-8")
+
+class MetricasHandler(BaseHTTPRequestHandler):
+    """GET /metricas do endpoint próprio (servir_metricas)."""
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metricas"):
+            self.send_error(404)
+            return
+        corpo = corpo_metricas()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, formato, *args):
+        logger.debug(formato, *args)
+
+_servidor = None
+_tentado = False
+
+def servir_metricas(tela=None, host=None, porta=None):
+    """Sobe (uma vez por processo) o endpoint HTTP de métricas numa thread.
+
+    A porta é `porta`, ou METRICAS_PORTA, ou a padrão da `tela` em
+    PORTAS_METRICAS. Com METRICAS_PORTA = 0 não sobe nada (servidor.py serve
+    /metricas na própria porta do Panel). As telas chamam isto a cada sessão:
+    só a primeira chamada do processo tenta abrir a porta, mesmo se falhar.
+    """
+    global _servidor, _tentado
+    host = host or METRICAS_HOST
+    if porta is None:
+        porta = METRICAS_PORTA if METRICAS_PORTA is not None else PORTAS_METRICAS.get(tela)
+    if not porta:
+        return None
+    with _lock:
+        if _tentado:
+            return _servidor
+        _tentado = True
+        try:
+            _servidor = ThreadingHTTPServer((host, porta), MetricasHandler)
+        except OSError as erro:
+            logger.warning("Endpoint de métricas não iniciado em %s:%s: %s", host, porta, erro)
+            return None
+    threading.Thread(target=_servidor.serve_forever, name="metricas", daemon=True).start()
+    logger.info("Métricas em http://%s:%s/metricas", host, porta)
+    return _servidor
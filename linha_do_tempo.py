@@ -0,0 +1,172 @@
+from collections import namedtuple
+
+import banco
+import grade
+
+# Linha do tempo de um paciente: triagens, entradas na fila, consultas,
+# prescrições, atestados, vacinas e vídeos assistidos, do mais recente para o
+# mais antigo, numa única consulta.
+#
+# Cada tipo de evento é um ramo do UNION ALL que lê só as linhas do paciente
+# pelo índice (id_paciente, data) (migração 009), a partir do cursor e até o
+# tamanho da página; a consulta externa intercala os ramos e corta a página.
+# Um paciente com anos de atendimentos custa o mesmo que um com poucos: nenhum
+# ramo lê mais que `limite + 1` linhas.
+#
+# O cursor é (momento, ordem, id_evento, id_sub) do último evento da página:
+# `ordem` desempata tipos diferentes no mesmo instante e (id_evento, id_sub)
+# eventos do mesmo tipo.
+
+Evento = namedtuple("Evento", ["tipo", "ordem", "origem", "paciente", "momento", "data", "id_evento", "id_sub",
+                               "titulo", "detalhe", "profissional", "ordenacao", "filtro"])
+
+EVENTOS = [
+    Evento(
+        tipo="video", ordem=1,
+        origem="""paciente_assiste_video av
+                  JOIN video vd ON vd.id_video = av.id_video
+                  LEFT JOIN profissional prof ON prof.id_profissional = vd.id_profissional""",
+        paciente="av.id_paciente",
+        momento="av.data_visualizacao",
+        data="av.data_visualizacao",
+        id_evento="av.id_video", id_sub="0",
+        titulo="'Vídeo'", detalhe="vd.titulo", profissional="prof.nome",
+        ordenacao="av.data_visualizacao DESC, av.id_video DESC",
+        # Visualizações sem data não têm lugar na linha do tempo
+        filtro="av.data_visualizacao IS NOT NULL",
+    ),
+    Evento(
+        tipo="vacina", ordem=2,
+        origem="""paciente_recebe_vacina rv
+                  JOIN vacina v ON v.id_vacina = rv.id_vacina
+                  JOIN profissional prof ON prof.id_profissional = rv.id_profissional""",
+        paciente="rv.id_paciente",
+        momento="CAST(rv.data_aplicacao AS timestamp)",
+        data="rv.data_aplicacao",
+        id_evento="rv.id_vacina", id_sub="rv.id_profissional",
+        titulo="'Vacina'", detalhe="v.tipo", profissional="prof.nome",
+        ordenacao="rv.data_aplicacao DESC, rv.id_vacina DESC, rv.id_profissional DESC",
+        filtro=None,
+    ),
+    Evento(
+        tipo="atestado", ordem=3,
+        origem="atestado a JOIN profissional prof ON prof.id_profissional = a.id_medico",
+        paciente="a.id_paciente",
+        momento="CAST(a.data AS timestamp)",
+        data="a.data",
+        id_evento="a.id_atestado", id_sub="0",
+        titulo="'Atestado'",
+        detalhe="concat_ws(' — ', a.descricao, 'afastamento: ' || a.periodo_afastamento)",
+        profissional="prof.nome",
+        ordenacao="a.data DESC, a.id_atestado DESC",
+        filtro=None,
+    ),
+    Evento(
+        tipo="fila", ordem=4,
+        origem="fila f LEFT JOIN profissional prof ON prof.id_profissional = f.id_profissional",
+        paciente="f.id_paciente",
+        momento="f.hora_entrada",
+        data="f.hora_entrada",
+        id_evento="f.id_fila", id_sub="0",
+        titulo="'Entrada na fila'",
+        detalhe="concat_ws(' — ', f.tipo_consulta, 'chamado às ' || to_char(f.hora_chamada, 'HH24:MI'))",
+        profissional="prof.nome",
+        ordenacao="f.hora_entrada DESC, f.id_fila DESC",
+        filtro=None,
+    ),
+    Evento(
+        tipo="triagem", ordem=5,
+        origem="triagem t JOIN profissional prof ON prof.id_profissional = t.id_profissional",
+        paciente="t.id_paciente",
+        momento="t.data",
+        data="t.data",
+        id_evento="t.id_triagem", id_sub="0",
+        titulo="'Triagem'",
+        detalhe="concat_ws(' — ', t.classificacao_de_prioridade, t.descricao)",
+        profissional="prof.nome",
+        ordenacao="t.data DESC, t.id_triagem DESC",
+        filtro=None,
+    ),
+    # As prescrições ficam logo abaixo da consulta (mesmo momento, ordem menor)
+    Evento(
+        tipo="prescricao", ordem=6,
+        origem="""consulta c
+                  JOIN prescricao pr ON pr.id_consulta = c.id_consulta
+                  JOIN medicamento m ON m.id_medicamento = pr.id_medicamento
+                  JOIN item_estoque i ON i.id_itemestoque = m.id_itemestoque
+                  JOIN profissional prof ON prof.id_profissional = c.id_medico""",
+        paciente="c.id_paciente",
+        momento="c.data + c.hora_inicio",
+        data="c.data",
+        id_evento="c.id_consulta", id_sub="pr.id_medicamento",
+        titulo="'Prescrição'",
+        detalhe="concat_ws(' — ', i.nome, pr.dosagem, pr.frequencia)",
+        profissional="prof.nome",
+        ordenacao="c.data DESC, c.hora_inicio DESC, c.id_consulta DESC, pr.id_medicamento DESC",
+        filtro=None,
+    ),
+    Evento(
+        tipo="consulta", ordem=7,
+        origem="consulta c JOIN profissional prof ON prof.id_profissional = c.id_medico",
+        paciente="c.id_paciente",
+        momento="c.data + c.hora_inicio",
+        data="c.data",
+        id_evento="c.id_consulta", id_sub="0",
+        titulo="'Consulta'", detalhe="c.diagnostico", profissional="prof.nome",
+        ordenacao="c.data DESC, c.hora_inicio DESC, c.id_consulta DESC",
+        filtro=None,
+    ),
+]
+
+COLUNAS = ["momento", "tipo", "titulo", "detalhe", "profissional", "ordem", "id_evento", "id_sub"]
+
+def _ramo(evento, com_cursor):
+    filtros = [f"{evento.paciente} = :id_paciente"]
+    if evento.filtro:
+        filtros.append(evento.filtro)
+    if com_cursor:
+        filtros.append(f"({evento.momento}, {evento.ordem}, {evento.id_evento}, {evento.id_sub}) "
+                       "< (:cursor_momento, :cursor_ordem, :cursor_id, :cursor_sub)")
+        # Redundante com a comparação acima, mas é o que limita a leitura do
+        # índice (date <= timestamp também é atendido pelo índice de data)
+        filtros.append(f"{evento.data} <= :cursor_momento")
+    return f"""(
+        SELECT {evento.momento} AS momento, '{evento.tipo}' AS tipo, {evento.titulo} AS titulo,
+               {evento.detalhe} AS detalhe, {evento.profissional} AS profissional,
+               {evento.ordem} AS ordem, {evento.id_evento} AS id_evento, {evento.id_sub} AS id_sub
+        FROM {evento.origem}
+        WHERE {' AND '.join(filtros)}
+        ORDER BY {evento.ordenacao}
+        LIMIT :limite
+    )"""
+
+def sql_pagina(com_cursor=False, tipos=None):
+    """SQL da página da linha do tempo (parâmetros :id_paciente, :limite e os do cursor)."""
+    ramos = [_ramo(evento, com_cursor) for evento in EVENTOS if tipos is None or evento.tipo in tipos]
+    return f"""
+        SELECT {', '.join(COLUNAS)}
+        FROM ({' UNION ALL '.join(ramos)}) eventos
+        ORDER BY momento DESC, ordem DESC, id_evento DESC, id_sub DESC
+        LIMIT :limite
+    """
+
+def linha_do_tempo(id_paciente, apos=None, limite=50, tipos=None):
+    """Uma página de eventos do paciente, do mais recente para o mais antigo.
+
+    `apos` é o cursor devolvido pela página anterior; `tipos` restringe os
+    tipos de evento (ex.: {"consulta", "prescricao"}). Retorna a página e o
+    cursor da próxima (None se esta for a última).
+    """
+    params = {"id_paciente": id_paciente, "limite": limite + 1}
+    if apos:
+        params["cursor_momento"], params["cursor_ordem"], params["cursor_id"], params["cursor_sub"] = apos
+    with banco.conexao() as conn:
+        df = grade.ler(conn, sql_pagina(com_cursor=apos is not None, tipos=tipos), params)
+
+    proximo = None
+    if len(df) > limite:
+        df = df.iloc[:limite]
+        ultima = df.iloc[-1]
+        proximo = (ultima["momento"].to_pydatetime(), int(ultima["ordem"]), int(ultima["id_evento"]),
+                   int(ultima["id_sub"]))
+    return df, proximo
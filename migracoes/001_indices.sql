@@ -0,0 +1,24 @@
+-- Índices secundários para as junções e filtros usados pelas telas.
+-- O PostgreSQL não cria índices para chaves estrangeiras automaticamente.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm WITH SCHEMA public;
+
+-- Triagem: listagem paginada por (data, id_triagem), com e sem filtro de prioridade
+CREATE INDEX IF NOT EXISTS idx_triagem_data_id ON Triagem (data, id_triagem);
+CREATE INDEX IF NOT EXISTS idx_triagem_prioridade_data_id ON Triagem (classificacao_de_prioridade, data, id_triagem);
+CREATE INDEX IF NOT EXISTS idx_triagem_paciente_data ON Triagem (id_paciente, data);
+CREATE INDEX IF NOT EXISTS idx_triagem_profissional_data ON Triagem (id_profissional, data);
+
+-- Consulta: listagem ordenada por data/hora e filtros por paciente, médico e data
+CREATE INDEX IF NOT EXISTS idx_consulta_data_hora ON Consulta (data, hora_inicio);
+CREATE INDEX IF NOT EXISTS idx_consulta_paciente_data ON Consulta (id_paciente, data);
+CREATE INDEX IF NOT EXISTS idx_consulta_medico_data ON Consulta (id_medico, data);
+
+-- Prescricao já é indexada por (id_consulta, id_medicamento) pela chave primária
+CREATE INDEX IF NOT EXISTS idx_prescricao_medicamento ON Prescricao (id_medicamento);
+
+CREATE INDEX IF NOT EXISTS idx_fila_profissional ON Fila (id_profissional);
+
+-- Item_estoque: busca exata (remoção), ordenação por nome e busca ILIKE '%termo%'
+CREATE INDEX IF NOT EXISTS idx_item_estoque_nome ON Item_estoque (nome);
+CREATE INDEX IF NOT EXISTS idx_item_estoque_nome_trgm ON Item_estoque USING gin (nome public.gin_trgm_ops);
@@ -0,0 +1,28 @@
+-- Notificações de alteração (LISTEN/NOTIFY) para atualizar as telas abertas.
+-- Cada trigger publica no canal TG_ARGV[0] um JSON {"operacao": ..., "id": ...}
+-- com a chave primária (coluna TG_ARGV[1]) da linha alterada.
+
+CREATE OR REPLACE FUNCTION notificar_alteracao() RETURNS trigger AS $$
+DECLARE
+    registro JSONB;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        registro := to_jsonb(OLD);
+    ELSE
+        registro := to_jsonb(NEW);
+    END IF;
+    PERFORM pg_notify(
+        TG_ARGV[0],
+        json_build_object('operacao', TG_OP, 'id', registro -> TG_ARGV[1])::text
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_triagem_notificar
+    AFTER INSERT OR UPDATE OR DELETE ON Triagem
+    FOR EACH ROW EXECUTE FUNCTION notificar_alteracao('triagem_alterada', 'id_triagem');
+
+CREATE TRIGGER trg_fila_notificar
+    AFTER INSERT OR UPDATE OR DELETE ON Fila
+    FOR EACH ROW EXECUTE FUNCTION notificar_alteracao('fila_alterada', 'id_fila');
@@ -0,0 +1,6 @@
+-- Marca quando o paciente foi chamado, em vez de apagar a linha da fila.
+-- Enquanto hora_chamada é nula o paciente está aguardando.
+ALTER TABLE Fila ADD COLUMN hora_chamada TIMESTAMP;
+
+-- Reconstrução da fila em memória: só as entradas ainda aguardando
+CREATE INDEX IF NOT EXISTS idx_fila_aguardando ON Fila (hora_entrada) WHERE hora_chamada IS NULL;
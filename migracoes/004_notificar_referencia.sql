@@ -0,0 +1,25 @@
+-- Notificação por comando (não por linha) das tabelas de referência usadas
+-- nos selects das telas. O cache (cache.py) só precisa saber qual tabela
+-- mudou, então importações em massa geram uma única notificação.
+
+CREATE OR REPLACE FUNCTION notificar_referencia() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify(
+        'referencia_alterada',
+        json_build_object('operacao', TG_OP, 'tabela', lower(TG_TABLE_NAME), 'id', NULL)::text
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_paciente_notificar_referencia
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON Paciente
+    FOR EACH STATEMENT EXECUTE FUNCTION notificar_referencia();
+
+CREATE TRIGGER trg_profissional_notificar_referencia
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON Profissional
+    FOR EACH STATEMENT EXECUTE FUNCTION notificar_referencia();
+
+CREATE TRIGGER trg_medico_notificar_referencia
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON Medico
+    FOR EACH STATEMENT EXECUTE FUNCTION notificar_referencia();
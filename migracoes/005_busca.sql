@@ -0,0 +1,9 @@
+-- Índices da busca de pacientes e médicos (busca.py).
+-- GiST de trigramas atende tanto o filtro "nome ILIKE '%trecho%'" quanto a
+-- ordenação por semelhança (nome <-> termo) com LIMIT, sem ler todas as linhas.
+CREATE INDEX IF NOT EXISTS idx_paciente_nome_trgm ON Paciente USING gist (nome public.gist_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_profissional_nome_trgm ON Profissional USING gist (nome public.gist_trgm_ops);
+
+-- Prefixo de CPF/RG digitado sem máscara
+CREATE INDEX IF NOT EXISTS idx_paciente_cpf_digitos ON Paciente ((regexp_replace(cpf, '\D', '', 'g')) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_paciente_rg_digitos ON Paciente ((regexp_replace(rg, '\D', '', 'g')) text_pattern_ops);
@@ -0,0 +1,91 @@
+-- Quantidades em estoque. Cada linha de Item_estoque é um lote; o histórico
+-- de movimentos (entradas, dispensações, perdas e ajustes) fica num livro
+-- só de inserção e o saldo de cada lote é mantido por trigger em
+-- Saldo_estoque, de modo que consultar o saldo é uma busca pela chave e não
+-- uma soma sobre o histórico. Ver estoque.py.
+
+CREATE TABLE Movimento_estoque (
+    id_movimento BIGSERIAL PRIMARY KEY,
+    id_itemestoque INTEGER NOT NULL,
+    tipo VARCHAR(20) NOT NULL,
+    -- Positiva para o que entra no lote, negativa para o que sai
+    quantidade INTEGER NOT NULL,
+    data TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    id_consulta INTEGER,
+    id_medicamento INTEGER,
+    observacao TEXT,
+    CONSTRAINT fk_movimento_item FOREIGN KEY (id_itemestoque)
+        REFERENCES Item_estoque(id_itemestoque) ON DELETE RESTRICT,
+    -- A dispensação aponta para a prescrição que a originou; se a consulta
+    -- for apagada o movimento continua no livro, só perde o vínculo
+    CONSTRAINT fk_movimento_prescricao FOREIGN KEY (id_consulta, id_medicamento)
+        REFERENCES Prescricao(id_consulta, id_medicamento) ON DELETE SET NULL,
+    CONSTRAINT ck_movimento_tipo CHECK (
+        (tipo = 'entrada' AND quantidade > 0)
+        OR (tipo IN ('dispensacao', 'perda') AND quantidade < 0)
+        OR (tipo = 'ajuste' AND quantidade <> 0)
+    )
+);
+
+CREATE INDEX idx_movimento_item_data ON Movimento_estoque (id_itemestoque, data);
+CREATE INDEX idx_movimento_prescricao ON Movimento_estoque (id_consulta, id_medicamento)
+    WHERE id_consulta IS NOT NULL;
+
+CREATE TABLE Saldo_estoque (
+    id_itemestoque INTEGER PRIMARY KEY,
+    -- O CHECK é a última barreira contra vender o que não existe
+    quantidade INTEGER NOT NULL DEFAULT 0 CHECK (quantidade >= 0),
+    atualizado_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT fk_saldo_item FOREIGN KEY (id_itemestoque)
+        REFERENCES Item_estoque(id_itemestoque) ON DELETE CASCADE
+);
+
+-- Todo lote tem linha de saldo (mesmo zerada), para que a dispensação
+-- sempre tenha o que travar com SELECT ... FOR UPDATE
+INSERT INTO Saldo_estoque (id_itemestoque) SELECT id_itemestoque FROM Item_estoque;
+
+CREATE OR REPLACE FUNCTION criar_saldo_estoque() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO Saldo_estoque (id_itemestoque) VALUES (NEW.id_itemestoque);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_item_estoque_saldo
+    AFTER INSERT ON Item_estoque
+    FOR EACH ROW EXECUTE FUNCTION criar_saldo_estoque();
+
+CREATE OR REPLACE FUNCTION aplicar_movimento_estoque() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO Saldo_estoque (id_itemestoque, quantidade)
+    VALUES (NEW.id_itemestoque, NEW.quantidade)
+    ON CONFLICT (id_itemestoque) DO UPDATE
+        SET quantidade = Saldo_estoque.quantidade + EXCLUDED.quantidade,
+            atualizado_em = CURRENT_TIMESTAMP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_movimento_estoque_saldo
+    AFTER INSERT ON Movimento_estoque
+    FOR EACH ROW EXECUTE FUNCTION aplicar_movimento_estoque();
+
+-- O livro é só de inserção: correções entram como movimento de ajuste. A
+-- única alteração aceita é a do ON DELETE SET NULL da prescrição, que roda
+-- dentro da trigger de integridade referencial (pg_trigger_depth() > 1).
+CREATE OR REPLACE FUNCTION bloquear_alteracao_movimento() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND pg_trigger_depth() > 1
+       AND NEW.id_consulta IS NULL AND NEW.id_medicamento IS NULL
+       AND (NEW.id_movimento, NEW.id_itemestoque, NEW.tipo, NEW.quantidade, NEW.data, NEW.observacao)
+           IS NOT DISTINCT FROM
+           (OLD.id_movimento, OLD.id_itemestoque, OLD.tipo, OLD.quantidade, OLD.data, OLD.observacao) THEN
+        RETURN NEW;
+    END IF;
+    RAISE EXCEPTION 'Movimento_estoque só aceita inserções (use um movimento de ajuste)';
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_movimento_estoque_somente_insercao
+    BEFORE UPDATE OR DELETE ON Movimento_estoque
+    FOR EACH ROW EXECUTE FUNCTION bloquear_alteracao_movimento();
@@ -0,0 +1,116 @@
+-- Resumo dos lotes que vencem nos próximos 90 dias, por faixa (7, 30 ou 90
+-- dias; 0 para os já vencidos que ainda têm saldo). As triggers mantêm o
+-- resumo em dia quando lotes são inseridos, alterados ou removidos e quando o
+-- saldo muda; a passagem dos dias é aplicada por recalcular_resumo_validade(),
+-- que o servidor agenda uma vez por dia (ver estoque.py). As telas leem só
+-- esta tabela, nunca Item_estoque inteira.
+
+CREATE INDEX IF NOT EXISTS idx_item_estoque_validade ON Item_estoque (data_validade);
+
+CREATE TABLE Resumo_validade (
+    id_itemestoque INTEGER PRIMARY KEY,
+    nome VARCHAR(100) NOT NULL,
+    lote VARCHAR(50) NOT NULL,
+    data_validade DATE NOT NULL,
+    faixa SMALLINT NOT NULL,
+    quantidade INTEGER NOT NULL DEFAULT 0,
+    CONSTRAINT fk_resumo_validade_item FOREIGN KEY (id_itemestoque)
+        REFERENCES Item_estoque(id_itemestoque) ON DELETE CASCADE
+);
+
+CREATE INDEX idx_resumo_validade_faixa ON Resumo_validade (faixa, data_validade);
+
+-- Data em que as faixas foram calculadas pela última vez
+CREATE TABLE Resumo_validade_controle (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    calculado_em DATE
+);
+INSERT INTO Resumo_validade_controle (calculado_em) VALUES (NULL);
+
+CREATE OR REPLACE FUNCTION faixa_validade(validade DATE) RETURNS SMALLINT AS $$
+    SELECT CASE
+        WHEN validade < CURRENT_DATE THEN 0
+        WHEN validade <= CURRENT_DATE + 7 THEN 7
+        WHEN validade <= CURRENT_DATE + 30 THEN 30
+        WHEN validade <= CURRENT_DATE + 90 THEN 90
+    END::SMALLINT
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION resumo_validade_item() RETURNS trigger AS $$
+DECLARE
+    nova_faixa SMALLINT := faixa_validade(NEW.data_validade);
+BEGIN
+    IF nova_faixa IS NULL THEN
+        DELETE FROM Resumo_validade WHERE id_itemestoque = NEW.id_itemestoque;
+    ELSE
+        INSERT INTO Resumo_validade (id_itemestoque, nome, lote, data_validade, faixa, quantidade)
+        SELECT NEW.id_itemestoque, NEW.nome, NEW.lote, NEW.data_validade, nova_faixa,
+               COALESCE((SELECT quantidade FROM Saldo_estoque WHERE id_itemestoque = NEW.id_itemestoque), 0)
+        ON CONFLICT (id_itemestoque) DO UPDATE
+            SET nome = EXCLUDED.nome, lote = EXCLUDED.lote,
+                data_validade = EXCLUDED.data_validade, faixa = EXCLUDED.faixa;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_item_estoque_resumo_validade
+    AFTER INSERT OR UPDATE OF nome, lote, data_validade ON Item_estoque
+    FOR EACH ROW EXECUTE FUNCTION resumo_validade_item();
+
+CREATE OR REPLACE FUNCTION resumo_validade_saldo() RETURNS trigger AS $$
+BEGIN
+    UPDATE Resumo_validade SET quantidade = NEW.quantidade
+    WHERE id_itemestoque = NEW.id_itemestoque AND quantidade <> NEW.quantidade;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_saldo_estoque_resumo_validade
+    AFTER INSERT OR UPDATE OF quantidade ON Saldo_estoque
+    FOR EACH ROW EXECUTE FUNCTION resumo_validade_saldo();
+
+-- Aplica a passagem dos dias. Só lê de Item_estoque os lotes que entraram na
+-- janela de 90 dias desde o último cálculo (pelo índice de data_validade); o
+-- resto é feito sobre o próprio resumo. Retorna quantas linhas mudaram.
+CREATE OR REPLACE FUNCTION recalcular_resumo_validade() RETURNS INTEGER AS $$
+DECLARE
+    ultimo DATE;
+    alteradas INTEGER := 0;
+    n INTEGER;
+BEGIN
+    -- Vários processos do servidor podem agendar o mesmo cálculo
+    PERFORM pg_advisory_xact_lock(hashtext('recalcular_resumo_validade'));
+    SELECT calculado_em INTO ultimo FROM Resumo_validade_controle FOR UPDATE;
+    IF ultimo = CURRENT_DATE THEN
+        RETURN 0;
+    END IF;
+
+    UPDATE Resumo_validade SET faixa = faixa_validade(data_validade)
+    WHERE faixa <> 0 AND faixa IS DISTINCT FROM faixa_validade(data_validade);
+    GET DIAGNOSTICS n = ROW_COUNT;
+    alteradas := alteradas + n;
+
+    -- Vencidos sem saldo já não pedem providência
+    DELETE FROM Resumo_validade WHERE faixa = 0 AND quantidade = 0;
+    GET DIAGNOSTICS n = ROW_COUNT;
+    alteradas := alteradas + n;
+
+    INSERT INTO Resumo_validade (id_itemestoque, nome, lote, data_validade, faixa, quantidade)
+    SELECT i.id_itemestoque, i.nome, i.lote, i.data_validade, faixa_validade(i.data_validade),
+           COALESCE(s.quantidade, 0)
+    FROM Item_estoque i
+    LEFT JOIN Saldo_estoque s ON s.id_itemestoque = i.id_itemestoque
+    WHERE i.data_validade <= CURRENT_DATE + 90
+      AND (ultimo IS NULL OR i.data_validade > ultimo + 90)
+      AND (i.data_validade >= CURRENT_DATE OR COALESCE(s.quantidade, 0) > 0)
+    ON CONFLICT (id_itemestoque) DO NOTHING;
+    GET DIAGNOSTICS n = ROW_COUNT;
+    alteradas := alteradas + n;
+
+    UPDATE Resumo_validade_controle SET calculado_em = CURRENT_DATE;
+    RETURN alteradas;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT recalcular_resumo_validade();
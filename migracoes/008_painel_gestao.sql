@@ -0,0 +1,40 @@
+-- Agregados do painel de gestão (painel_gestao.py). Cada tabela guarda um
+-- resumo pequeno por hora ou por dia e é atualizada de forma incremental por
+-- agregados.py; os gráficos nunca leem Triagem, Fila ou Consulta diretamente.
+
+-- Triagens por hora e classificação de prioridade
+CREATE TABLE Painel_triagem_hora (
+    hora TIMESTAMP NOT NULL,
+    prioridade VARCHAR(50) NOT NULL,
+    total INTEGER NOT NULL,
+    PRIMARY KEY (hora, prioridade)
+);
+
+-- Espera entre a entrada na fila e o início da consulta, por dia e prioridade
+CREATE TABLE Painel_espera_dia (
+    dia DATE NOT NULL,
+    prioridade VARCHAR(50) NOT NULL,
+    consultas INTEGER NOT NULL,
+    espera_total_min DOUBLE PRECISION NOT NULL,
+    espera_max_min DOUBLE PRECISION NOT NULL,
+    PRIMARY KEY (dia, prioridade)
+);
+
+-- Consultas por médico e dia
+CREATE TABLE Painel_consultas_medico_dia (
+    dia DATE NOT NULL,
+    id_medico INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    PRIMARY KEY (dia, id_medico)
+);
+
+-- Marca d'água de cada agregado: maior id da tabela de origem já incorporado
+CREATE TABLE Painel_marca (
+    agregado VARCHAR(50) PRIMARY KEY,
+    ultimo_id BIGINT NOT NULL DEFAULT 0,
+    atualizado_em TIMESTAMP
+);
+INSERT INTO Painel_marca (agregado) VALUES ('triagem_hora'), ('espera_dia'), ('consultas_medico_dia');
+
+-- Liga cada consulta à entrada de fila do mesmo paciente que a precedeu
+CREATE INDEX IF NOT EXISTS idx_fila_paciente_entrada ON Fila (id_paciente, hora_entrada);
@@ -0,0 +1,8 @@
+-- Linha do tempo do paciente (linha_do_tempo.py). Cada tipo de evento é lido
+-- por um índice (id_paciente, data), do mais recente para o mais antigo, e só
+-- até o tamanho da página. Triagem, Consulta (e Prescricao por ela) e Fila já
+-- têm esse índice (migrações 001 e 008).
+
+CREATE INDEX IF NOT EXISTS idx_atestado_paciente_data ON Atestado (id_paciente, data);
+CREATE INDEX IF NOT EXISTS idx_recebe_vacina_paciente_data ON Paciente_Recebe_Vacina (id_paciente, data_aplicacao);
+CREATE INDEX IF NOT EXISTS idx_assiste_video_paciente_data ON Paciente_Assiste_Video (id_paciente, data_visualizacao);
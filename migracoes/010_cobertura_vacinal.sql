@@ -0,0 +1,46 @@
+-- Notificação das doses aplicadas para o índice de cobertura vacinal
+-- (cobertura.py). Uma notificação por comando no canal vacinacao_alterada,
+-- com os pacientes afetados em "id"; comandos que atingem mais de 200
+-- pacientes (cargas em massa) mandam "id" nulo e o índice é remontado.
+
+CREATE OR REPLACE FUNCTION notificar_vacinacao() RETURNS trigger AS $$
+DECLARE
+    pacientes INTEGER[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(id_paciente) INTO pacientes
+        FROM (SELECT DISTINCT id_paciente FROM novas LIMIT 201) s;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(id_paciente) INTO pacientes
+        FROM (SELECT DISTINCT id_paciente FROM antigas LIMIT 201) s;
+    ELSE
+        SELECT array_agg(id_paciente) INTO pacientes
+        FROM (SELECT id_paciente FROM novas UNION SELECT id_paciente FROM antigas LIMIT 201) s;
+    END IF;
+    IF pacientes IS NULL THEN
+        RETURN NULL;
+    END IF;
+    PERFORM pg_notify(
+        'vacinacao_alterada',
+        json_build_object('operacao', TG_OP,
+                          'id', CASE WHEN cardinality(pacientes) <= 200 THEN to_json(pacientes) END)::text
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Tabelas de transição só podem ser declaradas em triggers de um único evento
+CREATE TRIGGER trg_recebe_vacina_notificar_insercao
+    AFTER INSERT ON Paciente_Recebe_Vacina
+    REFERENCING NEW TABLE AS novas
+    FOR EACH STATEMENT EXECUTE FUNCTION notificar_vacinacao();
+
+CREATE TRIGGER trg_recebe_vacina_notificar_exclusao
+    AFTER DELETE ON Paciente_Recebe_Vacina
+    REFERENCING OLD TABLE AS antigas
+    FOR EACH STATEMENT EXECUTE FUNCTION notificar_vacinacao();
+
+CREATE TRIGGER trg_recebe_vacina_notificar_alteracao
+    AFTER UPDATE ON Paciente_Recebe_Vacina
+    REFERENCING OLD TABLE AS antigas NEW TABLE AS novas
+    FOR EACH STATEMENT EXECUTE FUNCTION notificar_vacinacao();
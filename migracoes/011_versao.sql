@@ -0,0 +1,29 @@
+-- Versão das linhas editáveis pelas telas (concorrência otimista).
+-- As telas gravam com UPDATE ... WHERE versao = <versão lida>: se outra mesa
+-- alterou a linha nesse meio-tempo, nenhuma linha é atualizada e a tela
+-- mostra o conflito em vez de sobrescrever. O trigger incrementa a versão em
+-- todo UPDATE, inclusive os feitos fora das telas (ex.: importação).
+-- ADD COLUMN com DEFAULT constante não reescreve as tabelas.
+
+ALTER TABLE Triagem ADD COLUMN versao INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE Consulta ADD COLUMN versao INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE Paciente ADD COLUMN versao INTEGER NOT NULL DEFAULT 1;
+
+CREATE OR REPLACE FUNCTION incrementar_versao() RETURNS trigger AS $$
+BEGIN
+    NEW.versao := OLD.versao + 1;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_triagem_versao
+    BEFORE UPDATE ON Triagem
+    FOR EACH ROW EXECUTE FUNCTION incrementar_versao();
+
+CREATE TRIGGER trg_consulta_versao
+    BEFORE UPDATE ON Consulta
+    FOR EACH ROW EXECUTE FUNCTION incrementar_versao();
+
+CREATE TRIGGER trg_paciente_versao
+    BEFORE UPDATE ON Paciente
+    FOR EACH ROW EXECUTE FUNCTION incrementar_versao();
@@ -0,0 +1,321 @@
+-- Particionamento mensal de Triagem, Fila e Consulta pela coluna data
+-- (requer PostgreSQL 14+: triggers BEFORE em tabelas particionadas e o
+-- DETACH PARTITION ... CONCURRENTLY do arquivamento).
+--
+-- As tabelas só crescem e as listagens olham quase sempre os meses recentes;
+-- com uma partição por mês o filtro de data das telas descarta as partições
+-- fora do intervalo (partition pruning), e os meses antigos podem sair da
+-- tabela com DETACH PARTITION (particoes.py os move para o schema arquivo).
+--
+-- Consequências do particionamento:
+--   * a chave primária passa a incluir a data (exigência do PostgreSQL):
+--     (id_triagem, data), (id_fila, data), (id_consulta, data);
+--   * um UNIQUE numa tabela particionada também teria de incluir a data, então
+--     "uma entrada de fila por triagem" e "um atestado por consulta" ficam em
+--     tabelas de chaves não particionadas (Fila_triagem, Consulta_atestado),
+--     mantidas por trigger na mesma transação;
+--   * uma chave estrangeira não pode apontar para só uma parte da chave de
+--     uma tabela particionada, então as que apontavam para estas tabelas
+--     (Fila -> Triagem, Prescricao -> Consulta, Paciente_Fila -> Fila) viram
+--     triggers, com o mesmo efeito (RESTRICT/CASCADE na exclusão);
+--   * os ids continuam vindo das mesmas sequências.
+
+CREATE SCHEMA IF NOT EXISTS arquivo;
+
+-- Dependentes das linhas arquivadas: um DETACH não dispara as triggers de
+-- exclusão, então particoes.py move estas linhas junto com a partição
+CREATE TABLE IF NOT EXISTS arquivo.prescricao (LIKE Prescricao);
+CREATE TABLE IF NOT EXISTS arquivo.paciente_fila (LIKE Paciente_Fila);
+-- Dispensações cuja prescrição foi arquivada (o vínculo no livro vira NULL)
+CREATE TABLE IF NOT EXISTS arquivo.movimento_prescricao (
+    id_movimento BIGINT PRIMARY KEY,
+    id_consulta INTEGER NOT NULL,
+    id_medicamento INTEGER NOT NULL
+);
+
+-- Cria (se ainda não existe) a partição de `tabela` do mês de `mes`, no mesmo
+-- schema da tabela, e devolve o nome dela: <tabela>_AAAA_MM. Chamada pela
+-- manutenção (particoes.py) e antes de gravar uma consulta, cuja data é
+-- escolhida na tela.
+CREATE OR REPLACE FUNCTION criar_particao_mensal(tabela regclass, mes date) RETURNS text AS $$
+DECLARE
+    inicio date := date_trunc('month', mes)::date;
+    esquema text;
+    nome text;
+BEGIN
+    SELECT n.nspname, c.relname || '_' || to_char(inicio, 'YYYY_MM') INTO esquema, nome
+    FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE c.oid = tabela;
+    IF to_regclass(format('%I.%I', esquema, nome)) IS NULL THEN
+        BEGIN
+            EXECUTE format('CREATE TABLE %I.%I PARTITION OF %s FOR VALUES FROM (%L) TO (%L)',
+                           esquema, nome, tabela, inicio, (inicio + INTERVAL '1 month')::date);
+        EXCEPTION WHEN duplicate_table THEN
+            -- Outra sessão criou a mesma partição ao mesmo tempo
+            NULL;
+        END;
+    END IF;
+    RETURN nome;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Partições de todos os meses de `inicio` a `fim` (inclusive)
+CREATE OR REPLACE FUNCTION criar_particoes_mensais(tabela regclass, inicio date, fim date) RETURNS SETOF text AS $$
+    SELECT criar_particao_mensal(tabela, mes::date)
+    FROM generate_series(date_trunc('month', inicio)::date, fim, INTERVAL '1 month') mes
+$$ LANGUAGE sql;
+
+
+-- --- Novas tabelas ---
+
+ALTER TABLE Prescricao DROP CONSTRAINT fk_prescricao_consulta;
+ALTER TABLE Paciente_Fila DROP CONSTRAINT fk_paciente_fila_fila;
+ALTER TABLE Fila DROP CONSTRAINT fk_fila_triagem;
+
+ALTER TABLE Triagem RENAME TO triagem_antiga;
+ALTER TABLE Fila RENAME TO fila_antiga;
+ALTER TABLE Consulta RENAME TO consulta_antiga;
+
+CREATE TABLE Triagem (
+    id_triagem INTEGER NOT NULL DEFAULT nextval('triagem_id_triagem_seq'),
+    data TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    descricao TEXT,
+    classificacao_de_prioridade VARCHAR(50) NOT NULL,
+    id_paciente INTEGER NOT NULL,
+    id_profissional INTEGER NOT NULL,
+    versao INTEGER NOT NULL DEFAULT 1,
+    CONSTRAINT pk_triagem PRIMARY KEY (id_triagem, data),
+    CONSTRAINT fk_triagem_paciente FOREIGN KEY (id_paciente) REFERENCES Paciente(id_paciente),
+    CONSTRAINT fk_triagem_profissional FOREIGN KEY (id_profissional) REFERENCES Profissional(id_profissional)
+) PARTITION BY RANGE (data);
+
+CREATE TABLE Fila (
+    id_fila INTEGER NOT NULL DEFAULT nextval('fila_id_fila_seq'),
+    hora_entrada TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    data DATE NOT NULL,
+    tipo_consulta VARCHAR(100),
+    id_triagem INTEGER NOT NULL,
+    id_profissional INTEGER,
+    id_paciente INTEGER NOT NULL,
+    hora_chamada TIMESTAMP,
+    CONSTRAINT pk_fila PRIMARY KEY (id_fila, data),
+    CONSTRAINT fk_fila_profissional FOREIGN KEY (id_profissional) REFERENCES Profissional(id_profissional),
+    CONSTRAINT fk_fila_paciente FOREIGN KEY (id_paciente) REFERENCES Paciente(id_paciente)
+) PARTITION BY RANGE (data);
+
+CREATE TABLE Consulta (
+    id_consulta INTEGER NOT NULL DEFAULT nextval('consulta_id_consulta_seq'),
+    data DATE NOT NULL,
+    hora_inicio TIME NOT NULL,
+    hora_fim TIME,
+    diagnostico TEXT,
+    id_paciente INTEGER NOT NULL,
+    id_medico INTEGER NOT NULL,
+    id_atestado INTEGER,
+    versao INTEGER NOT NULL DEFAULT 1,
+    CONSTRAINT pk_consulta PRIMARY KEY (id_consulta, data),
+    CONSTRAINT fk_consulta_paciente FOREIGN KEY (id_paciente) REFERENCES Paciente(id_paciente),
+    CONSTRAINT fk_consulta_medico FOREIGN KEY (id_medico) REFERENCES Medico(id_profissional),
+    CONSTRAINT fk_consulta_atestado FOREIGN KEY (id_atestado) REFERENCES Atestado(id_atestado)
+) PARTITION BY RANGE (data);
+
+-- Uma partição por mês com dados, mais os três meses seguintes ao atual
+SELECT criar_particoes_mensais('triagem', COALESCE(min(data)::date, CURRENT_DATE),
+                               GREATEST(max(data)::date, (CURRENT_DATE + INTERVAL '3 months')::date))
+FROM triagem_antiga;
+SELECT criar_particoes_mensais('fila', COALESCE(min(data), CURRENT_DATE),
+                               GREATEST(max(data), (CURRENT_DATE + INTERVAL '3 months')::date))
+FROM fila_antiga;
+SELECT criar_particoes_mensais('consulta', COALESCE(min(data), CURRENT_DATE),
+                               GREATEST(max(data), (CURRENT_DATE + INTERVAL '3 months')::date))
+FROM consulta_antiga;
+
+-- Cópia antes de índices e triggers (mais rápida e sem disparar notificações)
+INSERT INTO Triagem (id_triagem, data, descricao, classificacao_de_prioridade, id_paciente, id_profissional, versao)
+SELECT id_triagem, data, descricao, classificacao_de_prioridade, id_paciente, id_profissional, versao
+FROM triagem_antiga;
+INSERT INTO Fila (id_fila, hora_entrada, data, tipo_consulta, id_triagem, id_profissional, id_paciente, hora_chamada)
+SELECT id_fila, hora_entrada, data, tipo_consulta, id_triagem, id_profissional, id_paciente, hora_chamada
+FROM fila_antiga;
+INSERT INTO Consulta (id_consulta, data, hora_inicio, hora_fim, diagnostico, id_paciente, id_medico, id_atestado, versao)
+SELECT id_consulta, data, hora_inicio, hora_fim, diagnostico, id_paciente, id_medico, id_atestado, versao
+FROM consulta_antiga;
+
+-- As sequências pertenciam às colunas antigas e cairiam junto com elas
+ALTER SEQUENCE triagem_id_triagem_seq OWNED BY NONE;
+ALTER SEQUENCE fila_id_fila_seq OWNED BY NONE;
+ALTER SEQUENCE consulta_id_consulta_seq OWNED BY NONE;
+
+DROP TABLE triagem_antiga, fila_antiga, consulta_antiga;
+
+ALTER SEQUENCE triagem_id_triagem_seq OWNED BY Triagem.id_triagem;
+ALTER SEQUENCE fila_id_fila_seq OWNED BY Fila.id_fila;
+ALTER SEQUENCE consulta_id_consulta_seq OWNED BY Consulta.id_consulta;
+
+
+-- --- Índices e triggers (recriados nas tabelas particionadas) ---
+
+-- Migração 001
+CREATE INDEX idx_triagem_data_id ON Triagem (data, id_triagem);
+CREATE INDEX idx_triagem_prioridade_data_id ON Triagem (classificacao_de_prioridade, data, id_triagem);
+CREATE INDEX idx_triagem_paciente_data ON Triagem (id_paciente, data);
+CREATE INDEX idx_triagem_profissional_data ON Triagem (id_profissional, data);
+CREATE INDEX idx_consulta_data_hora ON Consulta (data, hora_inicio);
+CREATE INDEX idx_consulta_paciente_data ON Consulta (id_paciente, data);
+CREATE INDEX idx_consulta_medico_data ON Consulta (id_medico, data);
+CREATE INDEX idx_fila_profissional ON Fila (id_profissional);
+-- Antes atendido pelo UNIQUE de id_triagem (exclusão da triagem, junções)
+CREATE INDEX idx_fila_triagem ON Fila (id_triagem);
+-- Migração 003
+CREATE INDEX idx_fila_aguardando ON Fila (hora_entrada) WHERE hora_chamada IS NULL;
+-- Migração 008
+CREATE INDEX idx_fila_paciente_entrada ON Fila (id_paciente, hora_entrada);
+
+-- Migração 002
+CREATE TRIGGER trg_triagem_notificar
+    AFTER INSERT OR UPDATE OR DELETE ON Triagem
+    FOR EACH ROW EXECUTE FUNCTION notificar_alteracao('triagem_alterada', 'id_triagem');
+
+CREATE TRIGGER trg_fila_notificar
+    AFTER INSERT OR UPDATE OR DELETE ON Fila
+    FOR EACH ROW EXECUTE FUNCTION notificar_alteracao('fila_alterada', 'id_fila');
+
+-- Migração 011
+CREATE TRIGGER trg_triagem_versao
+    BEFORE UPDATE ON Triagem
+    FOR EACH ROW EXECUTE FUNCTION incrementar_versao();
+
+CREATE TRIGGER trg_consulta_versao
+    BEFORE UPDATE ON Consulta
+    FOR EACH ROW EXECUTE FUNCTION incrementar_versao();
+
+
+-- --- Unicidade entre partições ---
+
+CREATE TABLE Fila_triagem (
+    id_triagem INTEGER NOT NULL,
+    CONSTRAINT pk_fila_triagem PRIMARY KEY (id_triagem)
+);
+CREATE TABLE Consulta_atestado (
+    id_atestado INTEGER NOT NULL,
+    CONSTRAINT pk_consulta_atestado PRIMARY KEY (id_atestado)
+);
+INSERT INTO Fila_triagem SELECT id_triagem FROM Fila;
+INSERT INTO Consulta_atestado SELECT id_atestado FROM Consulta WHERE id_atestado IS NOT NULL;
+
+-- AFTER INSERT OR UPDATE OR DELETE. TG_ARGV: tabela de chaves, coluna.
+-- A chave primária da tabela de chaves recusa o valor repetido.
+CREATE OR REPLACE FUNCTION manter_chave_unica() RETURNS trigger AS $$
+DECLARE
+    antigo integer;
+    novo integer;
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        antigo := (to_jsonb(OLD) ->> TG_ARGV[1])::integer;
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        novo := (to_jsonb(NEW) ->> TG_ARGV[1])::integer;
+    END IF;
+    IF antigo IS NOT DISTINCT FROM novo THEN
+        RETURN NULL;
+    END IF;
+    IF antigo IS NOT NULL THEN
+        EXECUTE format('DELETE FROM %I.%I WHERE %I = $1', TG_TABLE_SCHEMA, TG_ARGV[0], TG_ARGV[1]) USING antigo;
+    END IF;
+    IF novo IS NOT NULL THEN
+        EXECUTE format('INSERT INTO %I.%I (%I) VALUES ($1)', TG_TABLE_SCHEMA, TG_ARGV[0], TG_ARGV[1]) USING novo;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Uma entrada de fila por triagem (antes UNIQUE em Fila.id_triagem)
+CREATE TRIGGER trg_fila_chave_triagem
+    AFTER INSERT OR DELETE OR UPDATE OF id_triagem ON Fila
+    FOR EACH ROW EXECUTE FUNCTION manter_chave_unica('fila_triagem', 'id_triagem');
+
+-- Um atestado por consulta (antes UNIQUE em Consulta.id_atestado)
+CREATE TRIGGER trg_consulta_chave_atestado
+    AFTER INSERT OR DELETE OR UPDATE OF id_atestado ON Consulta
+    FOR EACH ROW EXECUTE FUNCTION manter_chave_unica('consulta_atestado', 'id_atestado');
+
+
+-- --- Referências às tabelas particionadas ---
+-- A coluna tem o mesmo nome nas duas pontas (id_triagem, id_consulta, id_fila).
+
+-- AFTER INSERT OR UPDATE em quem referencia. TG_ARGV: coluna, tabela referenciada.
+-- FOR KEY SHARE impede que a linha referenciada seja excluída até o commit.
+CREATE OR REPLACE FUNCTION verificar_referencia() RETURNS trigger AS $$
+DECLARE
+    valor integer := (to_jsonb(NEW) ->> TG_ARGV[0])::integer;
+    existe integer;
+BEGIN
+    IF valor IS NULL THEN
+        RETURN NULL;
+    END IF;
+    EXECUTE format('SELECT 1 FROM %I.%I WHERE %I = $1 LIMIT 1 FOR KEY SHARE',
+                   TG_TABLE_SCHEMA, TG_ARGV[1], TG_ARGV[0])
+        INTO existe USING valor;
+    IF existe IS NULL THEN
+        RAISE EXCEPTION '%: % = % não existe em %', TG_TABLE_NAME, TG_ARGV[0], valor, TG_ARGV[1]
+            USING ERRCODE = 'foreign_key_violation';
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- AFTER DELETE na tabela referenciada. TG_ARGV: tabela, coluna, tabela que
+-- referencia, ação (CASCADE ou RESTRICT). Uma mudança de partição (UPDATE da
+-- data) também chega aqui como DELETE; nesse caso a chave continua existindo
+-- e nada acontece.
+CREATE OR REPLACE FUNCTION remover_referencias() RETURNS trigger AS $$
+DECLARE
+    valor integer := (to_jsonb(OLD) ->> TG_ARGV[1])::integer;
+    existe integer;
+BEGIN
+    EXECUTE format('SELECT 1 FROM %I.%I WHERE %I = $1 LIMIT 1', TG_TABLE_SCHEMA, TG_ARGV[0], TG_ARGV[1])
+        INTO existe USING valor;
+    IF existe IS NOT NULL THEN
+        RETURN NULL;
+    END IF;
+    IF TG_ARGV[3] = 'CASCADE' THEN
+        EXECUTE format('DELETE FROM %I.%I WHERE %I = $1', TG_TABLE_SCHEMA, TG_ARGV[2], TG_ARGV[1]) USING valor;
+    ELSE
+        EXECUTE format('SELECT 1 FROM %I.%I WHERE %I = $1 LIMIT 1', TG_TABLE_SCHEMA, TG_ARGV[2], TG_ARGV[1])
+            INTO existe USING valor;
+        IF existe IS NOT NULL THEN
+            RAISE EXCEPTION '%: % = % ainda é referenciado por %', TG_ARGV[0], TG_ARGV[1], valor, TG_ARGV[2]
+                USING ERRCODE = 'foreign_key_violation';
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Fila -> Triagem (antes fk_fila_triagem)
+CREATE TRIGGER trg_fila_referencia_triagem
+    AFTER INSERT OR UPDATE OF id_triagem ON Fila
+    FOR EACH ROW EXECUTE FUNCTION verificar_referencia('id_triagem', 'triagem');
+CREATE TRIGGER trg_triagem_referenciada_fila
+    AFTER DELETE ON Triagem
+    FOR EACH ROW EXECUTE FUNCTION remover_referencias('triagem', 'id_triagem', 'fila', 'RESTRICT');
+
+-- Prescricao -> Consulta, ON DELETE CASCADE (antes fk_prescricao_consulta)
+CREATE TRIGGER trg_prescricao_referencia_consulta
+    AFTER INSERT OR UPDATE OF id_consulta ON Prescricao
+    FOR EACH ROW EXECUTE FUNCTION verificar_referencia('id_consulta', 'consulta');
+CREATE TRIGGER trg_consulta_referenciada_prescricao
+    AFTER DELETE ON Consulta
+    FOR EACH ROW EXECUTE FUNCTION remover_referencias('consulta', 'id_consulta', 'prescricao', 'CASCADE');
+
+-- Paciente_Fila -> Fila, ON DELETE CASCADE (antes fk_paciente_fila_fila)
+CREATE TRIGGER trg_paciente_fila_referencia_fila
+    AFTER INSERT OR UPDATE OF id_fila ON Paciente_Fila
+    FOR EACH ROW EXECUTE FUNCTION verificar_referencia('id_fila', 'fila');
+CREATE TRIGGER trg_fila_referenciada_paciente_fila
+    AFTER DELETE ON Fila
+    FOR EACH ROW EXECUTE FUNCTION remover_referencias('fila', 'id_fila', 'paciente_fila', 'CASCADE');
+-- A chave primária de Paciente_Fila começa por id_paciente; a exclusão procura por id_fila
+CREATE INDEX IF NOT EXISTS idx_paciente_fila_fila ON Paciente_Fila (id_fila);
+
+ANALYZE Triagem, Fila, Consulta;
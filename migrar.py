@@ -0,0 +1,54 @@
+import pathlib
+
+import banco
+
+# Aplica, em ordem, os scripts de migracoes/ que ainda não rodaram no banco.
+# Cada script roda numa transação própria e fica registrado em
+# schema_migracoes, então rodar de novo não reaplica nada.
+#
+# Uso: python migrar.py   (depois de criar o banco com esquema.sql)
+
+PASTA_MIGRACOES = pathlib.Path(__file__).parent / "migracoes"
+
+def listar_migracoes():
+    return sorted(PASTA_MIGRACOES.glob("*.sql"))
+
+def aplicar_pendentes(con):
+    """Aplica as migrações pendentes usando a conexão psycopg2 `con`.
+
+    Retorna os nomes das migrações aplicadas.
+    """
+    with con.cursor() as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migracoes (
+                nome VARCHAR(200) PRIMARY KEY,
+                aplicada_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute("SELECT nome FROM schema_migracoes")
+        aplicadas = {nome for (nome,) in cursor.fetchall()}
+    con.commit()
+
+    novas = []
+    for arquivo in listar_migracoes():
+        if arquivo.name in aplicadas:
+            continue
+        try:
+            with con.cursor() as cursor:
+                cursor.execute(arquivo.read_text(encoding="utf-8"))
+                cursor.execute("INSERT INTO schema_migracoes (nome) VALUES (%s)", (arquivo.name,))
+            con.commit()
+        except Exception:
+            con.rollback()
+            raise
+        novas.append(arquivo.name)
+    return novas
+
+if __name__ == "__main__":
+    with banco.conexao_psycopg() as con:
+        novas = aplicar_pendentes(con)
+    if novas:
+        for nome in novas:
+            print(f"Aplicada: {nome}")
+    else:
+        print("Nenhuma migração pendente.")
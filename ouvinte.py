@@ -0,0 +1,141 @@
+import json
+import logging
+import select
+import threading
+import time
+from functools import partial
+
+from panel.io.state import set_curdoc, state
+
+import banco
+from tarefas import aguardar
+
+# Ouvinte único (por processo) dos canais LISTEN/NOTIFY publicados pelos
+# triggers de migracoes/002_notificacoes.sql, 004_notificar_referencia.sql e
+# 010_cobertura_vacinal.sql.
+#
+# Uma thread em segundo plano mantém uma conexão dedicada escutando os canais
+# e repassa cada notificação para as sessões Panel que assinaram o canal. O
+# callback de cada sessão roda no event loop do documento dela.
+
+CANAIS = ("triagem_alterada", "fila_alterada", "referencia_alterada", "vacinacao_alterada")
+
+# Operação enviada aos assinantes quando a conexão cai e volta: notificações
+# podem ter sido perdidas, então as telas devem recarregar.
+RESSINCRONIZAR = "RESSINCRONIZAR"
+
+logger = logging.getLogger(__name__)
+
+class Evento:
+    """Uma notificação recebida, compartilhada por todas as sessões assinantes.
+
+    `memo` permite que a primeira sessão busque os dados da linha alterada e
+    as demais reaproveitem o resultado, então cada alteração custa uma única
+    leitura no banco, independentemente do número de telas abertas.
+    """
+
+    def __init__(self, canal, dados):
+        self.canal = canal
+        self.dados = dados
+        self._memo = {}
+        self._lock = threading.Lock()
+
+    def memo(self, chave, funcao):
+        with self._lock:
+            if chave not in self._memo:
+                self._memo[chave] = funcao()
+            return self._memo[chave]
+
+class Ouvinte:
+
+    def __init__(self, canais=CANAIS, espera=1.0):
+        self.canais = canais
+        self.espera = espera
+        self._assinantes = {canal: {} for canal in canais}
+        self._proximo_id = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def assinar(self, canal, callback):
+        """Chama `callback(evento)` a cada notificação do canal. Retorna a função que cancela."""
+        if canal not in self._assinantes:
+            raise ValueError(f"Canal desconhecido: {canal}")
+        with self._lock:
+            self._proximo_id += 1
+            chave = self._proximo_id
+            self._assinantes[canal][chave] = callback
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._executar, name="ouvinte-notify", daemon=True)
+                self._thread.start()
+        return partial(self._cancelar, canal, chave)
+
+    def assinar_sessao(self, canal, callback):
+        """Como `assinar`, mas executa o callback no documento da sessão atual.
+
+        A assinatura é cancelada automaticamente quando a sessão termina.
+        """
+        doc = state.curdoc
+        if doc is None or doc.session_context is None:
+            return self.assinar(canal, callback)
+
+        def agendar(evento):
+            async def executar():
+                with set_curdoc(doc):
+                    # Callbacks async (que esperam o banco em outra thread) também são aceitos
+                    await aguardar(callback(evento))
+            doc.add_next_tick_callback(executar)
+
+        cancelar = self.assinar(canal, agendar)
+        state.on_session_destroyed(lambda contexto: cancelar())
+        return cancelar
+
+    def _cancelar(self, canal, chave):
+        with self._lock:
+            self._assinantes[canal].pop(chave, None)
+
+    def _despachar(self, canal, dados):
+        evento = Evento(canal, dados)
+        with self._lock:
+            callbacks = list(self._assinantes.get(canal, {}).values())
+        for callback in callbacks:
+            try:
+                callback(evento)
+            except Exception:
+                logger.exception("Erro ao repassar notificação do canal %s", canal)
+
+    def _executar(self):
+        reconexao = False
+        while True:
+            try:
+                con = banco.conexao_dedicada()
+            except Exception:
+                logger.exception("Ouvinte sem conexão com o banco; tentando de novo")
+                time.sleep(5)
+                continue
+            try:
+                con.autocommit = True
+                with con.cursor() as cursor:
+                    for canal in self.canais:
+                        cursor.execute(f'LISTEN "{canal}"')
+                if reconexao:
+                    for canal in self.canais:
+                        self._despachar(canal, {"operacao": RESSINCRONIZAR, "id": None})
+                while True:
+                    if select.select([con], [], [], self.espera) == ([], [], []):
+                        continue
+                    con.poll()
+                    while con.notifies:
+                        notificacao = con.notifies.pop(0)
+                        try:
+                            dados = json.loads(notificacao.payload)
+                        except ValueError:
+                            dados = {"operacao": None, "id": notificacao.payload}
+                        self._despachar(notificacao.channel, dados)
+            except Exception:
+                logger.exception("Conexão do ouvinte caiu; reconectando")
+                time.sleep(1)
+            finally:
+                con.close()
+            reconexao = True
+
+ouvinte = Ouvinte()
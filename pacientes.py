@@ -1,37 +1,23 @@
+import io
 
-import os
-from dotenv import load_dotenv
 import pandas as pd
-import psycopg2 as pg
-import sqlalchemy
-from sqlalchemy import create_engine
 import panel as pn
+from sqlalchemy import text
 
-
-load_dotenv()
-
-
-DB_HOST = os.getenv('DB_HOST')
-DB_NAME = os.getenv('DB_NAME')
-DB_USER = os.getenv('DB_USER')
-DB_PASS = os.getenv('DB_PASS')
-
-
-con = pg.connect(host=DB_HOST, dbname=DB_NAME, user=DB_USER, password=DB_PASS)
-
-
-cnx = f'postgresql://{DB_USER}:{DB_PASS}@{DB_HOST}/{DB_NAME}'
-sqlalchemy_engine = create_engine(cnx)
-
-
-query = "select * from Paciente;"
-df = pd.read_sql_query(query, sqlalchemy_engine)
+import banco
+import cache
+import grade
+import importacao
+import instrumentacao
+from tarefas import em_thread, carregando
 
 
 pn.extension()
 pn.extension('tabulator')
 pn.extension(notifications=True)
 
+instrumentacao.servir_metricas("pacientes")
+
 
 flag = ''
 
@@ -85,103 +71,218 @@ buttonInserir = pn.widgets.Button(name='Inserir', button_type='default')
 buttonExcluir = pn.widgets.Button(name='Excluir', button_type='default')
 buttonAtualizar = pn.widgets.Button(name='Atualizar', button_type='default')
 
-def queryAll():
-    query = f"select * from Paciente"
-    df = pd.read_sql_query(query, sqlalchemy_engine) 
-    return pn.widgets.Tabulator(df)
+# Tabela única da tela: as escritas só aplicam a linha afetada (RETURNING)
+tabela_pacientes = pn.widgets.Tabulator(pd.DataFrame(), formatters={'data_nascimento': grade.DATA}, hidden_columns=['versao'])
+
+def linha_do_cursor(cursor):
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return dict(zip([col.name for col in cursor.description], row))
+
+def aplicar_linha(linha):
+    """Atualiza (patch) ou acrescenta (stream) um paciente na tabela."""
+    nova = grade.dataframe([tuple(linha.values())], list(linha))
+    df = tabela_pacientes.value
+    if df.empty:
+        tabela_pacientes.value = nova
+        return
+    indices = df.index[df['id_paciente'] == linha['id_paciente']]
+    if len(indices):
+        tabela_pacientes.patch({col: [(indices[0], nova[col].iloc[0])] for col in nova.columns})
+    else:
+        tabela_pacientes.stream(nova)
+
+def remover_linha(id_paciente):
+    df = tabela_pacientes.value
+    if not df.empty:
+        tabela_pacientes.value = df[df['id_paciente'] != id_paciente]
+
+def remover_linha_cpf(cpf_paciente):
+    df = tabela_pacientes.value
+    if not df.empty:
+        tabela_pacientes.value = df[df['cpf'] != cpf_paciente]
+
+def ler(query, params=None):
+    with banco.conexao() as conn:
+        return grade.ler(conn, query, params)
+
+def gravar_linha(sql, valores):
+    """Executa a escrita e devolve a linha do RETURNING (ou None)."""
+    with banco.conexao_psycopg() as con, con.cursor() as cursor:
+        cursor.execute(sql, valores)
+        linha = linha_do_cursor(cursor)
+        con.commit()
+    return linha
 
-def on_consultar():
+async def on_consultar():
     try:  
-        query = f"select * from Paciente where ('{cpf.value_input}'='{flag}' or cpf='{cpf.value_input}')"
-        df = pd.read_sql_query(query, sqlalchemy_engine) 
-        table = pn.widgets.Tabulator(df)
-        return table
+        query = text("select * from Paciente where (:cpf = :flag or cpf = :cpf)")
+        with carregando(buttonConsultar):
+            df = await em_thread(ler, query, {"cpf": cpf.value_input, "flag": flag})
+        tabela_pacientes.value = df
+        return tabela_pacientes
     except Exception as e:
         return pn.pane.Alert(f'Não foi possível consultar: {str(e)}')
 
-def on_inserir():
+async def on_inserir():
     try:            
-        cursor = con.cursor()
-        
-        cursor.execute(
-            "INSERT INTO Paciente(nome, cpf, rg, data_nascimento, endereco_rua, endereco_numero, endereco_bairro, endereco_cidade, genero) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)", 
-            (
-                nome.value_input, 
-                cpf.value_input, 
-                rg.value_input,
-                datanasc.value, 
-                endereco_rua.value_input,
-                endereco_numero.value_input,
-                endereco_bairro.value_input,
-                endereco_cidade.value_input,
-                genero_widget.value 
+        with carregando(buttonInserir):
+            linha = await em_thread(
+                gravar_linha,
+                "INSERT INTO Paciente(nome, cpf, rg, data_nascimento, endereco_rua, endereco_numero, endereco_bairro, endereco_cidade, genero) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING *", 
+                (
+                    nome.value_input, 
+                    cpf.value_input, 
+                    rg.value_input,
+                    datanasc.value, 
+                    endereco_rua.value_input,
+                    endereco_numero.value_input,
+                    endereco_bairro.value_input,
+                    endereco_cidade.value_input,
+                    genero_widget.value 
+                )
             )
-        )
-        con.commit()
-        return queryAll()
+        # Os selects das outras telas passam a ver a alteração
+        cache.invalidar("pacientes")
+        aplicar_linha(linha)
+        return tabela_pacientes
     except Exception as e:
-        con.rollback() 
-        cursor.close()
         return pn.pane.Alert(f'Não foi possível inserir: {str(e)}')
 
-def on_atualizar():
+def versao_na_grade(cpf_paciente):
+    """Versão do paciente como está na tabela da tela (None se ele não está nela)."""
+    df = tabela_pacientes.value
+    if df.empty or 'versao' not in df:
+        return None
+    versoes = df.loc[df['cpf'] == cpf_paciente, 'versao']
+    return int(versoes.iloc[0]) if len(versoes) else None
+
+def buscar_paciente(cpf_paciente):
+    """Linha atual do paciente (None se o CPF não existe)."""
+    with banco.conexao_psycopg() as con, con.cursor() as cursor:
+        cursor.execute("SELECT * FROM Paciente WHERE cpf = %s", (cpf_paciente,))
+        return linha_do_cursor(cursor)
+
+def atualizar_paciente(valores, cpf_paciente, versao):
+    """UPDATE do paciente pelo CPF, só se ele ainda estiver em `versao`.
+
+    Devolve a linha gravada. Se o paciente mudou ou foi removido desde a
+    consulta, levanta banco.ConflitoDeVersao com a linha atual.
+    """
+    sql = ("UPDATE Paciente SET nome = %s, data_nascimento = %s, genero = %s, endereco_rua = %s, endereco_numero = %s, "
+           "endereco_bairro = %s, endereco_cidade = %s WHERE cpf = %s AND versao = %s RETURNING *")
+    with banco.conexao_psycopg() as con, con.cursor() as cursor:
+        cursor.execute(sql, valores + (cpf_paciente, versao))
+        linha = linha_do_cursor(cursor)
+        if linha is None:
+            cursor.execute("SELECT * FROM Paciente WHERE cpf = %s", (cpf_paciente,))
+            atual = linha_do_cursor(cursor)
+            raise banco.ConflitoDeVersao(f"o paciente de CPF {cpf_paciente}", atual and atual['versao'], atual)
+        con.commit()
+    return linha
+
+async def on_atualizar():
     try:
-        cursor = con.cursor()
-        cursor.execute(
-            "UPDATE Paciente SET nome = %s, data_nascimento = %s, genero = %s, endereco_rua = %s, endereco_numero = %s, endereco_bairro = %s, endereco_cidade = %s WHERE cpf = %s",
-            (
-                nome.value_input,
-                datanasc.value,
-                genero_widget.value,
-                endereco_rua.value_input,
-                endereco_numero.value_input,
-                endereco_bairro.value_input,
-                endereco_cidade.value_input,
-                cpf.value_input
+        # Grava só sobre a versão que a tabela mostrava
+        versao = versao_na_grade(cpf.value_input)
+        if versao is None:
+            # Fora da tabela a versão não é conhecida: o paciente é carregado nela
+            # e a gravação fica para o próximo clique
+            with carregando(buttonAtualizar):
+                atual = await em_thread(buscar_paciente, cpf.value_input)
+            if atual is None:
+                return pn.pane.Alert(f'Nenhum paciente com CPF {cpf.value_input}.', alert_type='warning')
+            aplicar_linha(atual)
+            return pn.pane.Alert('O paciente não estava na tabela e foi carregado com os dados atuais: confira e '
+                                 'clique em Atualizar de novo para gravar.', alert_type='warning')
+        with carregando(buttonAtualizar):
+            linha = await em_thread(
+                atualizar_paciente,
+                (
+                    nome.value_input,
+                    datanasc.value,
+                    genero_widget.value,
+                    endereco_rua.value_input,
+                    endereco_numero.value_input,
+                    endereco_bairro.value_input,
+                    endereco_cidade.value_input,
+                ),
+                cpf.value_input,
+                versao,
             )
-        )
-        con.commit()
-        return queryAll()
+        cache.invalidar("pacientes")
+        aplicar_linha(linha)
+        return tabela_pacientes
+    except banco.ConflitoDeVersao as conflito:
+        if conflito.linha is None:
+            remover_linha_cpf(cpf.value_input)
+            return pn.pane.Alert(str(conflito), alert_type='danger')
+        # A tabela passa a mostrar a versão atual; atualizar de novo grava por cima dela
+        aplicar_linha(conflito.linha)
+        return pn.pane.Alert(f'{conflito} A tabela mostra os dados atuais: confira e clique em Atualizar de novo '
+                             'para gravar por cima.', alert_type='danger')
     except Exception as e:
-        con.rollback() 
-        cursor.close()
         return pn.pane.Alert(f'Não foi possível atualizar: {str(e)}')
 
 
-def on_excluir():
+async def on_excluir():
     try:
-        cursor = con.cursor()
-        cursor.execute("DELETE FROM Paciente WHERE cpf = %s", (cpf.value_input,))
-        rows_deleted = cursor.rowcount
-        con.commit()
+        with carregando(buttonExcluir):
+            linha = await em_thread(gravar_linha, "DELETE FROM Paciente WHERE cpf = %s RETURNING id_paciente", (cpf.value_input,))
+        cache.invalidar("pacientes")
         
-        if rows_deleted > 0:
-            
-            pass 
-        else:
-            
-            pass
+        if linha:
+            remover_linha(linha['id_paciente'])
         
-        return queryAll()
+        return tabela_pacientes
     except Exception as e:
-        con.rollback()
-        cursor.close()
         return pn.pane.Alert(f'Não foi possível excluir: {str(e)}')
 
-def table_creator(cons, ins, atu, exc):
+async def table_creator(cons, ins, atu, exc):
     if cons:
-        return on_consultar()
+        return await on_consultar()
     if ins:
-        return on_inserir()
+        return await on_inserir()
     if atu:
-        return on_atualizar()
+        return await on_atualizar()
     if exc:
-        return on_excluir()
+        return await on_excluir()
 
 
 interactive_table = pn.bind(table_creator, buttonConsultar, buttonInserir, buttonAtualizar, buttonExcluir)
 
 
+# --- Importação em massa (CSV/Parquet) ---
+
+arquivo_importacao = pn.widgets.FileInput(accept='.csv,.parquet')
+buttonImportar = pn.widgets.Button(name='Importar Arquivo', button_type='default')
+resultado_importacao = pn.pane.Markdown('')
+tabela_rejeitados = pn.widgets.Tabulator(pd.DataFrame(), pagination='local', page_size=10, visible=False)
+download_rejeitados = pn.widgets.FileDownload(filename='rejeitados.csv', label='Baixar rejeitados', visible=False)
+
+async def on_importar(event):
+    if arquivo_importacao.value is None:
+        pn.state.notifications.warning('Escolha um arquivo CSV ou Parquet.')
+        return
+    try:
+        with carregando(buttonImportar, arquivo_importacao):
+            resultado = await em_thread(
+                importacao.importar, arquivo_importacao.value, nome_arquivo=arquivo_importacao.filename)
+    except Exception as e:
+        pn.state.notifications.error(f'Não foi possível importar: {e}')
+        return
+
+    resultado_importacao.object = importacao.resumo(resultado)
+    rejeitados = resultado['rejeitados']
+    tabela_rejeitados.value = rejeitados
+    tabela_rejeitados.visible = download_rejeitados.visible = not rejeitados.empty
+    download_rejeitados.callback = lambda: io.StringIO(rejeitados.to_csv(index=False))
+    pn.state.notifications.success('Importação concluída.')
+
+buttonImportar.on_click(on_importar)
+
+
 pn.Row(
     pn.Column(
         '## Gerenciamento de Pacientes (CRUD)', 
@@ -192,7 +293,13 @@ pn.Row(
         pn.Row(buttonConsultar),
         pn.Row(buttonInserir),
         pn.Row(buttonAtualizar),
-        pn.Row(buttonExcluir)
+        pn.Row(buttonExcluir),
+        pn.pane.Markdown("### Importar Pacientes (CSV/Parquet):"),
+        arquivo_importacao,
+        pn.Row(buttonImportar),
+        resultado_importacao,
+        download_rejeitados,
+        tabela_rejeitados
     ),
     pn.Column(interactive_table)
 ).servable()
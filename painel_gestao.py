@@ -0,0 +1,140 @@
+import datetime
+
+import pandas as pd
+import panel as pn
+from bokeh.models import ColumnDataSource, HoverTool
+from bokeh.plotting import figure
+
+import agregados
+import instrumentacao
+from fila import PRIORIDADES
+from tarefas import em_thread, carregando
+
+pn.extension(notifications=True)
+
+instrumentacao.servir_metricas("painel_gestao")
+
+# Painel de gestão: volume de triagens por hora e prioridade, espera entre a
+# fila e a consulta e consultas por médico. Todos os gráficos leem só os
+# agregados mantidos por agregados.py (migração 008).
+
+CORES = dict(zip(PRIORIDADES, ["#d62728", "#f2b701", "#2ca02c", "#1f77b4"]))
+DIAS_PADRAO = 7
+
+data_inicio = pn.widgets.DatePicker(name="Data Inicial")
+data_fim = pn.widgets.DatePicker(name="Data Final")
+botao_aplicar = pn.widgets.Button(name="Aplicar", button_type="primary")
+botao_atualizar = pn.widgets.Button(name="Atualizar agregados", button_type="default")
+info = pn.pane.Markdown("")
+
+grafico_triagens = pn.pane.Bokeh(sizing_mode="stretch_width")
+grafico_espera = pn.pane.Bokeh(sizing_mode="stretch_width")
+grafico_medicos = pn.pane.Bokeh(sizing_mode="stretch_width")
+tabela_espera = pn.pane.DataFrame(pd.DataFrame(), width=700)
+
+
+# --- Gráficos ---
+
+def figura_triagens(df):
+    largura = datetime.timedelta(minutes=50)
+    fig = figure(title="Triagens por hora", x_axis_type="datetime", height=300,
+                 sizing_mode="stretch_width", tools="pan,wheel_zoom,box_zoom,reset")
+    if not df.empty:
+        larga = df.pivot_table(index="hora", columns="prioridade", values="total", aggfunc="sum", fill_value=0)
+        larga = larga.reindex(columns=PRIORIDADES, fill_value=0).reset_index()
+        fig.vbar_stack(PRIORIDADES, x="hora", width=largura, source=ColumnDataSource(larga),
+                       color=[CORES[p] for p in PRIORIDADES], legend_label=PRIORIDADES)
+        fig.legend.location = "top_left"
+        fig.legend.click_policy = "hide"
+    return fig
+
+def figura_espera(df):
+    fig = figure(title="Espera média entre fila e consulta (min)", x_axis_type="datetime", height=300,
+                 sizing_mode="stretch_width", tools="pan,wheel_zoom,box_zoom,reset")
+    for prioridade in PRIORIDADES:
+        dados = df[df["prioridade"] == prioridade]
+        if dados.empty:
+            continue
+        fonte = ColumnDataSource(dados.assign(dia=pd.to_datetime(dados["dia"])))
+        fig.line("dia", "espera_media_min", source=fonte, color=CORES[prioridade], legend_label=prioridade, line_width=2)
+        fig.scatter("dia", "espera_media_min", source=fonte, color=CORES[prioridade], size=5)
+    fig.add_tools(HoverTool(tooltips=[("Dia", "@dia{%F}"), ("Prioridade", "@prioridade"),
+                                      ("Média", "@espera_media_min{0.0} min"), ("Consultas", "@consultas")],
+                            formatters={"@dia": "datetime"}))
+    if fig.legend:
+        fig.legend.location = "top_left"
+    return fig
+
+def figura_medicos(df):
+    nomes = list(reversed(df["nome"].tolist()))
+    fig = figure(title="Consultas por médico", y_range=nomes, height=max(250, 24 * len(nomes) + 60),
+                 sizing_mode="stretch_width", tools="")
+    if not df.empty:
+        fig.hbar(y="nome", right="consultas", height=0.7, source=ColumnDataSource(df), color="#1f77b4")
+        fig.add_tools(HoverTool(tooltips=[("Médico", "@nome"), ("Consultas", "@consultas"),
+                                          ("Média por dia", "@media_por_dia{0.0}")]))
+    return fig
+
+
+# --- Callbacks ---
+
+def ler_painel(inicio, fim):
+    return (
+        agregados.triagens_por_hora(inicio, fim),
+        agregados.espera_por_dia(inicio, fim),
+        agregados.consultas_por_medico(inicio, fim),
+        agregados.ultima_atualizacao(),
+    )
+
+async def carregar_painel(event=None):
+    if data_inicio.value is None or data_fim.value is None:
+        # Por padrão mostra os últimos dias que já têm triagens agregadas
+        _, ultima_hora = await em_thread(agregados.ultima_atualizacao)
+        fim = (ultima_hora or datetime.datetime.now()).date()
+        data_fim.value = fim
+        data_inicio.value = fim - datetime.timedelta(days=DIAS_PADRAO - 1)
+    inicio, fim = data_inicio.value, data_fim.value + datetime.timedelta(days=1)
+    with carregando(grafico_triagens, grafico_espera, grafico_medicos):
+        triagens, espera, medicos, (atualizado_em, _) = await em_thread(ler_painel, inicio, fim)
+    grafico_triagens.object = figura_triagens(triagens)
+    grafico_espera.object = figura_espera(espera)
+    grafico_medicos.object = figura_medicos(medicos)
+    if espera.empty:
+        tabela_espera.object = espera
+    else:
+        resumo = espera.assign(espera_total=espera["espera_media_min"] * espera["consultas"])
+        resumo = resumo.groupby("prioridade").agg(
+            consultas=("consultas", "sum"), espera_total=("espera_total", "sum"), espera_max_min=("espera_max_min", "max"))
+        resumo["espera_media_min"] = resumo["espera_total"] / resumo["consultas"]
+        tabela_espera.object = resumo.drop(columns="espera_total").reindex(
+            [p for p in PRIORIDADES if p in resumo.index]).round(1)
+    info.object = (f"Agregados atualizados em {atualizado_em:%d/%m/%Y %H:%M}"
+                   if atualizado_em else "Agregados ainda não calculados.")
+
+async def atualizar_agregados(event):
+    with carregando(botao_atualizar):
+        tempos = await em_thread(agregados.atualizar)
+    if tempos is None:
+        pn.state.notifications.info("Os agregados já estão sendo atualizados por outro processo.")
+    await carregar_painel()
+
+botao_aplicar.on_click(carregar_painel)
+botao_atualizar.on_click(atualizar_agregados)
+
+layout = pn.Column(
+    "## 📊 Painel de Gestão",
+    pn.Row(data_inicio, data_fim, botao_aplicar, botao_atualizar),
+    info,
+    grafico_triagens,
+    grafico_espera,
+    "### Espera por prioridade no período",
+    tabela_espera,
+    grafico_medicos,
+    sizing_mode="stretch_width",
+)
+
+pn.state.onload(carregar_painel)
+layout.servable()
+
+if __name__ == "__main__":
+    pn.serve(layout, port=5011, show=True)
@@ -0,0 +1,242 @@
+import argparse
+import datetime
+import logging
+import os
+import re
+from collections import namedtuple
+from contextlib import contextmanager
+
+from sqlalchemy import text
+
+import banco
+from tarefas import em_thread
+
+# Manutenção das partições mensais de Triagem, Fila e Consulta (migração 012).
+#
+# `manter()` cria as partições dos próximos MESES_FUTUROS meses, para que as
+# inserções nunca encontrem um mês sem partição, e arquiva as partições cujo
+# mês inteiro é anterior à retenção: DETACH PARTITION ... CONCURRENTLY (sem
+# copiar linhas nem bloquear as telas) e SET SCHEMA arquivo. As linhas
+# arquivadas continuam consultáveis em arquivo.<tabela>_AAAA_MM, mas saem das
+# telas, da linha do tempo e de uma reconstrução dos agregados do painel.
+# As prescrições e as presenças na fila (Paciente_Fila) dessas linhas vão para
+# arquivo.prescricao e arquivo.paciente_fila na mesma execução.
+#
+# servidor.py agenda a manutenção (uma tarefa por processo); ela também roda à
+# mão ou pelo cron: python particoes.py [--retencao MESES]
+
+TABELAS = ("triagem", "fila", "consulta")
+ESQUEMA_ARQUIVO = "arquivo"
+
+MESES_FUTUROS = int(os.getenv("PARTICOES_MESES_FUTUROS") or 3)
+# Meses completos mantidos nas tabelas, além do mês atual. O arquivamento tira
+# linhas das telas, então só acontece quando configurado (0 = nunca arquiva)
+MESES_RETENCAO = int(os.getenv("PARTICOES_RETENCAO_MESES") or 0)
+INTERVALO_MANUTENCAO = os.getenv("PARTICOES_INTERVALO") or "6h"
+
+logger = logging.getLogger(__name__)
+
+# `pendente`: um DETACH ... CONCURRENTLY começou e não terminou
+Particao = namedtuple("Particao", ["tabela", "nome", "inicio", "fim", "pendente"])
+
+_LIMITES = re.compile(r"FROM \('([\d-]+)[^']*'\) TO \('([\d-]+)[^']*'\)")
+
+def somar_meses(dia, meses):
+    """Primeiro dia do mês `meses` meses depois (ou antes) do mês de `dia`."""
+    indice = dia.year * 12 + dia.month - 1 + meses
+    return datetime.date(indice // 12, indice % 12 + 1, 1)
+
+def listar(cursor, tabela):
+    """Partições de `tabela` no search_path atual, da mais antiga para a mais nova."""
+    cursor.execute("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), i.inhdetachpending
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+    """, (tabela,))
+    particoes = []
+    for nome, limites, pendente in cursor.fetchall():
+        encontrado = _LIMITES.search(limites)
+        if encontrado:
+            inicio, fim = (datetime.date.fromisoformat(valor) for valor in encontrado.groups())
+            particoes.append(Particao(tabela, nome, inicio, fim, pendente))
+    return sorted(particoes, key=lambda particao: particao.inicio)
+
+def garantir(conn, tabela, dia):
+    """Cria a partição do mês de `dia`, se falta, na transação de `conn` (conexão ou sessão).
+
+    A manutenção só prepara os meses à frente de hoje; uma data escolhida na
+    tela (Consulta.data) pode cair em qualquer mês e não teria partição.
+    """
+    if dia is not None:
+        conn.execute(text("SELECT criar_particao_mensal(CAST(:tabela AS regclass), :dia)"),
+                     {"tabela": tabela, "dia": dia})
+
+@contextmanager
+def _transacao(cursor):
+    # A conexão da manutenção fica em autocommit (DETACH ... CONCURRENTLY não
+    # roda dentro de uma transação); os passos que precisam de uma abrem a sua
+    cursor.execute("BEGIN")
+    try:
+        yield
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+    cursor.execute("COMMIT")
+
+def _soltas(cursor, tabela):
+    """Partições de `tabela` já desanexadas que não chegaram ao schema arquivo.
+
+    Sobram quando a manutenção é interrompida entre o DETACH e a mudança de
+    schema; a próxima execução termina o arquivamento delas.
+    """
+    cursor.execute("""
+        SELECT c.relname
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = current_schema() AND c.relkind = 'r' AND NOT c.relispartition
+          AND c.relname ~ ('^' || %s || '_\\d{4}_\\d{2}$')
+        ORDER BY c.relname
+    """, (tabela,))
+    return [nome for (nome,) in cursor.fetchall()]
+
+def _referenciada(cursor, nome):
+    """Se ainda há entradas de fila (fora das partições arquivadas) para as triagens de `nome`."""
+    cursor.execute(f"SELECT EXISTS (SELECT 1 FROM fila f JOIN {nome} t USING (id_triagem))")
+    return cursor.fetchone()[0]
+
+def _mover_dependentes(cursor, tabela, nome):
+    # As triggers remover_referencias não disparam num DETACH: as linhas que
+    # apontam para a partição desanexada vão para o arquivo junto com ela
+    if tabela == "consulta":
+        # O livro de estoque não é arquivado; a dispensação perde o vínculo
+        # com a prescrição (ON DELETE SET NULL) e ele fica registrado aqui
+        cursor.execute(f"""
+            INSERT INTO {ESQUEMA_ARQUIVO}.movimento_prescricao (id_movimento, id_consulta, id_medicamento)
+            SELECT m.id_movimento, m.id_consulta, m.id_medicamento
+            FROM movimento_estoque m JOIN {nome} c USING (id_consulta)
+        """)
+        cursor.execute(f"""
+            WITH movidas AS (
+                DELETE FROM prescricao p USING {nome} c
+                WHERE p.id_consulta = c.id_consulta
+                RETURNING p.*
+            )
+            INSERT INTO {ESQUEMA_ARQUIVO}.prescricao SELECT * FROM movidas
+        """)
+    elif tabela == "fila":
+        cursor.execute(f"""
+            WITH movidas AS (
+                DELETE FROM paciente_fila pf USING {nome} f
+                WHERE pf.id_fila = f.id_fila
+                RETURNING pf.*
+            )
+            INSERT INTO {ESQUEMA_ARQUIVO}.paciente_fila SELECT * FROM movidas
+        """)
+    elif _referenciada(cursor, nome):
+        # Uma entrada de fila criada durante o DETACH: desfaz a transação e a
+        # partição fica solta até a próxima execução
+        raise RuntimeError(f"{nome}: ainda há entradas de fila para estas triagens")
+
+def _guardar(cursor, tabela, nome):
+    """Move os dependentes e leva a tabela desanexada para o schema arquivo."""
+    with _transacao(cursor):
+        _mover_dependentes(cursor, tabela, nome)
+        cursor.execute("SELECT to_regclass(%s)", (f"{ESQUEMA_ARQUIVO}.{nome}",))
+        if cursor.fetchone()[0] is None:
+            cursor.execute(f"ALTER TABLE {nome} SET SCHEMA {ESQUEMA_ARQUIVO}")
+        else:
+            # O mês já foi arquivado antes e recebeu linhas atrasadas depois disso
+            cursor.execute(f"INSERT INTO {ESQUEMA_ARQUIVO}.{nome} SELECT * FROM {nome}")
+            cursor.execute(f"DROP TABLE {nome}")
+
+def _arquivar(cursor, particao):
+    # CONCURRENTLY só pede SHARE UPDATE EXCLUSIVE na tabela: as telas
+    # continuam lendo e gravando enquanto o DETACH espera as consultas em curso
+    cursor.execute(f"ALTER TABLE {particao.tabela} DETACH PARTITION {particao.nome} CONCURRENTLY")
+    _guardar(cursor, particao.tabela, particao.nome)
+
+def _arquivar_antigas(cursor, corte):
+    arquivadas = []
+    # Fila antes de Triagem: uma triagem só sai depois das entradas de fila dela
+    for tabela in ("consulta", "fila", "triagem"):
+        for nome in _soltas(cursor, tabela):
+            if tabela == "triagem" and _referenciada(cursor, nome):
+                continue
+            _guardar(cursor, tabela, nome)
+            arquivadas.append(nome)
+        for particao in listar(cursor, tabela):
+            if particao.pendente:
+                # DETACH CONCURRENTLY interrompido: termina antes de arquivar
+                cursor.execute(f"ALTER TABLE {tabela} DETACH PARTITION {particao.nome} FINALIZE")
+                _guardar(cursor, tabela, particao.nome)
+            elif particao.fim > corte:
+                continue
+            elif tabela == "triagem" and _referenciada(cursor, particao.nome):
+                # Entradas de fila do mês seguinte: espera a partição delas sair
+                logger.info("%s fica até as entradas de fila dela serem arquivadas", particao.nome)
+                continue
+            else:
+                _arquivar(cursor, particao)
+            arquivadas.append(particao.nome)
+    return arquivadas
+
+def manter(meses_futuros=MESES_FUTUROS, meses_retencao=MESES_RETENCAO, hoje=None):
+    """Cria as partições futuras e arquiva as antigas.
+
+    Retorna (criadas, arquivadas) com os nomes das partições, ou None se
+    outro processo já está fazendo a manutenção.
+    """
+    hoje = hoje or datetime.date.today()
+    corte = somar_meses(hoje, -meses_retencao) if meses_retencao else None
+    criadas, arquivadas = [], []
+    with banco.conexao_psycopg() as con:
+        con.autocommit = True
+        try:
+            with con.cursor() as cursor:
+                # Trava de sessão: a de transação acabaria no primeiro comando
+                cursor.execute("SELECT pg_try_advisory_lock(hashtext('particoes.manter'))")
+                if not cursor.fetchone()[0]:
+                    return None
+                try:
+                    for tabela in TABELAS:
+                        existentes = {particao.nome for particao in listar(cursor, tabela)}
+                        cursor.execute("SELECT criar_particoes_mensais(%s, %s, %s)",
+                                       (tabela, hoje, somar_meses(hoje, meses_futuros)))
+                        criadas.extend(nome for (nome,) in cursor.fetchall() if nome not in existentes)
+                    if corte is not None:
+                        arquivadas = _arquivar_antigas(cursor, corte)
+                finally:
+                    cursor.execute("SELECT pg_advisory_unlock(hashtext('particoes.manter'))")
+        finally:
+            con.autocommit = False
+    return criadas, arquivadas
+
+async def tarefa_manter():
+    """Tarefa agendada por servidor.py (pn.state.schedule_task)."""
+    try:
+        resultado = await em_thread(manter)
+        if resultado and any(resultado):
+            criadas, arquivadas = resultado
+            logger.info("Partições criadas: %s; arquivadas: %s", ", ".join(criadas) or "nenhuma",
+                        ", ".join(arquivadas) or "nenhuma")
+    except Exception:
+        logger.exception("Falha na manutenção das partições")
+
+def main():
+    parser = argparse.ArgumentParser(description="Cria as partições futuras e arquiva as antigas.")
+    parser.add_argument("--futuros", type=int, default=MESES_FUTUROS, help="meses à frente com partição pronta")
+    parser.add_argument("--retencao", type=int, default=MESES_RETENCAO,
+                        help="meses completos mantidos nas tabelas (0 = não arquiva)")
+    args = parser.parse_args()
+
+    resultado = manter(args.futuros, args.retencao)
+    if resultado is None:
+        print("Outro processo já está fazendo a manutenção das partições.")
+        return
+    criadas, arquivadas = resultado
+    print(f"Criadas: {', '.join(criadas) or 'nenhuma'}")
+    print(f"Arquivadas em {ESQUEMA_ARQUIVO}: {', '.join(arquivadas) or 'nenhuma'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import argparse
+import logging
+import pathlib
+
+import panel as pn
+from tornado.web import RequestHandler
+
+import agregados
+import estoque
+import exportacao
+import instrumentacao
+import particoes
+
+# Servidor único para todas as telas.
+#
+# Um só processo (ou N processos com --processos) serve triagem, pacientes,
+# consultas, estoque, o painel de gestão e o histórico do paciente como rotas do mesmo pn.serve.
+# Pool de conexões, tabelas, caches, fila e ouvinte são estado de módulo,
+# então todas as sessões de todas as telas do processo os compartilham. As
+# métricas da instrumentação ficam em /metricas e as exportações das
+# listagens em /exportar (exportacao.py), na mesma porta. As tarefas
+# periódicas são agendadas aqui, uma vez por processo.
+#
+# Uso: python servidor.py [--porta 5006] [--processos 4]
+
+PASTA = pathlib.Path(__file__).parent
+
+ROTAS = {
+    "triagem": "triagem.py",
+    "pacientes": "pacientes.py",
+    "consultas": "consultas.py",
+    "estoque": "gestaoestoque.py",
+    "painel": "painel_gestao.py",
+    "historico": "historico.py",
+}
+
+TITULOS = {
+    "triagem": "Triagem",
+    "pacientes": "Pacientes",
+    "consultas": "Consultas",
+    "estoque": "Estoque",
+    "painel": "Painel de Gestão",
+    "historico": "Histórico do Paciente",
+}
+
+class MetricasHandler(RequestHandler):
+    """GET /metricas: métricas da instrumentação do processo que atendeu."""
+
+    def get(self):
+        self.set_header("Content-Type", "application/json; charset=utf-8")
+        self.write(instrumentacao.corpo_metricas())
+
+def agendar_tarefas():
+    """Registra as tarefas periódicas no IOLoop do processo (depois do fork de --processos)."""
+    # Agregados do painel de gestão
+    pn.state.schedule_task("agregados", agregados.tarefa_atualizar, period=agregados.INTERVALO_ATUALIZACAO)
+    # Faixas de validade do estoque, ao subir e uma vez por dia
+    pn.state.schedule_task("resumo_validade", estoque.tarefa_validade, at=estoque.horarios_validade())
+    # Partições dos próximos meses e arquivamento das antigas
+    pn.state.schedule_task("particoes", particoes.tarefa_manter, period=particoes.INTERVALO_MANUTENCAO)
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve todas as telas num único servidor Panel.")
+    parser.add_argument("--porta", type=int, default=5006)
+    parser.add_argument("--endereco", default=None, help="endereço de escuta (padrão: todos)")
+    parser.add_argument("--processos", type=int, default=1, help="processos servindo a mesma porta (0 = um por CPU)")
+    parser.add_argument("--origem", nargs="*", default=None, help="origens aceitas no websocket (ex.: clinica.local:5006)")
+    parser.add_argument("--abrir", action="store_true", help="abre o navegador")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    # O endpoint de métricas é uma rota deste servidor, não uma porta à parte
+    instrumentacao.METRICAS_PORTA = 0
+
+    servidor = pn.serve(
+        {rota: str(PASTA / arquivo) for rota, arquivo in ROTAS.items()},
+        port=args.porta,
+        address=args.endereco,
+        websocket_origin=args.origem,
+        num_procs=args.processos,
+        title=TITULOS,
+        extra_patterns=[(r"/metricas", MetricasHandler), (exportacao.ROTA, exportacao.ExportacaoHandler)],
+        show=args.abrir,
+        start=False,
+    )
+    agendar_tarefas()
+    servidor.start()
+    servidor.io_loop.start()
+
+if __name__ == "__main__":
+    main()
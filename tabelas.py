@@ -0,0 +1,108 @@
+from sqlalchemy import (
+    Column, Date, ForeignKey, Integer, MetaData, PrimaryKeyConstraint, String, Table, Text, Time, inspect,
+)
+
+# Definição explícita das tabelas usadas pelo SQLAlchemy Core (consultas.py).
+#
+# Substitui a reflexão do esquema na inicialização: montar estes objetos não
+# toca no banco. Devem acompanhar esquema.sql e as migrações;
+# `divergencias()` compara as colunas com o banco (verificar_planos.py a
+# chama sobre um schema recém-criado).
+
+metadata = MetaData()
+
+paciente = Table(
+    "paciente", metadata,
+    Column("id_paciente", Integer, primary_key=True),
+    Column("nome", String(100), nullable=False),
+    Column("cpf", String(20), nullable=False, unique=True),
+    Column("rg", String(20), nullable=False, unique=True),
+    Column("data_nascimento", Date, nullable=False),
+    Column("endereco_rua", String(100), nullable=False),
+    Column("endereco_numero", String(10), nullable=False),
+    Column("endereco_complemento", String(50)),
+    Column("endereco_bairro", String(50), nullable=False),
+    Column("endereco_cidade", String(50), nullable=False),
+    Column("genero", String(30)),
+    # Incrementada a cada UPDATE pelo trigger da migração 011
+    Column("versao", Integer, nullable=False),
+)
+
+profissional = Table(
+    "profissional", metadata,
+    Column("id_profissional", Integer, primary_key=True),
+    Column("nome", String(100), nullable=False),
+    Column("cargo", String(50), nullable=False),
+    Column("cpf", String(20), nullable=False, unique=True),
+)
+
+medico = Table(
+    "medico", metadata,
+    Column("id_profissional", Integer, ForeignKey("profissional.id_profissional", ondelete="CASCADE"),
+           primary_key=True),
+    Column("crm", String(20), nullable=False, unique=True),
+)
+
+item_estoque = Table(
+    "item_estoque", metadata,
+    Column("id_itemestoque", Integer, primary_key=True),
+    Column("nome", String(100), nullable=False),
+    Column("data_fabricacao", Date),
+    Column("data_validade", Date, nullable=False),
+    Column("lote", String(50), nullable=False),
+    Column("fabricante", String(100)),
+)
+
+medicamento = Table(
+    "medicamento", metadata,
+    Column("id_medicamento", Integer, primary_key=True),
+    Column("id_itemestoque", Integer, ForeignKey("item_estoque.id_itemestoque", ondelete="RESTRICT"),
+           nullable=False, unique=True),
+)
+
+# Particionada por mês (migração 012): a data faz parte da chave primária, e
+# com chave composta o SQLAlchemy só trata o id como serial se for avisado
+consulta = Table(
+    "consulta", metadata,
+    Column("id_consulta", Integer, primary_key=True, autoincrement=True),
+    Column("data", Date, primary_key=True),
+    Column("hora_inicio", Time, nullable=False),
+    Column("hora_fim", Time),
+    Column("diagnostico", Text),
+    Column("id_paciente", Integer, ForeignKey("paciente.id_paciente"), nullable=False),
+    Column("id_medico", Integer, ForeignKey("medico.id_profissional"), nullable=False),
+    # Atestado não é usado pelas telas; a chave estrangeira fica só no banco
+    Column("id_atestado", Integer),
+    Column("versao", Integer, nullable=False),
+)
+
+prescricao = Table(
+    "prescricao", metadata,
+    # A referência à consulta (particionada) é verificada por trigger no banco, sem FOREIGN KEY
+    Column("id_consulta", Integer, nullable=False),
+    Column("id_medicamento", Integer, ForeignKey("medicamento.id_medicamento", ondelete="RESTRICT"),
+           nullable=False),
+    Column("dosagem", String(100), nullable=False),
+    Column("frequencia", String(100), nullable=False),
+    PrimaryKeyConstraint("id_consulta", "id_medicamento", name="pk_prescricao"),
+)
+
+def divergencias(engine, schema=None):
+    """Lista as diferenças de colunas entre estas definições e o banco (vazia se batem)."""
+    inspetor = inspect(engine)
+    problemas = []
+    for tabela in metadata.sorted_tables:
+        if not inspetor.has_table(tabela.name, schema=schema):
+            problemas.append(f"{tabela.name}: tabela não existe no banco")
+            continue
+        no_banco = {coluna["name"]: coluna for coluna in inspetor.get_columns(tabela.name, schema=schema)}
+        for coluna in tabela.columns:
+            existente = no_banco.pop(coluna.name, None)
+            if existente is None:
+                problemas.append(f"{tabela.name}.{coluna.name}: coluna não existe no banco")
+            elif existente["type"]._type_affinity is not coluna.type._type_affinity:
+                problemas.append(f"{tabela.name}.{coluna.name}: tipo {existente['type']} no banco, {coluna.type} aqui")
+            elif existente["nullable"] != coluna.nullable:
+                problemas.append(f"{tabela.name}.{coluna.name}: nulidade diferente do banco")
+        problemas.extend(f"{tabela.name}.{nome}: coluna do banco não declarada" for nome in no_banco)
+    return problemas
@@ -0,0 +1,52 @@
+import asyncio
+import contextvars
+import inspect
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+
+import banco
+import instrumentacao
+
+# Execução do trabalho de banco fora do event loop do servidor Panel.
+#
+# Os callbacks das telas são `async` e fazem `await em_thread(...)` para cada
+# acesso ao banco: a consulta roda numa thread do executor e o event loop
+# continua atendendo as outras sessões enquanto isso. O executor tem no
+# máximo tantas threads quanto conexões o pool pode abrir, então o excesso
+# espera na fila do executor em vez de estourar o timeout do pool.
+
+DB_THREADS = int(os.getenv("DB_THREADS") or banco.POOL_SIZE + banco.POOL_MAX_OVERFLOW)
+
+executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="banco")
+
+async def em_thread(funcao, *args, **kwargs):
+    """Roda `funcao(*args, **kwargs)` no executor e devolve o resultado.
+
+    O contexto (contextvars, incluindo o documento Panel da sessão) é copiado
+    para a thread, junto com o nome do callback que originou a chamada para a
+    instrumentação.
+    """
+    loop = asyncio.get_running_loop()
+    contexto = contextvars.copy_context()
+    if instrumentacao.callback_atual.get() is None:
+        contexto.run(instrumentacao.callback_atual.set, instrumentacao.callback_da_pilha(inspect.currentframe()))
+    return await loop.run_in_executor(executor, partial(contexto.run, funcao, *args, **kwargs))
+
+async def aguardar(resultado):
+    """Aguarda `resultado` se for awaitable (callbacks que podem ser sync ou async)."""
+    if inspect.isawaitable(resultado):
+        return await resultado
+    return resultado
+
+@contextmanager
+def carregando(*widgets):
+    """Mostra o indicador de carregamento nos widgets enquanto o bloco roda."""
+    for widget in widgets:
+        widget.loading = True
+    try:
+        yield
+    finally:
+        for widget in widgets:
+            widget.loading = False
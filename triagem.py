@@ -1,49 +1,65 @@
+import numpy as np
 import panel as pn
 import pandas as pd
 import psycopg2
-from sqlalchemy import create_engine
 from sqlalchemy.exc import SQLAlchemyError
 
-pn.extension('tabulator', notifications=True)
+import banco
+import cache
+import exportacao
+import filtros
+import grade
+import instrumentacao
+from fila import PRIORIDADES, obter_servico
+from ouvinte import ouvinte, RESSINCRONIZAR
+from tarefas import em_thread, carregando
 
-DB_USER = "postgres"
-DB_PASSWORD = "1307"
-DB_HOST = "localhost"
-DB_PORT = "5432"
-DB_NAME = "fbd-triagem-facilitada"
+pn.extension('tabulator', notifications=True)
 
-DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-db_connection = psycopg2.connect(f"dbname='{DB_NAME}' user='{DB_USER}' host='{DB_HOST}' password='{DB_PASSWORD}'")
-db_engine = create_engine(DATABASE_URL)
+instrumentacao.servir_metricas("triagem")
 
+# Os dicionários nome -> id vêm do cache compartilhado entre as sessões
 def carregar_pacientes():
     try:
-        query = "SELECT id_paciente, nome FROM paciente ORDER BY nome"
-        df = pd.read_sql(query, db_engine)
-        return {row['nome']: row['id_paciente'] for index, row in df.iterrows()}
+        return cache.pacientes()
     except SQLAlchemyError:
         return {}
 
 def carregar_profissionais():
     try:
-        query = "SELECT id_profissional, nome FROM profissional ORDER BY nome"
-        df = pd.read_sql(query, db_engine)
-        return {row['nome']: row['id_profissional'] for index, row in df.iterrows()}
+        return cache.profissionais()
     except SQLAlchemyError:
         return {}
 
-opcoes_pacientes = carregar_pacientes()
-opcoes_profissionais = carregar_profissionais()
-opcoes_prioridade = ['Vermelho (Emergência)', 'Amarelo (Urgente)', 'Verde (Não Urgente)', 'Azul (Eletivo)']
+# Preenchidos no onload (carregar_sessao), depois que a página é entregue
+opcoes_pacientes = {}
+opcoes_profissionais = {}
+opcoes_prioridade = PRIORIDADES
+# Serviço de fila do processo; a primeira sessão o carrega do banco no onload.
+# Os callbacks que rodam em thread usam obter_servico() e não dependem disso.
+fila = None
 
 
 filtro_prioridade_select = pn.widgets.Select(name="Filtrar por Prioridade", options=["Todas"] + opcoes_prioridade)
+# Abre nos meses recentes (só as partições recentes são lidas); limpar a data mostra todo o histórico
+filtro_data_inicio = pn.widgets.DatePicker(name="Data Inicial", value=filtros.inicio_recente())
+filtro_data_fim = pn.widgets.DatePicker(name="Data Final")
+ordem_select = pn.widgets.Select(name="Ordenar por Data", options={"Mais recentes": "DESC", "Mais antigas": "ASC"})
+tamanho_pagina_select = pn.widgets.Select(name="Linhas por Página", options=[25, 50, 100], value=50)
 id_remover_input = pn.widgets.TextInput(name="ID da Triagem para Remover")
 
 paciente_select = pn.widgets.Select(name="Paciente*", options=list(opcoes_pacientes.keys()))
 profissional_select = pn.widgets.Select(name="Profissional Responsável*", options=list(opcoes_profissionais.keys()))
 prioridade_select = pn.widgets.Select(name="Classificação de Prioridade*", options=opcoes_prioridade)
 descricao_input = pn.widgets.TextAreaInput(name="Descrição dos Sintomas", placeholder="Descreva os sintomas...", height=90)
+encaminhar_fila_checkbox = pn.widgets.Checkbox(name="Encaminhar para a fila de atendimento", value=True)
+tipo_consulta_input = pn.widgets.TextInput(name="Tipo de Consulta", placeholder="Ex.: Clínica Geral")
+
+fila_profissional_select = pn.widgets.Select(name="Profissional", options=list(opcoes_profissionais.keys()))
+button_chamar_proximo = pn.widgets.Button(name='Chamar Próximo', button_type='primary')
+chamada_atual = pn.pane.Markdown("")
+tabela_fila = pn.widgets.Tabulator(layout='fit_data', height=250, sortable=False, show_index=False,
+                                   formatters={"Entrada": grade.HORA})
 
 id_update_input = pn.widgets.TextInput(name="ID da Triagem para Atualizar*")
 novo_paciente_select = pn.widgets.Select(name="Novo Paciente", options=list(opcoes_pacientes.keys()))
@@ -52,97 +68,270 @@ nova_prioridade_select = pn.widgets.Select(name="Nova Prioridade", options=opcoe
 nova_descricao_input = pn.widgets.TextAreaInput(name="Nova Descrição", placeholder="Deixe vazio se não quiser alterar", height=90)
 
 button_consultar = pn.widgets.Button(name='Consultar')
+button_pagina_anterior = pn.widgets.Button(name='◀ Anterior', disabled=True)
+button_pagina_proxima = pn.widgets.Button(name='Próxima ▶', disabled=True)
+info_pagina = pn.pane.Markdown("")
 button_inserir = pn.widgets.Button(name='Inserir Triagem')
 button_remover = pn.widgets.Button(name='Remover por ID')
 button_atualizar = pn.widgets.Button(name='Atualizar Triagem')
 
-tabela_triagem = pn.widgets.Tabulator(layout='fit_data', height=600)
-
-def carregar_dados_triagem(event=None):
-    if not db_engine:
-        pn.state.notifications.error("Sem conexão com o banco de dados.")
-        return
+# A tabela recebe só a página visível; ordenação e filtros são feitos no banco
+tabela_triagem = pn.widgets.Tabulator(layout='fit_data', height=600, sortable=False,
+                                      formatters={"Data e Hora": grade.DATA_HORA}, hidden_columns=["Versão"])
 
-    query = """
-    SELECT 
-        t.id_triagem AS "ID", p.nome AS "Paciente", prof.nome AS "Profissional",
-        t.classificacao_de_prioridade AS "Prioridade", t.descricao AS "Descrição",
-        t.data AS "Data e Hora"
-    FROM triagem t
-    JOIN paciente p ON t.id_paciente = p.id_paciente
-    JOIN profissional prof ON t.id_profissional = prof.id_profissional
-    """
+# Colunas da grade, com a versão usada nas edições (oculta); {origem} é a
+# tabela triagem ou uma CTE com as linhas recém-gravadas
+SELECT_GRADE_TRIAGEM = filtros.SELECT_GRADE_TRIAGEM
 
-    filtros = []
-    if filtro_prioridade_select.value != "Todas":
-        filtros.append(f"t.classificacao_de_prioridade = '{filtro_prioridade_select.value}'")
+# Paginação por chave (keyset) em (data, id_triagem): cada página guarda o
+# cursor da sua primeira linha, e a próxima começa depois da última linha lida.
+cursores_pagina = [None]
+cursor_proxima_pagina = None
 
-    if filtros:
-        query += " WHERE " + " AND ".join(filtros)
-    query += " ORDER BY t.data DESC"
+def buscar_pagina_triagem(prioridade=None, data_inicio=None, data_fim=None, ordem="DESC", apos=None, limite=50):
+    """Busca uma página da listagem de triagens.
 
+    `apos` é o cursor (data, id_triagem) da última linha da página anterior.
+    Retorna a página e o cursor da próxima (None se esta for a última).
+    """
+    query, params = filtros.sql_pagina_triagens(prioridade, data_inicio, data_fim, ordem, apos, limite)
+    with banco.conexao() as conn:
+        df = grade.ler(conn, query, params)
+
+    proximo = None
+    if len(df) > limite:
+        df = df.iloc[:limite]
+        ultima = df.iloc[-1]
+        proximo = (ultima['Data e Hora'].to_pydatetime(), int(ultima['ID']))
+    return df, proximo
+
+async def carregar_dados_triagem(event=None):
+    global cursor_proxima_pagina
+    prioridade = filtro_prioridade_select.value
     try:
-        df = pd.read_sql_query(query, db_engine)
-        if not df.empty:
-            df['Data e Hora'] = pd.to_datetime(df['Data e Hora']).dt.strftime('%d/%m/%Y %H:%M')
+        with carregando(tabela_triagem, button_consultar, button_pagina_anterior, button_pagina_proxima):
+            df, cursor_proxima_pagina = await em_thread(
+                buscar_pagina_triagem,
+                prioridade=None if prioridade == "Todas" else prioridade,
+                data_inicio=filtro_data_inicio.value,
+                data_fim=filtro_data_fim.value,
+                ordem=ordem_select.value,
+                apos=cursores_pagina[-1],
+                limite=tamanho_pagina_select.value,
+            )
         tabela_triagem.value = df
     except SQLAlchemyError as e:
         pn.state.notifications.error(f"Erro ao consultar dados: {e}")
+        return
+
+    button_pagina_anterior.disabled = len(cursores_pagina) == 1
+    button_pagina_proxima.disabled = cursor_proxima_pagina is None
+    info_pagina.object = f"Página {len(cursores_pagina)}"
 
-def inserir(event):
+async def consultar(event=None):
+    # Mudança de filtro ou ordenação sempre volta para a primeira página
+    cursores_pagina[:] = [None]
+    await carregar_dados_triagem()
+
+async def pagina_proxima(event):
+    if cursor_proxima_pagina is None:
+        return
+    cursores_pagina.append(cursor_proxima_pagina)
+    await carregar_dados_triagem()
+
+async def pagina_anterior(event):
+    if len(cursores_pagina) == 1:
+        return
+    cursores_pagina.pop()
+    await carregar_dados_triagem()
+
+# --- Atualização incremental da grade ---
+# Depois de uma escrita só a linha afetada é lida (RETURNING) e aplicada à
+# página visível com patch/stream, sem recarregar a listagem.
+
+def _indice_na_grade(id_triagem):
+    df = tabela_triagem.value
+    if df is None or df.empty:
+        return None
+    indices = df.index[df["ID"] == id_triagem]
+    return indices[0] if len(indices) else None
+
+def _linha_visivel(linha):
+    """Diz se a triagem atende aos filtros da listagem atual."""
+    prioridade = filtro_prioridade_select.value
+    if prioridade != "Todas" and linha["Prioridade"] != prioridade:
+        return False
+    data = pd.Timestamp(linha["Data e Hora"]).date()
+    if filtro_data_inicio.value and data < filtro_data_inicio.value:
+        return False
+    if filtro_data_fim.value and data > filtro_data_fim.value:
+        return False
+    return True
+
+def remover_da_grade(id_triagem):
+    indice = _indice_na_grade(id_triagem)
+    if indice is not None:
+        tabela_triagem.value = tabela_triagem.value.drop(index=indice)
+
+def aplicar_na_grade(linha):
+    """Aplica à página visível uma triagem inserida ou alterada (DataFrame de uma linha)."""
+    id_triagem = int(linha["ID"].iloc[0])
+    if not _linha_visivel(linha.iloc[0]):
+        remover_da_grade(id_triagem)
+        return
+
+    indice = _indice_na_grade(id_triagem)
+    if indice is not None:
+        tabela_triagem.patch({coluna: [(indice, linha[coluna].iloc[0])] for coluna in linha.columns if coluna != "ID"})
+    elif len(cursores_pagina) == 1 and ordem_select.value == "DESC":
+        # Mais recentes primeiro: a triagem nova vai para o topo da primeira página.
+        # A página cresce uma linha até a próxima consulta, assim o cursor da
+        # próxima página continua válido.
+        tabela_triagem.value = pd.concat([linha, tabela_triagem.value], ignore_index=True)
+    elif cursor_proxima_pagina is None and ordem_select.value == "ASC":
+        # Mais antigas primeiro: só aparece se a última página estiver aberta
+        tabela_triagem.stream(linha)
+
+def buscar_linha_triagem(id_triagem):
+    query = SELECT_GRADE_TRIAGEM.format(origem="triagem") + " WHERE t.id_triagem = :id"
+    with banco.conexao() as conn:
+        return grade.ler(conn, query, {"id": id_triagem})
+
+async def on_triagem_alterada(evento):
+    """Aplica à grade as alterações feitas por outras mesas (LISTEN/NOTIFY)."""
+    operacao, id_triagem = evento.dados["operacao"], evento.dados["id"]
+    if operacao == RESSINCRONIZAR:
+        await carregar_dados_triagem()
+    elif operacao == "DELETE":
+        remover_da_grade(id_triagem)
+    elif operacao in ("INSERT", "UPDATE"):
+        # Uma única leitura por alteração, compartilhada entre todas as sessões
+        linha = await em_thread(evento.memo, "linha", lambda: buscar_linha_triagem(id_triagem))
+        if not linha.empty:
+            aplicar_na_grade(linha.copy())
+
+def gravar_triagem(valores, encaminhar, tipo_consulta):
+    """Insere a triagem (e, se pedido, a entrada na fila) numa transação."""
+    query = """
+    WITH alterada AS (
+        INSERT INTO triagem (id_paciente, id_profissional, classificacao_de_prioridade, descricao)
+        VALUES (%s, %s, %s, %s) RETURNING *
+    )""" + SELECT_GRADE_TRIAGEM.format(origem="alterada")
+    entrada = None
+    with banco.conexao_psycopg() as con, con.cursor() as cursor:
+        cursor.execute(query, valores)
+        linha = grade.de_cursor(cursor)
+        if encaminhar:
+            # Mesma transação: ou a triagem entra já na fila, ou nada é gravado
+            entrada = obter_servico().entrar(cursor, int(linha["ID"].iloc[0]), tipo_consulta)
+        con.commit()
+    if entrada:
+        obter_servico().adicionar(entrada)
+    return linha, entrada
+
+async def inserir(event):
     if not all([paciente_select.value, profissional_select.value, prioridade_select.value]):
         pn.state.notifications.warning("Preencha todos os campos obrigatórios (*).")
         return
 
-    cursor = None
     try:
-        cursor = db_connection.cursor()
         id_paciente = opcoes_pacientes[paciente_select.value]
         id_profissional = opcoes_profissionais[profissional_select.value]
-
-        query = "INSERT INTO triagem (id_paciente, id_profissional, classificacao_de_prioridade, descricao) VALUES (%s, %s, %s, %s);"
-        cursor.execute(query, (id_paciente, id_profissional, prioridade_select.value, descricao_input.value))
-
-        db_connection.commit()
+        valores = (id_paciente, id_profissional, prioridade_select.value, descricao_input.value)
+        with carregando(button_inserir):
+            linha, entrada = await em_thread(
+                gravar_triagem, valores, encaminhar_fila_checkbox.value, tipo_consulta_input.value or None)
+        aplicar_na_grade(linha)
+        if entrada:
+            atualizar_fila()
         pn.state.notifications.success("Nova triagem registrada!")
     except (Exception, psycopg2.Error) as e:
-        if db_connection: db_connection.rollback()
         pn.state.notifications.error(f"Erro ao inserir: {e}")
-    finally:
-        if cursor: cursor.close()
-        carregar_dados_triagem()
 
-def remover(event):
+def excluir_triagem(id_triagem):
+    """Remove a triagem e a sua entrada na fila (se houver). Retorna se existia."""
+    with banco.conexao_psycopg() as con, con.cursor() as cursor:
+        cursor.execute("""
+            WITH fila_removida AS (DELETE FROM fila WHERE id_triagem = %s)
+            DELETE FROM triagem WHERE id_triagem = %s RETURNING id_triagem;
+        """, (id_triagem, id_triagem))
+        removida = cursor.fetchone()
+        con.commit()
+    return removida is not None
+
+async def remover(event):
     if not id_remover_input.value:
         pn.state.notifications.warning("Digite o ID da triagem para remover.")
         return
 
-    cursor = None
     try:
-        cursor = db_connection.cursor()
         id_para_remover = int(id_remover_input.value)
-        cursor.execute("DELETE FROM triagem WHERE id_triagem = %s;", (id_para_remover,))
+        with carregando(button_remover):
+            removida = await em_thread(excluir_triagem, id_para_remover)
 
-        db_connection.commit()
-        if cursor.rowcount > 0:
+        if removida:
+            remover_da_grade(id_para_remover)
             pn.state.notifications.success(f"Triagem ID {id_para_remover} removida!")
         else:
             pn.state.notifications.warning(f"Triagem ID {id_para_remover} não encontrada.")
     except (Exception, psycopg2.Error) as e:
-        if db_connection: db_connection.rollback()
         pn.state.notifications.error(f"Erro ao remover: {e}")
-    finally:
-        if cursor: cursor.close()
-        carregar_dados_triagem()
 
-def atualizar(event):
+def regravar_triagem(query, valores, id_triagem):
+    """Executa o UPDATE condicional (WHERE versao = ...) e devolve a linha da grade.
+
+    Se a triagem mudou ou sumiu desde a leitura, levanta banco.ConflitoDeVersao.
+    """
+    with banco.conexao_psycopg() as con, con.cursor() as cursor:
+        cursor.execute(query, valores)
+        linha = grade.de_cursor(cursor)
+        if linha.empty:
+            cursor.execute("SELECT versao FROM triagem WHERE id_triagem = %s", (id_triagem,))
+            atual = cursor.fetchone()
+            raise banco.ConflitoDeVersao(f"a triagem {id_triagem}", atual[0] if atual else None)
+        con.commit()
+    return linha
+
+# Triagem em edição e a versão exibida na grade quando o ID foi informado (ou
+# lida do banco, se o ID não estava na página). Alterações de outras mesas que
+# chegam depois à grade não mudam essa versão.
+edicao = {"id": None, "versao": None}
+
+def capturar_versao(event=None):
+    edicao["id"] = edicao["versao"] = None
+    try:
+        edicao["id"] = int(id_update_input.value)
+    except ValueError:
+        return
+    indice = _indice_na_grade(edicao["id"])
+    if indice is not None:
+        edicao["versao"] = int(tabela_triagem.value.at[indice, "Versão"])
+
+def on_selecao_triagem(event):
+    """A linha selecionada na grade vai para o formulário de atualização."""
+    if event.new:
+        id_update_input.value = str(tabela_triagem.value["ID"].iloc[event.new[0]])
+
+async def mostrar_conflito(id_triagem, conflito):
+    """Traz a versão atual da triagem para a grade; atualizar de novo grava a partir dela."""
+    edicao["versao"] = conflito.versao_atual
+    if conflito.versao_atual is None:
+        remover_da_grade(id_triagem)
+        pn.state.notifications.error(str(conflito))
+        return
+    linha = await em_thread(buscar_linha_triagem, id_triagem)
+    if not linha.empty:
+        aplicar_na_grade(linha)
+    pn.state.notifications.error(
+        f"{conflito} A grade mostra os dados atuais: confira e clique em Atualizar de novo para gravar por cima.",
+        duration=0)
+
+async def atualizar(event):
     if not id_update_input.value:
         pn.state.notifications.warning("Digite o ID da triagem a ser atualizada.")
         return
 
-    cursor = None
     try:
-        cursor = db_connection.cursor()
         id_triagem = int(id_update_input.value)
         updates = []
         valores = []
@@ -166,38 +355,139 @@ def atualizar(event):
         if not updates:
             pn.state.notifications.warning("Nenhum campo de atualização foi preenchido.")
             return
-        query = f"UPDATE triagem SET {', '.join(updates)} WHERE id_triagem = %s"
-        valores.append(id_triagem)
-        cursor.execute(query, tuple(valores))
-        db_connection.commit()
+        if edicao["id"] != id_triagem or edicao["versao"] is None:
+            # Fora da página a versão não é conhecida: é lida agora, e a gravação
+            # só acontece no próximo clique, sobre os dados que o usuário viu
+            with carregando(button_atualizar):
+                atual = await em_thread(buscar_linha_triagem, id_triagem)
+            if atual.empty:
+                pn.state.notifications.warning(f"Triagem ID {id_triagem} não encontrada.")
+                return
+            linha = atual.iloc[0]
+            edicao.update(id=id_triagem, versao=int(linha["Versão"]))
+            pn.state.notifications.info(
+                f"Triagem ID {id_triagem} não estava na página. Dados atuais: {linha['Paciente']}, "
+                f"{linha['Prioridade']}, {linha['Descrição'] if pd.notna(linha['Descrição']) else 'sem descrição'}. "
+                "Confira e clique em Atualizar de novo para gravar.", duration=0)
+            return
 
-        if cursor.rowcount > 0:
-            pn.state.notifications.success(f"Triagem ID {id_triagem} atualizada com sucesso!")
-        else:
-            pn.state.notifications.warning(f"Triagem ID {id_triagem} não encontrada.")
+        # Só grava sobre a versão que o usuário viu
+        query = f"""
+        WITH alterada AS (
+            UPDATE triagem SET {', '.join(updates)} WHERE id_triagem = %s AND versao = %s RETURNING *
+        )""" + SELECT_GRADE_TRIAGEM.format(origem="alterada")
+        valores.extend([id_triagem, edicao["versao"]])
+        with carregando(button_atualizar):
+            linha = await em_thread(regravar_triagem, query, tuple(valores), id_triagem)
+
+        edicao["versao"] = int(linha["Versão"].iloc[0])
+        aplicar_na_grade(linha)
+        pn.state.notifications.success(f"Triagem ID {id_triagem} atualizada com sucesso!")
+    except banco.ConflitoDeVersao as conflito:
+        await mostrar_conflito(id_triagem, conflito)
     except Exception as e:
-        if db_connection: db_connection.rollback()
         pn.state.notifications.error(f"Erro ao atualizar: {e}")
-    finally:
-        if cursor: cursor.close()
-        carregar_dados_triagem()
 
-button_consultar.on_click(carregar_dados_triagem)
+# --- Fila de atendimento ---
+
+def atualizar_fila(event=None):
+    if fila is None:
+        return
+    id_profissional = opcoes_profissionais.get(fila_profissional_select.value)
+    entradas = fila.aguardando(id_profissional)
+    tabela_fila.value = pd.DataFrame({
+        "Paciente": [entrada.nome_paciente for entrada in entradas],
+        "Prioridade": [entrada.prioridade for entrada in entradas],
+        "Entrada": np.array([entrada.hora_entrada for entrada in entradas], dtype="datetime64[us]"),
+    })
+
+async def chamar_proximo(event):
+    id_profissional = opcoes_profissionais.get(fila_profissional_select.value)
+    if id_profissional is None:
+        pn.state.notifications.warning("Selecione o profissional.")
+        return
+
+    try:
+        with carregando(button_chamar_proximo):
+            entrada = await em_thread(lambda: obter_servico().chamar_proximo(id_profissional))
+    except (Exception, psycopg2.Error) as e:
+        pn.state.notifications.error(f"Erro ao chamar paciente: {e}")
+        return
+
+    if entrada:
+        chamada_atual.object = f"**Chamado:** {entrada.nome_paciente} ({entrada.prioridade})"
+    else:
+        chamada_atual.object = "Nenhum paciente aguardando."
+    atualizar_fila()
+
+# --- Listas de pacientes e profissionais ---
+
+async def atualizar_opcoes(event=None):
+    """Recarrega os selects a partir do cache (que só vai ao banco se foi invalidado)."""
+    global opcoes_pacientes, opcoes_profissionais
+    opcoes_pacientes = await em_thread(carregar_pacientes)
+    opcoes_profissionais = await em_thread(carregar_profissionais)
+    for select in (paciente_select, novo_paciente_select):
+        select.options = list(opcoes_pacientes.keys())
+    for select in (profissional_select, novo_profissional_select, fila_profissional_select):
+        select.options = list(opcoes_profissionais.keys())
+
+async def carregar_sessao():
+    """Carga inicial da sessão: listas dos selects e fila de atendimento."""
+    global fila
+    await atualizar_opcoes()
+    fila = await em_thread(obter_servico)
+    atualizar_fila()
+
+ouvinte.assinar_sessao("triagem_alterada", on_triagem_alterada)
+# O cache é invalidado pelo mesmo canal antes de a sessão recarregar os selects
+ouvinte.assinar_sessao("referencia_alterada", atualizar_opcoes)
+# O serviço de fila já se atualiza pelo mesmo canal; a sessão só redesenha a lista
+ouvinte.assinar_sessao("fila_alterada", lambda evento: atualizar_fila())
+
+# --- Exportação ---
+
+def atualizar_links_exportacao(event=None):
+    """Links de download da listagem inteira com os filtros atuais (exportacao.py)."""
+    prioridade = filtro_prioridade_select.value
+    valores = dict(prioridade=None if prioridade == "Todas" else prioridade, inicio=filtro_data_inicio.value,
+                   fim=filtro_data_fim.value, ordem=ordem_select.value)
+    links_exportacao.object = "Exportar: " + " · ".join(
+        f"[{formato.upper()}]({exportacao.url('triagem', formato, **valores)})" for formato in ("csv", "parquet")
+    )
+
+links_exportacao = pn.pane.Markdown("")
+for widget in (filtro_prioridade_select, filtro_data_inicio, filtro_data_fim, ordem_select):
+    widget.param.watch(atualizar_links_exportacao, 'value')
+atualizar_links_exportacao()
+
+button_consultar.on_click(consultar)
+button_pagina_anterior.on_click(pagina_anterior)
+button_pagina_proxima.on_click(pagina_proxima)
 button_inserir.on_click(inserir)
 button_remover.on_click(remover)
 button_atualizar.on_click(atualizar)
+button_chamar_proximo.on_click(chamar_proximo)
+fila_profissional_select.param.watch(atualizar_fila, 'value')
+id_update_input.param.watch(capturar_versao, 'value')
+tabela_triagem.param.watch(on_selecao_triagem, 'selection')
 
 painel_controle = pn.Column(
     "## CRUD de Triagem",
     "### Consultar Registros",
     filtro_prioridade_select,
+    pn.Row(filtro_data_inicio, filtro_data_fim),
+    pn.Row(ordem_select, tamanho_pagina_select),
     button_consultar,
+    links_exportacao,
     pn.layout.Divider(),
     "### Adicionar Nova Triagem",
     paciente_select,
     profissional_select,
     prioridade_select,
     descricao_input,
+    encaminhar_fila_checkbox,
+    tipo_consulta_input,
     button_inserir,
     pn.layout.Divider(),
     "### Remover Triagem",
@@ -218,12 +508,20 @@ layout = pn.Row(
     painel_controle,
     pn.Column(
         tabela_triagem,
+        pn.Row(button_pagina_anterior, info_pagina, button_pagina_proxima),
+        pn.layout.Divider(),
+        "### Fila de Atendimento",
+        pn.Row(fila_profissional_select, button_chamar_proximo),
+        chamada_atual,
+        tabela_fila,
         sizing_mode='stretch_width'
     )
 )
 
-carregar_dados_triagem()
+pn.state.onload(carregar_sessao)
+pn.state.onload(carregar_dados_triagem)
 layout.servable()
 
 if __name__ == "__main__":
-    pn.serve(layout, port=5007, show=True)
\ No newline at end of file
+    pn.serve(layout, port=5007, show=True,
+             extra_patterns=[(exportacao.ROTA, exportacao.ExportacaoHandler)])
\ No newline at end of file
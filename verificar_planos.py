@@ -0,0 +1,174 @@
+import argparse
+import datetime
+import json
+import re
+import sys
+
+import agregados
+import banco
+import estoque
+import fila
+import filtros
+import gerador_dados
+import linha_do_tempo
+import tabelas
+
+# Verificação de regressão dos planos de consulta.
+#
+# Cria um schema temporário com esquema.sql + migrações, carrega uma massa de
+# dados sintética (gerador_dados.py) e roda EXPLAIN nas consultas das telas, falhando se alguma
+# delas voltar a fazer varredura sequencial nas tabelas grandes.
+#
+# Uso: python verificar_planos.py [--pacientes N] [--manter]
+
+SCHEMA = "verificacao_planos"
+
+VARREDURAS_POR_INDICE = {"Index Scan", "Index Only Scan", "Bitmap Index Scan"}
+
+# Partições mensais (migração 012) aparecem no plano como <tabela>_AAAA_MM
+_PARTICAO = re.compile(r"_\d{4}_\d{2}$")
+
+def _pyformat(sql):
+    """Troca os :parametros do SQLAlchemy pelos %(parametros)s do psycopg2."""
+    return re.sub(r"(?<![:\w]):(\w+)", r"%(\1)s", sql)
+
+def _triagem(nome, **filtro):
+    sql, params = filtros.sql_pagina_triagens(**filtro)
+    return (f"triagem.buscar_pagina_triagem ({nome})", _pyformat(sql), params, "triagem")
+
+def _consultas(nome, **filtro):
+    compilada = filtros.consultas(com_versao=True, **filtro).compile(dialect=banco.engine.dialect)
+    return (f"consultas.carregar_consultas ({nome})", str(compilada), compilada.params, "consulta")
+
+# Consultas das telas, montadas pelas mesmas funções que os apps usam.
+# Cada entrada: (nome, sql, parâmetros, tabela que precisa ser lida por índice)
+CONSULTAS = [
+    _triagem("primeira página"),
+    _triagem("prioridade + cursor", prioridade="Vermelho (Emergência)",
+             apos=(datetime.datetime(2025, 6, 1), 1000000)),
+    _triagem("intervalo de datas", data_inicio=datetime.date(2024, 3, 1), data_fim=datetime.date(2024, 3, 1),
+             ordem="ASC"),
+    _triagem("meses recentes, padrão da tela", data_inicio=filtros.inicio_recente(gerador_dados.DATA_BASE)),
+    _consultas("filtro por paciente", id_paciente=42),
+    _consultas("filtro por médico e data", id_medico=1,
+               data_inicio=datetime.date(2024, 5, 10), data_fim=datetime.date(2024, 5, 10)),
+    _consultas("filtro por data", data_inicio=datetime.date(2024, 5, 10), data_fim=datetime.date(2024, 5, 10)),
+    _consultas("meses recentes, padrão da tela", data_inicio=filtros.inicio_recente(gerador_dados.DATA_BASE)),
+    (
+        "gestaoestoque.atualizar_tabela (busca por nome)",
+        _pyformat(estoque.sql_itens("cilina 424")[0]),
+        estoque.sql_itens("cilina 424")[1],
+        "item_estoque",
+    ),
+    ("estoque.dispensar (lotes FEFO do produto)", estoque.LOTES_FEFO, (7,), "saldo_estoque"),
+    (
+        "busca.buscar_pacientes (nome)",
+        """
+        SELECT id_paciente, nome, cpf FROM paciente
+        WHERE nome ILIKE %(padrao)s
+        ORDER BY nome <-> %(termo)s
+        LIMIT 20
+        """,
+        {"padrao": "%Marina Rocha%", "termo": "Marina Rocha"},
+        "paciente",
+    ),
+    (
+        "busca.buscar_pacientes (prefixo do CPF)",
+        """
+        SELECT id_paciente, nome, cpf FROM paciente
+        WHERE regexp_replace(cpf, '\\D', '', 'g') LIKE %(prefixo)s
+        ORDER BY regexp_replace(cpf, '\\D', '', 'g') LIMIT 20
+        """,
+        {"prefixo": "0000012%"},
+        "paciente",
+    ),
+    ("fila.FilaPrioridade.carregar (entradas aguardando)", fila.SELECT_ENTRADAS, (), "fila"),
+    (
+        "agregados.atualizar (espera na janela recente)",
+        agregados.AGREGADOS["espera_dia"].select.format(filtro="c.data >= %(corte)s"),
+        {"corte": "2025-07-30"},
+        "fila",
+    ),
+]
+
+# A linha do tempo é um UNION ALL com um ramo por tipo de evento; cada ramo
+# tem de ler a sua tabela pelo índice do paciente
+for _evento in linha_do_tempo.EVENTOS:
+    CONSULTAS.append((
+        f"linha_do_tempo.linha_do_tempo ({_evento.tipo}, com cursor)",
+        _pyformat(linha_do_tempo.sql_pagina(com_cursor=True, tipos={_evento.tipo})),
+        {"id_paciente": 42, "limite": 51, "cursor_momento": "2025-06-01", "cursor_ordem": 9,
+         "cursor_id": 1000000, "cursor_sub": 0},
+        _evento.origem.split()[0],
+    ))
+
+def varreduras(plano, ignorar=frozenset()):
+    """Percorre a árvore do EXPLAIN (FORMAT JSON) devolvendo (tipo do nó, tabela).
+
+    Uma partição conta como a sua tabela; as relações em `ignorar` ficam de fora.
+    """
+    pilha = [plano]
+    while pilha:
+        no = pilha.pop()
+        relacao = no.get("Relation Name", "").lower()
+        if relacao and relacao not in ignorar:
+            yield no["Node Type"], _PARTICAO.sub("", relacao)
+        pilha.extend(no.get("Plans", []))
+
+def particoes_vazias(cursor):
+    """Partições sem linhas (meses futuros): ler uma delas sem índice não custa nada."""
+    cursor.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = current_schema() AND c.reltuples <= 0
+    """)
+    return frozenset(nome for (nome,) in cursor.fetchall())
+
+def verificar(cursor):
+    falhas = []
+    vazias = particoes_vazias(cursor)
+    for nome, sql, params, tabela in CONSULTAS:
+        cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        resultado = cursor.fetchone()[0]
+        if isinstance(resultado, str):
+            resultado = json.loads(resultado)
+        nos = [tipo for tipo, relacao in varreduras(resultado[0]["Plan"], vazias) if relacao == tabela]
+        ok = bool(nos) and "Seq Scan" not in nos and any(tipo in VARREDURAS_POR_INDICE for tipo in nos)
+        print(f"{'OK   ' if ok else 'FALHA'} {nome}: {', '.join(nos) or 'tabela não lida'}")
+        if not ok:
+            falhas.append(nome)
+    return falhas
+
+def main():
+    parser = argparse.ArgumentParser(description="Verifica se as consultas das telas usam índices.")
+    parser.add_argument("--pacientes", type=int, default=50000, help="escala do gerador_dados (pacientes sintéticos)")
+    parser.add_argument("--manter", action="store_true", help=f"não remove o schema {SCHEMA} ao terminar")
+    args = parser.parse_args()
+
+    with banco.conexao_psycopg() as con:
+        try:
+            gerador_dados.preparar_schema(con, SCHEMA, recriar=True)
+            gerador_dados.gerar(con, SCHEMA, args.pacientes)
+            with con.cursor() as cursor:
+                falhas = verificar(cursor)
+            # As tabelas declaradas em tabelas.py têm de bater com o esquema + migrações
+            for problema in tabelas.divergencias(banco.engine, schema=SCHEMA):
+                print(f"FALHA tabelas.py: {problema}")
+                falhas.append(problema)
+        finally:
+            con.rollback()
+            with con.cursor() as cursor:
+                if not args.manter:
+                    cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+                cursor.execute("RESET search_path")
+            con.commit()
+
+    if falhas:
+        print(f"\n{len(falhas)} falha(s): varredura sequencial ou tabelas.py desatualizado.")
+        sys.exit(1)
+    print("\nTodas as consultas usam índices.")
+
+if __name__ == "__main__":
+    main()